@@ -0,0 +1,28 @@
+import re
+
+# التشكيل (الفتحة، الضمة، الكسرة، التنوين، الشدة، السكون...) والألف الخنجرية
+_DIACRITICS = re.compile("[ً-ٰٟ]")
+_TATWEEL = "ـ"
+_LETTERS = str.maketrans({
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ٱ": "ا",
+    "ة": "ه",
+    "ى": "ي",
+})
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_arabic(text: str):
+    """المفتاح الموحد لاسم منطقة أو كلمة بحث.
+
+    يحذف التشكيل والتطويل، يوحد أشكال الألف، التاء المربوطة مع الهاء والألف
+    المقصورة مع الياء، ويختصر المسافات. يُستخدم نفسه عند الكتابة وعند البحث،
+    لذلك "أبو رمانة" و"ابو رمانه" و"أبو رُمّانة" لها نفس المفتاح.
+    """
+    if not text:
+        return ""
+    text = _DIACRITICS.sub("", text).replace(_TATWEEL, "")
+    text = text.translate(_LETTERS)
+    return _SPACES.sub(" ", text).strip().lower()
@@ -0,0 +1,149 @@
+import asyncio
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import query_profiler
+
+
+class CallLatency:
+    """زمن كل استدعاء لقاعدة البيانات: العدد والمجموع والأقصى، وآخر 256 قيمة للنسب المئوية."""
+
+    def __init__(self, samples: int = 256):
+        self._lock = threading.Lock()
+        self._samples = samples
+        self._calls = {}
+
+    def record(self, name: str, wait: float, run: float):
+        with self._lock:
+            entry = self._calls.get(name)
+            if entry is None:
+                entry = {"count": 0, "errors": 0, "total": 0.0, "max": 0.0, "wait": 0.0,
+                         "recent": deque(maxlen=self._samples)}
+                self._calls[name] = entry
+            entry["count"] += 1
+            entry["total"] += wait + run
+            entry["wait"] += wait
+            entry["max"] = max(entry["max"], wait + run)
+            entry["recent"].append(wait + run)
+
+    def record_error(self, name: str):
+        with self._lock:
+            if name in self._calls:
+                self._calls[name]["errors"] += 1
+
+    def stats(self):
+        """لكل دالة: count وerrors وavg_ms وp95_ms وmax_ms وqueue_ms (متوسط الانتظار قبل التنفيذ)."""
+        result = {}
+        with self._lock:
+            for name, entry in self._calls.items():
+                recent = sorted(entry["recent"])
+                result[name] = {
+                    "count": entry["count"],
+                    "errors": entry["errors"],
+                    "avg_ms": round(entry["total"] / entry["count"] * 1000, 2),
+                    "p95_ms": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 2),
+                    "max_ms": round(entry["max"] * 1000, 2),
+                    "queue_ms": round(entry["wait"] / entry["count"] * 1000, 2),
+                }
+        return result
+
+
+class AsyncDB:
+    """واجهة asyncio لطبقة قاعدة البيانات (DatabaseManager أو وحدة db_android).
+
+    كل دالة في target تصبح coroutine تُنفذ في خيوط عمل مخصصة لقاعدة البيانات،
+    فلا يتوقف خيط واجهة Flet أثناء استعلام بطيء أو انتظار قفل:
+        cities = await db_async.get_cities()
+    كل خيط عمل يحتفظ باتصاله من مجمع الاتصالات.
+    """
+
+    def __init__(self, target, workers: int = 2):
+        self._target = target
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        self.latency = CallLatency()
+
+    def __getattr__(self, name):
+        func = getattr(self._target, name)
+        if not callable(func):
+            return func
+
+        async def call(*args, **kwargs):
+            return await self.run(name, func, *args, **kwargs)
+
+        call.__name__ = name
+        return call
+
+    async def run(self, name: str, func, *args, **kwargs):
+        """تنفيذ func(*args, **kwargs) في خيط عمل وتسجيل زمنه تحت الاسم name.
+
+        إلغاء المهمة المنتظرة لا يوقف الاستعلام الجاري في خيط العمل، لكن نتيجته تُهمل.
+        """
+        submitted = time.perf_counter()
+        started = []
+        caller = query_profiler.caller_name(2)
+
+        def job():
+            started.append(time.perf_counter())
+            query_profiler.set_caller(caller)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                query_profiler.set_caller(None)
+
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, job)
+        except Exception:
+            self.latency.record_error(name)
+            raise
+        finally:
+            if started:
+                self.latency.record(name, started[0] - submitted, time.perf_counter() - started[0])
+
+    def stats(self):
+        return self.latency.stats()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+class LatestOnly:
+    """إلغاء الطلب السابق لنفس المفتاح عند بدء طلب جديد.
+
+    مثلاً عند تغيير المدينة مرتين بسرعة، يُلغى معالج التغيير الأول ولا يرسم
+    نتائج قديمة فوق نتائج المدينة الجديدة:
+
+        latest = LatestOnly()
+
+        @latest("listing")
+        async def on_city_change(e):
+            ...
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    def claim(self, key):
+        current = asyncio.current_task()
+        previous = self._tasks.get(key)
+        if previous is not None and previous is not current and not previous.done():
+            previous.cancel()
+        self._tasks[key] = current
+
+    def __call__(self, key):
+        def decorate(handler):
+            @functools.wraps(handler)
+            async def run(*args, **kwargs):
+                self.claim(key)
+                try:
+                    return await handler(*args, **kwargs)
+                except asyncio.CancelledError:
+                    # أُلغي لصالح طلب أحدث؛ لا شيء لعرضه. أي إلغاء آخر يُمرر كما هو
+                    if self._tasks.get(key) is asyncio.current_task():
+                        raise
+                    return None
+            return run
+        return decorate
@@ -0,0 +1,1354 @@
+"""قياسات أداء طبقة قاعدة البيانات.
+
+الاستخدام:
+    python benchmarks.py            # تشغيل جميع القياسات
+    python benchmarks.py connections
+    python benchmarks.py suite --json results.json   # كل الدوال بعدة أحجام، نتائج JSON
+    python benchmarks.py compare old.json new.json   # مقارنة نتائج suite بين نسختين
+"""
+import asyncio
+import csv
+import gc
+import gzip
+import http.server
+import itertools
+import json
+import os
+import random
+import sys
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+import urllib.error
+import urllib.request
+
+import db_android
+from db_pool import get_pool
+from repository import Repository, Listing, SearchResult, MIGRATIONS
+from migrations import run_migrations, get_schema_version
+from query_plans import StatementRecorder, add_trace_callback, audit, remove_trace_callback
+import text_search
+import geo
+import map_clusters
+import listing_search
+import facets
+import saved_searches
+import change_log
+import sync
+import tile_cache
+import bulk_import
+import export
+import synthetic_data
+from listing_rules import DAMASCUS_ACTIVE_AREAS
+from async_db import AsyncDB, LatestOnly
+from arabic import normalize_arabic
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def use_temp_android_db():
+    """توجيه db_android إلى ملف مؤقت جديد وتهيئته."""
+    tmp_dir = tempfile.mkdtemp(prefix="citymover_bench_")
+    db_android.DB_FILE = os.path.join(tmp_dir, "bench.db")
+    db_android.init_db()
+    return db_android.DB_FILE
+
+
+def seed_owner_properties(owner_id: int, count: int):
+    cities = db_android.get_cities()
+    for i in range(count):
+        city = cities[i % len(cities)]
+        db_android.add_property(
+            owner_id, city["id"], f"منطقة {i % 7}", f"منزل {i}", "وصف",
+            100000 + i, 33.5 + i * 1e-4, 36.3 + i * 1e-4, "مدرسة، مواصلات",
+        )
+
+
+def render_owner_screen_n_plus_one(owner_id: int):
+    """استعلامات شاشة المالك قبل الدمج: get_city_by_id لكل عقار."""
+    db_android.get_cities()
+    for p in db_android.get_properties_by_owner(owner_id):
+        db_android.get_city_by_id(p["city_id"])
+
+
+def render_owner_screen(owner_id: int):
+    """استعلامات شاشة المالك كما في owner_view.load_owner_properties."""
+    db_android.get_cities()
+    return [p["city_name"] for p in db_android.get_properties_by_owner(owner_id)]
+
+
+class QueryCounter:
+    """عدّ الاستعلامات المنفذة على اتصال الخيط الحالي عبر set_trace_callback."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.count = 0
+
+    def _trace(self, statement):
+        self.count += 1
+
+    def __enter__(self):
+        add_trace_callback(self.conn, self._trace)
+        return self
+
+    def __exit__(self, *exc):
+        remove_trace_callback(self.conn, self._trace)
+
+
+@benchmark("connections")
+def bench_connections(listings: int = 50, repeats: int = 20):
+    db_file = use_temp_android_db()
+    owner = db_android.get_user_by_credentials("owner1", "123456")
+    seed_owner_properties(owner["id"], listings)
+
+    pool = get_pool(db_file)
+    before_checkouts, before_connects = pool.checkouts, pool.connects
+    render_owner_screen_n_plus_one(owner["id"])
+    checkouts = pool.checkouts - before_checkouts
+    connects = pool.connects - before_connects
+    print(f"[connections] شاشة المالك ({listings} عقار): "
+          f"قبل = {checkouts} اتصال، بعد = {connects} اتصال جديد "
+          f"(إجمالي الاتصالات المفتوحة: {pool.connects})")
+
+    # زمن نفس الاستعلامات مع اتصال جديد لكل استدعاء (السلوك القديم)
+    start = time.perf_counter()
+    for _ in range(repeats * checkouts):
+        conn = sqlite3.connect(db_file)
+        conn.execute("SELECT id, name FROM cities WHERE id=?", (1,)).fetchone()
+        conn.close()
+    unpooled = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeats * checkouts):
+        conn = db_android.get_connection()
+        conn.execute("SELECT id, name FROM cities WHERE id=?", (1,)).fetchone()
+    pooled = time.perf_counter() - start
+
+    print(f"[connections] {repeats * checkouts} استعلام: "
+          f"بدون مجمع {unpooled * 1000:.1f}ms، مع المجمع {pooled * 1000:.1f}ms")
+
+
+@benchmark("owner_list")
+def bench_owner_list(sizes=(10, 100, 1000)):
+    for size in sizes:
+        use_temp_android_db()
+        owner = db_android.get_user_by_credentials("owner1", "123456")
+        seed_owner_properties(owner["id"], size)
+        conn = db_android.get_connection()
+
+        for label, render in (("N+1", render_owner_screen_n_plus_one),
+                              ("JOIN", render_owner_screen)):
+            with QueryCounter(conn) as counter:
+                start = time.perf_counter()
+                render(owner["id"])
+                elapsed = time.perf_counter() - start
+            print(f"[owner_list] {size} عقار، {label}: "
+                  f"{counter.count} استعلام، {elapsed * 1000:.2f}ms")
+
+
+def seed_area_listings(owner_id: int, city_id: int, area: str, count: int):
+    conn = db_android.get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO properties (owner_id, city_id, area, area_key, title, rent, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, datetime('2024-01-01', ? || ' seconds'))",
+            ((owner_id, city_id, area, normalize_arabic(area), f"منزل {i}", 100000 + i, str(i // 3))
+             for i in range(count)),
+        )
+    db_android.get_cache().invalidate()
+
+
+@benchmark("pagination")
+def bench_pagination(sizes=(100, 10000, 100000), page_size: int = 20):
+    for size in sizes:
+        use_temp_android_db()
+        owner = db_android.get_user_by_credentials("owner1", "123456")
+        seed_area_listings(owner["id"], 1, "المزة", size)
+
+        start = time.perf_counter()
+        everything = db_android.get_properties_by_city_and_area(1, "المزة")
+        full = time.perf_counter() - start
+
+        start = time.perf_counter()
+        first = db_android.get_properties_by_city_and_area(1, "المزة", limit=page_size)
+        first_page = time.perf_counter() - start
+
+        # آخر صفحة: keyset يبدأ من موقع الفهرس مباشرة دون تخطي الصفوف السابقة
+        cursor = (everything[-page_size - 1]["created_at"], everything[-page_size - 1]["id"])
+        start = time.perf_counter()
+        db_android.get_properties_by_city_and_area(1, "المزة", limit=page_size, after=cursor)
+        last_page = time.perf_counter() - start
+
+        print(f"[pagination] {size} عقار: كل النتائج {full * 1000:.2f}ms، "
+              f"الصفحة الأولى {first_page * 1000:.2f}ms ({len(first)} صف)، "
+              f"الصفحة الأخيرة {last_page * 1000:.2f}ms")
+
+
+TITLE_WORDS = ["شقة", "منزل", "بيت", "استوديو", "فيلا", "غرفة"]
+DESCRIPTION_WORDS = ["واسعة", "مفروشة", "مشمسة", "حديثة", "هادئة", "إطلالة", "طابق", "أول",
+                     "ثاني", "شرفة", "مطبخ", "حمامين", "تدفئة", "تكييف", "قريبة", "السوق"]
+SERVICE_WORDS = ["مدرسة", "مولدة", "مواصلات", "مستشفى", "صيدلية", "فرن", "جامع", "حديقة"]
+
+
+def text_listing_row(rnd, owner_id: int, cities: list):
+    area = f"منطقة {rnd.randrange(40)}"
+    return (
+        owner_id, rnd.choice(cities), area, normalize_arabic(area),
+        f"{rnd.choice(TITLE_WORDS)} {rnd.choice(DESCRIPTION_WORDS)}",
+        " ".join(rnd.choices(DESCRIPTION_WORDS, k=12)) + f" قرب شارع{rnd.randrange(5000)}",
+        rnd.randrange(50000, 1000000, 5000),
+        "، ".join(rnd.sample(SERVICE_WORDS, 3)),
+    )
+
+
+def seed_text_listings(owner_id: int, count: int, seed: int = 42):
+    rnd = random.Random(seed)
+    cities = [c["id"] for c in db_android.get_cities()]
+    conn = db_android.get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO properties (owner_id, city_id, area, area_key, title, description, rent, services) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (text_listing_row(rnd, owner_id, cities) for _ in range(count)),
+        )
+    db_android.get_cache().invalidate()
+
+
+@benchmark("fts")
+def bench_fts(count: int = 100000, repeats: int = 20):
+    use_temp_android_db()
+    owner = db_android.get_user_by_credentials("owner1", "123456")
+    start = time.perf_counter()
+    seed_text_listings(owner["id"], count)
+    print(f"[fts] إدخال {count} عقار مع مشغلات FTS: {time.perf_counter() - start:.2f}s")
+
+    conn = db_android.get_connection()
+    like_count_sql = ("SELECT COUNT(*) FROM properties WHERE "
+                      + " OR ".join(f"{c} LIKE ?" for c in text_search.FTS_COLUMNS))
+    for text in ("شارع1234", "مولدة", "شقة مفروشة"):
+        def timed(func):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                result = func()
+            return (time.perf_counter() - start) / repeats * 1000, result
+
+        like_ms, like_rows = timed(lambda: text_search._search_like(conn, text, None, 50))
+        fts_ms, fts_rows = timed(lambda: db_android.search_properties_text(text))
+        # عدّ كل المطابقات: LIKE يمسح الجدول كاملاً مهما كان عدد النتائج
+        word = text.split()[0]
+        like_count_ms, like_count = timed(lambda: conn.execute(
+            like_count_sql, [f"%{word}%"] * len(text_search.FTS_COLUMNS)).fetchone()[0])
+        fts_count_ms, fts_count = timed(lambda: conn.execute(
+            "SELECT COUNT(*) FROM properties_fts WHERE properties_fts MATCH ?",
+            (text_search.build_match_query(word),)).fetchone()[0])
+
+        print(f"[fts] \"{text}\": أول 50 — LIKE {like_ms:.2f}ms ({len(like_rows)})، "
+              f"FTS5 مرتبة {fts_ms:.2f}ms ({len(fts_rows)}) | "
+              f"عدّ \"{word}\" — LIKE {like_count_ms:.2f}ms ({like_count})، "
+              f"FTS5 {fts_count_ms:.2f}ms ({fts_count})")
+
+
+def seed_located_listings(owner_id: int, count: int, seed: int = 7):
+    """عقارات بإحداثيات عشوائية داخل سوريا تقريباً، مع تركّز حول دمشق."""
+    rnd = random.Random(seed)
+    conn = db_android.get_connection()
+
+    def rows():
+        for i in range(count):
+            if rnd.random() < 0.3:
+                lat, lon = rnd.gauss(33.51, 0.05), rnd.gauss(36.28, 0.05)
+            else:
+                lat, lon = rnd.uniform(32.3, 37.3), rnd.uniform(35.7, 42.4)
+            yield (owner_id, 1, "المزة", "المزه", f"منزل {i}", 100000 + i % 900000, lat, lon)
+
+    with conn:
+        conn.executemany(
+            "INSERT INTO properties (owner_id, city_id, area, area_key, title, rent, lat, lon) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows(),
+        )
+
+
+@benchmark("bbox")
+def bench_bbox(count: int = 1000000, repeats: int = 20):
+    use_temp_android_db()
+    owner = db_android.get_user_by_credentials("owner1", "123456")
+    start = time.perf_counter()
+    seed_located_listings(owner["id"], count)
+    print(f"[bbox] إدخال {count} عقار: {time.perf_counter() - start:.1f}s")
+
+    conn = db_android.get_connection()
+    # دمشق (كثيفة) بعدة مستويات تكبير، ومنطقة قليلة العقارات حيث يضطر المسح لقراءة كل الجدول
+    viewports = [("دمشق", 33.5138, 36.2765, 11), ("دمشق", 33.5138, 36.2765, 14),
+                 ("دمشق", 33.5138, 36.2765, 16), ("البادية", 34.55, 38.28, 16)]
+    for label, lat, lon, zoom in viewports:
+        bbox = geo.viewport_bbox(lat, lon, zoom, 400, 250)
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            rows = db_android.properties_in_bbox(*bbox, limit=200)
+        rtree = (time.perf_counter() - start) / repeats
+
+        min_lat, min_lon, max_lat, max_lon = bbox
+        start = time.perf_counter()
+        for _ in range(repeats):
+            scan = conn.execute(
+                "SELECT id FROM properties WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ? LIMIT 200",
+                (min_lat, max_lat, min_lon, max_lon),
+            ).fetchall()
+        full = (time.perf_counter() - start) / repeats
+
+        print(f"[bbox] {label} تكبير {zoom}: R*Tree {rtree * 1000:.2f}ms ({len(rows)} علامة)، "
+              f"مسح كامل {full * 1000:.2f}ms ({len(scan)})")
+
+
+@benchmark("knn")
+def bench_knn(sizes=(10000, 100000, 1000000), k: int = 10, repeats: int = 10):
+    points = [("دمشق", 33.5138, 36.2765), ("البادية", 34.55, 38.28)]
+    for size in sizes:
+        use_temp_android_db()
+        owner = db_android.get_user_by_credentials("owner1", "123456")
+        seed_located_listings(owner["id"], size)
+        conn = db_android.get_connection()
+
+        for label, lat, lon in points:
+            start = time.perf_counter()
+            for _ in range(repeats):
+                nearest = db_android.nearest_properties(lat, lon, k=k)
+            indexed = (time.perf_counter() - start) / repeats
+
+            # الطريقة البسيطة: قراءة كل الإحداثيات وحساب المسافة لكل صف في Python
+            start = time.perf_counter()
+            rows = conn.execute("SELECT id, lat, lon FROM properties WHERE lat IS NOT NULL").fetchall()
+            dist = geo.haversine_km
+            naive = sorted(rows, key=lambda r: dist(lat, lon, [r[1]], [r[2]])[0])[:k]
+            brute = time.perf_counter() - start
+
+            same = [p["id"] for p in nearest] == [r[0] for r in naive]
+            print(f"[knn] {size} عقار، {label}: فهرس مكاني + ترتيب {indexed * 1000:.2f}ms، "
+                  f"حلقة على كل الصفوف {brute * 1000:.0f}ms، نفس النتيجة: {same} "
+                  f"(numpy: {geo.np is not None})")
+
+
+@benchmark("clusters")
+def bench_clusters(sizes=(10000, 100000, 1000000)):
+    for size in sizes:
+        use_temp_android_db()
+        owner = db_android.get_user_by_credentials("owner1", "123456")
+        start = time.perf_counter()
+        seed_located_listings(owner["id"], size)
+        print(f"[clusters] إدخال {size} عقار (مع تحديث التجمعات بالمشغلات): "
+              f"{time.perf_counter() - start:.1f}s")
+
+        for zoom in (7, 11, 14, 17):
+            bbox = geo.viewport_bbox(33.5138, 36.2765, zoom, 400, 250)
+            start = time.perf_counter()
+            items = db_android.clusters_in_bbox(*bbox, zoom=zoom)
+            elapsed = time.perf_counter() - start
+            covered = sum(item["count"] for item in items)
+            print(f"[clusters] {size} عقار، تكبير {zoom}: {len(items)} علامة تمثل {covered} عقار، "
+                  f"{elapsed * 1000:.2f}ms")
+
+        # تعديل إحداثيات عقار واحد يحدّث خلية واحدة في كل مستوى
+        start = time.perf_counter()
+        db_android.update_property(1, lat=33.52, lon=36.29)
+        print(f"[clusters] تعديل إحداثيات عقار: {(time.perf_counter() - start) * 1000:.2f}ms")
+
+
+async def measure_loop_stall(handlers, tick: float = 0.005):
+    """أطول توقف لحلقة asyncio (خيط الواجهة) أثناء تنفيذ المعالجات واحداً بعد الآخر."""
+    stall = {"max": 0.0}
+    running = True
+
+    async def ticker():
+        last = time.perf_counter()
+        while running:
+            await asyncio.sleep(tick)
+            now = time.perf_counter()
+            stall["max"] = max(stall["max"], now - last - tick)
+            last = now
+
+    task = asyncio.ensure_future(ticker())
+    await asyncio.sleep(tick * 2)
+    for handler in handlers:
+        await handler()
+    running = False
+    await task
+    return stall["max"]
+
+
+@benchmark("async")
+def bench_async(count: int = 100000, repeats: int = 10):
+    use_temp_android_db()
+    owner = db_android.get_user_by_credentials("owner1", "123456")
+    seed_text_listings(owner["id"], count)
+    db_async = AsyncDB(db_android)
+
+    # بحث بالمنطقة بنمط LIKE يمسح الجدول: استعلام بطيء عمداً
+    async def direct():
+        db_android.search_properties(area="ز")
+
+    async def offloaded():
+        await db_async.search_properties(area="ز")
+
+    sync_stall = asyncio.run(measure_loop_stall([direct] * repeats))
+    async_stall = asyncio.run(measure_loop_stall([offloaded] * repeats))
+    print(f"[async] أطول توقف لخيط الواجهة: مباشر {sync_stall * 1000:.1f}ms، "
+          f"عبر AsyncDB {async_stall * 1000:.1f}ms")
+
+    # تغيير المدينة 5 مرات بسرعة: فقط آخر طلب يصل إلى مرحلة العرض
+    latest = LatestOnly()
+    rendered = []
+
+    @latest("listing")
+    async def on_city_change(city_id):
+        props = await db_async.get_properties_by_city(city_id)
+        rendered.append((city_id, len(props)))
+
+    async def switch_cities():
+        await asyncio.gather(*(on_city_change(c) for c in (1, 2, 3, 4, 5)))
+
+    asyncio.run(switch_cities())
+    print(f"[async] 5 تغييرات متتالية للمدينة، عُرض منها: {rendered}")
+    for name, entry in db_async.stats().items():
+        print(f"[async] {name}: {entry}")
+    db_async.shutdown()
+    return 0 if [c for c, _ in rendered] == [5] else 1
+
+
+class _StubTileHandler(http.server.BaseHTTPRequestHandler):
+    """مصدر بلاطات محلي بديل عن tile.openstreetmap.org للقياس (بدون إنترنت)."""
+
+    def do_GET(self):
+        self.server.requests += 1
+        time.sleep(self.server.latency)
+        body = (b"\x89PNG" + self.path.encode()).ljust(self.server.tile_bytes, b"\0")
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_upstream(tile_bytes: int = 8000, latency: float = 0.02):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _StubTileHandler)
+    server.requests = 0
+    server.tile_bytes = tile_bytes
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/{{z}}/{{x}}/{{y}}.png"
+
+
+def fetch_tiles(url_template: str, tiles):
+    start = time.perf_counter()
+    for z, x, y in tiles:
+        with urllib.request.urlopen(url_template.format(z=z, x=x, y=y)) as response:
+            response.read()
+    return (time.perf_counter() - start) / max(len(tiles), 1)
+
+
+@benchmark("tiles")
+def bench_tiles(max_mb: int = 2):
+    upstream, upstream_url = start_stub_upstream()
+    tmp_dir = tempfile.mkdtemp(prefix="citymover_bench_")
+    cache = tile_cache.TileCache(os.path.join(tmp_dir, "tiles.mbtiles"), upstream_url,
+                                 max_bytes=max_mb * 1024 * 1024)
+    server = tile_cache.TileServer(cache).start()
+
+    # شاشة خريطة دمشق عند تكبير 13: أول فتح يجلب من المصدر، والثاني من الملف
+    screen = list(tile_cache.tiles_in_bbox(*geo.viewport_bbox(33.5138, 36.2765, 13, 400, 250), [13]))
+    cold = fetch_tiles(server.url_template, screen)
+    warm = fetch_tiles(server.url_template, screen)
+    print(f"[tiles] شاشة من {len(screen)} بلاطة: أول مرة {cold * 1000:.1f}ms/بلاطة، "
+          f"من الملف {warm * 1000:.1f}ms/بلاطة")
+
+    start = time.perf_counter()
+    result = cache.prefetch(*geo.bbox_around(33.5138, 36.2765, 10), range(10, 15))
+    print(f"[tiles] تحميل مسبق لدمشق (تكبير 10-14): {result} في {time.perf_counter() - start:.1f}s")
+
+    before = upstream.requests
+    fetch_tiles(server.url_template, screen)
+    stats = cache.stats()
+    print(f"[tiles] طلبات للمصدر بعد التحميل المسبق: {upstream.requests - before}، "
+          f"نسبة الإصابة {stats['hit_ratio']}")
+
+    # تجاوز الحد: حلب كاملة تدفع بلاطات دمشق الأقدم للخروج
+    cache.prefetch(*geo.bbox_around(36.2021, 37.1343, 15), range(10, 15))
+    stats = cache.stats()
+    server.stop()
+    upstream.shutdown()
+    print(f"[tiles] بعد تحميل حلب: {stats['tiles']} بلاطة، {stats['bytes'] / 1024 / 1024:.2f}MB "
+          f"من {max_mb}MB، حذف {stats['evictions']} بلاطة")
+    return 1 if stats["bytes"] > stats["max_bytes"] else 0
+
+
+@benchmark("statements")
+def bench_statements(repeats: int = 5000):
+    """إعادة استخدام الاستعلامات المحضرة: نصوص SQL الثابتة في repository مقابل تحليل كل استدعاء."""
+    db_file = use_temp_android_db()
+    owner = db_android.get_user_by_credentials("owner1", "123456")
+    seed_owner_properties(owner["id"], 50)
+    for cached in (0, 128):
+        repo = Repository(db_file)
+        conn = sqlite3.connect(db_file, cached_statements=cached)
+        repo.get_connection = lambda conn=conn: conn
+        start = time.perf_counter()
+        for i in range(repeats):
+            repo.get_user_by_id(1 + i % 2)
+            repo.get_property_by_id(1 + i % 50)
+        elapsed = time.perf_counter() - start
+        conn.close()
+        print(f"[statements] cached_statements={cached}: {elapsed / (repeats * 2) * 1e6:.1f}µs لكل استعلام")
+
+
+def measure_allocations(load):
+    """(النتيجة، الذاكرة المحجوزة بعد التحميل، ذروة الذاكرة، عدد الكتل المحجوزة) لـ load()."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    result = load()
+    current, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(s.count_diff for s in after.compare_to(before, "filename"))
+    return result, current, peak, blocks
+
+
+@benchmark("records")
+def bench_records(count: int = 100000):
+    use_temp_android_db()
+    owner = db_android.get_user_by_credentials("owner1", "123456")
+    city_id = db_android.get_cities()[0]["id"]
+    seed_area_listings(owner["id"], city_id, "المزة", count)
+    repo = db_android.current_repository()
+    conn = repo.get_connection()
+
+    def as_dicts():
+        # الشكل السابق: قاموس جديد بعشرة مفاتيح لكل صف
+        rows = conn.execute("""
+            SELECT p.id, p.title, p.area, p.description, p.rent, p.lat, p.lon, p.services,
+                   u.username, u.id, p.created_at
+            FROM properties p
+            JOIN users u ON p.owner_id = u.id
+            WHERE p.city_id = ?
+            ORDER BY p.created_at DESC
+        """, (city_id,))
+        return [dict(zip(Listing._fields, r)) for r in rows]
+
+    for name, load in (("dict", as_dicts), ("Record", lambda: repo.get_properties_by_city(city_id))):
+        start = time.perf_counter()
+        load()
+        elapsed = time.perf_counter() - start
+        result, current, peak, blocks = measure_allocations(load)
+        print(f"[records] {len(result)} صف كـ {name}: {elapsed * 1000:.0f}ms، "
+              f"محجوز {current / 1024 / 1024:.1f}MB، ذروة {peak / 1024 / 1024:.1f}MB، {blocks} كتلة")
+        del result
+
+
+def write_import_file(path: str, count: int, seed: int = 11):
+    """ملف CSV للاستيراد: مدن ومناطق متنوعة، ونحو 1% صفوف مرفوضة (منطقة غير مفعلة في دمشق أو إيجار غير رقمي)."""
+    rnd = random.Random(seed)
+    cities = [c["name"] for c in db_android.get_cities()]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["city", "area", "title", "description", "rent", "lat", "lon", "services"])
+        for i in range(count):
+            city = rnd.choice(cities)
+            area = rnd.choice(DAMASCUS_ACTIVE_AREAS) if city == "دمشق" else f"منطقة {rnd.randrange(40)}"
+            rent = rnd.randrange(50000, 1000000, 5000)
+            if rnd.random() < 0.005:
+                area = "القصاع" if city == "دمشق" else area
+                rent = "غير محدد" if city != "دمشق" else rent
+            writer.writerow([
+                city, area, f"{rnd.choice(TITLE_WORDS)} {rnd.choice(DESCRIPTION_WORDS)}",
+                " ".join(rnd.choices(DESCRIPTION_WORDS, k=8)), rent,
+                f"{rnd.uniform(32.3, 37.3):.5f}", f"{rnd.uniform(35.7, 42.4):.5f}",
+                "، ".join(rnd.sample(SERVICE_WORDS, 3)),
+            ])
+
+
+# عمليات البحث المحفوظة أثناء قياس الاستيراد: كل عقار مستورد يُطابق معها
+IMPORT_SAVED_SEARCHES = 1000
+
+
+def add_saved_searches(count: int, seed: int = 13):
+    """عمليات بحث محفوظة لمستخدم واحد على مناطق write_import_file، بمجالات إيجار وخدمات متنوعة."""
+    rnd = random.Random(seed)
+    user = db_android.get_user_by_credentials("user1", "123456")
+    cities = db_android.get_cities()
+    for _ in range(count):
+        city = rnd.choice(cities)
+        area = rnd.choice(DAMASCUS_ACTIVE_AREAS) if city["name"] == "دمشق" else f"منطقة {rnd.randrange(40)}"
+        db_android.save_search(
+            user["id"], city["id"], area if rnd.random() < 0.8 else None,
+            rnd.choice([None, 100000, 300000]), rnd.choice([None, 500000, 800000]),
+            rnd.sample(SERVICE_WORDS, rnd.choice([0, 1, 2])), rnd.random() < 0.2,
+        )
+
+
+@benchmark("import")
+def bench_import(count: int = 1000000, compare: int = 100000):
+    db_path = use_temp_android_db()
+    csv_path = os.path.join(os.path.dirname(db_path), "listings.csv")
+    write_import_file(csv_path, count)
+
+    # المقارنة: أول compare صف بإدخال عادي تعمل فيه المشغلات لكل صف
+    rows = bulk_import.read_rows(csv_path)
+    chunk = [next(rows) for _ in range(compare)]
+    rows.close()
+    valid, _ = bulk_import._validate_chunk(chunk, bulk_import._Resolver(db_android.current_repository(), "owner1"))
+    conn = db_android.get_connection()
+    start = time.perf_counter()
+    with conn:
+        conn.executemany(
+            "INSERT INTO properties (owner_id, city_id, area, area_key, title, description, rent, lat, lon, services) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((o, c, a, normalize_arabic(a), t, d, r, la, lo, sv) for o, c, a, t, d, r, la, lo, sv in valid),
+        )
+    per_row = (time.perf_counter() - start) / len(valid)
+    print(f"[import] مع المشغلات لكل صف: {len(valid)} صف في {per_row * len(valid):.1f}s "
+          f"(≈{per_row * count:.0f}s لـ {count} صف)")
+
+    db_path = use_temp_android_db()
+    add_saved_searches(IMPORT_SAVED_SEARCHES)
+    report = bulk_import.import_listings(db_path, csv_path, owner="owner1")
+    notified = db_android.get_connection().execute("SELECT COUNT(*) FROM notifications").fetchone()[0]
+    print(f"[import] {report['read']} صف في {report['seconds']:.1f}s ({report['rows_per_sec']} صف/ث)، "
+          f"أُضيف {report['inserted']}، رُفض {report['rejected']}، "
+          f"{notified} تنبيه لـ {IMPORT_SAVED_SEARCHES} بحث محفوظ")
+
+    # الفهارس المحدثة بعد كل دفعة تطابق الجدول، والمشغلات عادت كما كانت
+    conn = db_android.get_connection()
+    located = conn.execute("SELECT COUNT(*) FROM properties WHERE lat IS NOT NULL").fetchone()[0]
+    counts = {
+        "fts": conn.execute("SELECT COUNT(*) FROM properties_fts").fetchone()[0],
+        "rtree": conn.execute("SELECT COUNT(*) FROM properties_rtree").fetchone()[0],
+        "clusters": conn.execute(
+            "SELECT SUM(count) FROM map_clusters WHERE zoom = ?", (map_clusters.MIN_CLUSTER_ZOOM,)
+        ).fetchone()[0],
+    }
+    triggers = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+    missing = {text_search.INSERT_TRIGGER, geo.INSERT_TRIGGER, map_clusters.INSERT_TRIGGER,
+               facets.INSERT_TRIGGER, saved_searches.INSERT_TRIGGER, change_log.PROPERTIES_INSERT_TRIGGER,
+               change_log.PROPERTIES_UID_TRIGGER} - triggers
+    total = conn.execute("SELECT COUNT(*) FROM properties").fetchone()[0]
+    logged = conn.execute("SELECT COUNT(*) FROM change_log WHERE tbl = 'properties'").fetchone()[0]
+    print(f"[import] عقارات بإحداثيات {located}، فهارس {counts}، في سجل التغييرات {logged} من {total}، "
+          f"مشغلات ناقصة {sorted(missing)}")
+    return bool(missing) or logged != total or any(c != located for c in counts.values())
+
+
+def sync_snapshot(repo):
+    """محتوى الجداول المتزامنة بالمفاتيح المشتركة (لا بالـ id المحلي)، لمقارنة جهازين."""
+    conn = repo.get_connection()
+    return (
+        sorted(conn.execute("SELECT username, role FROM users WHERE id IN (SELECT owner_id FROM properties)")),
+        sorted(conn.execute(
+            "SELECT p.sync_uid, u.username, c.name, p.area_key, p.title, p.rent, p.lat, p.services_mask "
+            "FROM properties p JOIN users u ON u.id = p.owner_id JOIN cities c ON c.id = p.city_id"
+        )),
+        sorted(conn.execute(
+            "SELECT i.sync_uid, p.sync_uid, i.image_path FROM property_images i "
+            "JOIN properties p ON p.id = i.property_id"
+        )),
+    )
+
+
+def post_status(url: str, body: bytes, headers: dict, token: str):
+    """رمز الحالة لطلب POST خام (بدون SyncClient)."""
+    request = urllib.request.Request(url, data=body, headers=dict(headers, Authorization=f"Bearer {token}"))
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+@benchmark("sync")
+def bench_sync(count: int = 100000, edits: int = 1000, batch_size: int = change_log.DEFAULT_BATCH_SIZE):
+    """جهازان لنفس المالك وخادم مزامنة محلي: نقل count عقار كاملة، ثم تعديلات متقاطعة من الجهازين."""
+    tmp_dir = tempfile.mkdtemp(prefix="citymover_bench_")
+    server = sync.SyncServer(os.path.join(tmp_dir, "server.db")).start()
+    # الحسابات يملكها الخادم؛ كل جهاز مسجل لحساب المالك
+    owner = f"owner_{SUITE_SEED}_0"
+    server.repo.create_user(owner, synthetic_data.DEMO_PASSWORD, "owner")
+    devices = []
+    for name in ("a", "b"):
+        repo = Repository(os.path.join(tmp_dir, f"{name}.db"))
+        repo.init_db()
+        devices.append((repo, sync.SyncClient(repo, server.url, server.repo.register_sync_device(owner),
+                                              batch_size)))
+    (a, client_a), (b, client_b) = devices
+    synthetic_data.generate(a, count, owners=1, seed=SUITE_SEED)
+    with a.get_connection() as conn:
+        conn.execute("INSERT INTO property_images (property_id, image_path) "
+                     "SELECT id, 'images/' || id || '.jpg' FROM properties WHERE id % 10 = 0")
+
+    for label, client in (("إرسال", client_a), ("استقبال", client_b)):
+        start = time.perf_counter()
+        result = client.sync()
+        seconds = time.perf_counter() - start
+        moved = result["pushed"] + result["pulled"]
+        wire = result["bytes"]["sent"] + result["bytes"]["received"]
+        raw = result["bytes"]["sent_raw"] + result["bytes"]["received_raw"]
+        print(f"[sync] {label} أولي: {moved} تغيير في {seconds:.1f}s ({moved / seconds:.0f} تغيير/ث)، "
+              f"{wire / 1024 / 1024:.1f}MB مضغوط من {raw / 1024 / 1024:.1f}MB (×{raw / max(wire, 1):.1f})")
+
+    # تعديلات من الجهازين على نفس العقارات: آخر من يرسل هو الباقي
+    rnd = random.Random(SUITE_SEED)
+    ids = [row[0] for row in b.get_connection().execute("SELECT id FROM properties")]
+    for prop_id in rnd.sample(ids, edits):
+        b.update_property(prop_id, rent=rnd.randrange(100000, 900000))
+    ids = [row[0] for row in a.get_connection().execute("SELECT id FROM properties")]
+    for prop_id in rnd.sample(ids, edits):
+        a.update_property(prop_id, rent=rnd.randrange(100000, 900000), services="مدرسة، مصعد")
+    a_owner = a.get_connection().execute("SELECT id, owner_id FROM properties LIMIT ?", (edits // 10,)).fetchall()
+    for prop_id, owner_id in a_owner:
+        a.delete_property(prop_id, owner_id)
+
+    start = time.perf_counter()
+    rounds = [client.sync() for client in (client_a, client_b, client_a)]
+    seconds = time.perf_counter() - start
+    wire = sum(r["bytes"]["sent"] + r["bytes"]["received"] for r in rounds)
+    print(f"[sync] تعديلات ({2 * edits} تعديل و{len(a_owner)} حذف): "
+          f"{[(r['pushed'], r['pulled']) for r in rounds]} (أُرسل، وصل) في {seconds * 1000:.0f}ms، "
+          f"{wire / 1024:.0f}KB")
+
+    idle = [client.sync() for client in (client_a, client_b)]
+    converged = sync_snapshot(a) == sync_snapshot(b)
+    echoed = sum(r["pushed"] + r["pulled"] for r in idle)
+    print(f"[sync] الجهازان متطابقان: {converged}، تغييرات في مزامنة بدون تعديل: {echoed}")
+
+    # إعادة حساب القناع بعد مرادف جديد (retag_properties) لا تُسجل في السجل ولا تُنبّه البحث المحفوظ
+    with a.get_connection() as conn:
+        conn.execute("UPDATE properties SET services = 'تكييف', services_mask = 0 WHERE id IN "
+                     "(SELECT id FROM properties ORDER BY id LIMIT 100)")
+    owner_id = a.get_user_by_username(owner)["id"]
+    city_id = a.get_connection().execute("SELECT city_id FROM properties ORDER BY id LIMIT 1").fetchone()[0]
+    a.save_search(owner_id, city_id, services=["مصعد"])
+    logged, notified = a.get_connection().execute(
+        "SELECT (SELECT MAX(seq) FROM change_log), (SELECT COUNT(*) FROM notifications)").fetchone()
+    a.add_service("مصعد", ("تكييف",))
+    retag_quiet = (logged, notified) == a.get_connection().execute(
+        "SELECT (SELECT MAX(seq) FROM change_log), (SELECT COUNT(*) FROM notifications)").fetchone()
+    print(f"[sync] إعادة حساب القناع بدون تسجيل أو تنبيه: {retag_quiet}")
+
+    # بدون رمز صالح: 401؛ جهاز حساب آخر لا يحذف عقارات المالك؛ كلمة المرور لا تصل إلى b
+    try:
+        sync.SyncClient(b, server.url, "bad-token").pull()
+        rejected = False
+    except urllib.error.HTTPError as e:
+        rejected = e.code == 401
+    other = sync.SyncClient(b, server.url, server.repo.register_sync_device("owner1"))
+    uid = b.get_connection().execute("SELECT sync_uid FROM properties LIMIT 1").fetchone()[0]
+    denied = other._request("/push", {"changes": [
+        {"table": "properties", "op": "delete", "key": uid, "row": None},
+        {"table": "users", "op": "upsert", "key": owner, "row": {"username": owner, "role": "admin"}},
+    ]})
+    kept = server.repo.get_connection().execute(
+        "SELECT COUNT(*) FROM properties WHERE sync_uid = ?", (uid,)).fetchone()[0]
+    no_password = b.get_user_by_credentials(owner, synthetic_data.DEMO_PASSWORD) is None
+    # دفعة كبيرة (مسار الإدخال بدون مشغلات) يتكرر فيها عقار جديد: تعديل ثم حذف بعد إدخاله
+    fresh = []
+    for change in a.changes_since(0, 1000)["changes"]:
+        if change["table"] == "properties" and len(fresh) < 120:
+            uid = change_log.new_uid()
+            fresh.append(dict(change, key=uid, row=dict(change["row"], uid=uid)))
+    fresh.append(dict(fresh[0], row=dict(fresh[0]["row"], title="تعديل")))
+    fresh.append({"table": "properties", "op": "delete", "key": fresh[1]["key"], "row": None})
+    repeated = client_a._request("/push", {"changes": fresh})
+    server_conn = server.repo.get_connection()
+    server_conn.execute("INSERT INTO properties_fts(properties_fts) VALUES ('integrity-check')")
+    indexed = server_conn.execute(
+        "SELECT (SELECT COUNT(*) FROM properties WHERE lat IS NOT NULL), (SELECT COUNT(*) FROM properties_rtree), "
+        "(SELECT SUM(count) FROM map_clusters WHERE zoom = ?)", (map_clusters.MIN_CLUSTER_ZOOM,)).fetchone()
+    consistent = repeated == {"applied": len(fresh), "skipped": 0} and len(set(indexed)) == 1
+    print(f"[sync] دفعة بمفتاح مكرر: {repeated}، عقارات بإحداثيات/R*Tree/تجمعات {indexed}")
+
+    # جسم مضغوط صغير ينفك إلى أكثر من الحد، وطول معلن أكبر من الحد: 413 بدون فك كامل أو قراءة
+    bomb = gzip.compress(b" " * (sync.MAX_BODY_BYTES + 1024))
+    statuses = [post_status(server.url + "/push", bomb, {"Content-Encoding": "gzip"}, other.token),
+                post_status(server.url + "/push", b"{}", {"Content-Length": str(sync.MAX_BODY_BYTES + 1)},
+                            other.token)]
+    server.stop()
+    secure = (rejected and denied == {"applied": 0, "skipped": 2} and kept == 1 and no_password
+              and statuses == [413, 413] and retag_quiet and consistent)
+    print(f"[sync] بدون رمز مرفوض: {rejected}، تغييرات حساب آخر: {denied}، "
+          f"كلمة المرور لم تصل إلى الجهاز الآخر: {no_password}، "
+          f"جسم ضخم ({len(bomb) // 1024}KB مضغوط) وطول أكبر من الحد: {statuses}")
+    return 0 if converged and not echoed and secure else 1
+
+
+@benchmark("export")
+def bench_export(sizes=(100000, 500000)):
+    for size in sizes:
+        use_temp_android_db()
+        repo = db_android.current_repository()
+        owner = db_android.get_user_by_credentials("owner1", "123456")
+        rnd = random.Random(5)
+        cities = [c["id"] for c in db_android.get_cities()]
+        repo.add_properties_bulk(
+            (owner["id"], rnd.choice(cities), f"منطقة {i % 40}", f"منزل {i}",
+             " ".join(rnd.choices(DESCRIPTION_WORDS, k=12)), 100000 + i % 900000, None, None, "مدرسة")
+            for i in range(size)
+        )
+        out_dir = tempfile.mkdtemp(prefix="citymover_export_")
+
+        def fetch_all():
+            # الطريقة المباشرة: كل النتيجة في قائمة ثم الكتابة
+            records = repo.search_properties()
+            return export.export_records(records, SearchResult._fields, "csv",
+                                         os.path.join(out_dir, "all.csv"))
+
+        def streamed():
+            return export.export_search(repo.db_path, "csv", os.path.join(out_dir, "stream.csv"))
+
+        for name, run in (("fetchall", fetch_all), ("stream", streamed)):
+            start = time.perf_counter()
+            count, current, peak, _ = measure_allocations(run)
+            print(f"[export] {count} صف CSV ({name}): {time.perf_counter() - start:.1f}s، "
+                  f"ذروة الذاكرة {peak / 1024 / 1024:.1f}MB")
+
+
+@benchmark("profiling")
+def bench_profiling(count: int = 100000, repeats: int = 5000):
+    use_temp_android_db()
+    repo = db_android.current_repository()
+    synthetic_data.generate(repo, count, seed=SUITE_SEED)
+    prop_id = repo.search_properties_text("شقة", limit=1)[0]["id"]
+
+    def per_call():
+        start = time.perf_counter()
+        for _ in range(repeats):
+            repo.get_property_by_id(prop_id)
+        return (time.perf_counter() - start) / repeats * 1e6
+
+    before = per_call()
+    repo.enable_profiling(slow_ms=20, log=lambda line: None)
+    enabled = per_call()
+    # تتبع آخر على نفس الاتصال (تدقيق الخطط) يبقى يعمل أثناء الاستدعاءات المقاسة وبعدها
+    with StatementRecorder(repo.get_connection()) as recorder:
+        repo.get_property_by_id(prop_id)
+        repo.get_connection().execute("SELECT 1").fetchone()
+    chained = len(recorder.statements) >= 2 and recorder.statements[-1] == "SELECT 1"
+    # استدعاءات بطيئة حقيقية: بحث بمنطقة جزئية يمسح فهرس المدينة
+    repo.search_properties(area="الم")
+    db_async = AsyncDB(repo)
+
+    async def on_search_submit():
+        # كمعالج في الواجهة: المستدعي يظهر باسم المعالج رغم التنفيذ في خيط عمل
+        return await db_async.search_properties(min_rent=2900000)
+
+    asyncio.run(on_search_submit())
+    db_async.shutdown()
+    report = repo.check_db_status()["profiling"]
+    repo.disable_profiling()
+    after = per_call()
+
+    print(f"[profiling] get_property_by_id: معطل {before:.1f}µs، مفعل {enabled:.1f}µs، "
+          f"بعد التعطيل {after:.1f}µs")
+    for slow in report["slow_calls"]:
+        print(f"[profiling] بطيء: {slow['function']} من {slow['caller']} {slow['ms']}ms "
+              f"{slow['rows']} صف — {slow['statements'][0]['plan']}")
+    print(f"[profiling] أكثر الاستعلامات كلفة: {report['top_statements'][0]['sql'][:120]}")
+    print(f"[profiling] تتبع StatementRecorder مع القياس: {chained}")
+    return 0 if chained else 1
+
+
+def _find_control(root, predicate):
+    stack = [root]
+    while stack:
+        control = stack.pop()
+        if control is None:
+            continue
+        if predicate(control):
+            return control
+        stack.extend(control._get_children())
+    return None
+
+
+def _stub_flet_connection():
+    """اتصال Flet بديل بدون عميل: يعطي أرقاماً للعناصر الجديدة ولا يرسل شيئاً."""
+    from flet.core.connection import Connection
+    from flet.core.protocol import PageCommandResponsePayload, PageCommandsBatchResponsePayload
+
+    class StubConnection(Connection):
+        def __init__(self):
+            super().__init__()
+            self.page_url = "http://localhost"
+            self._next_id = 0
+
+        def send_command(self, session_id, command):
+            return PageCommandResponsePayload(result="", error="")
+
+        def send_commands(self, session_id, commands):
+            results = []
+            for command in commands:
+                if command.name == "add":
+                    ids = []
+                    for _ in command.commands:
+                        self._next_id += 1
+                        ids.append(f"_{self._next_id}")
+                    results.append(" ".join(ids))
+            return PageCommandsBatchResponsePayload(results=results, error="")
+
+    return StubConnection()
+
+
+@benchmark("ui")
+def bench_ui(count: int = 10000):
+    """شاشات main.py على صفحة Flet بدون عميل، مع CITYMOVER_UI_METRICS: تسجيل الدخول،
+    ثم شاشة المستخدم واختيار دمشق ثم المزة، ثم شاشة المالك، ثم الرجوع إليهما."""
+    import flet as ft
+    app = __import__("main")
+    app.db = new_temp_manager()
+    app.db_async = AsyncDB(app.db)
+    synthetic_data.generate(app.db, count, seed=SUITE_SEED)
+    damascus = str(next(c["id"] for c in app.db.get_cities() if c["name"] == "دمشق"))
+
+    def dropdown(label):
+        return _find_control(page.views[-1], lambda c: isinstance(c, ft.Dropdown) and c.label == label)
+
+    async def navigate(route, username=None):
+        if username:
+            page.session.set("user", dict(app.db.get_user_by_username(username)))
+        start = time.perf_counter()
+        page.go(route)
+        print(f"[ui] الانتقال إلى {route}: {(time.perf_counter() - start) * 1000:.1f}ms")
+        await asyncio.sleep(0.3)
+
+    async def run():
+        nonlocal page
+        page = ft.Page(_stub_flet_connection(), "bench", asyncio.get_running_loop())
+        app.main(page)
+        await asyncio.sleep(0.3)
+
+        await navigate("/user", f"user_{SUITE_SEED}_0")
+        # سحب الخريطة: أحداث متتالية ثم توقف؛ استعلام علامات واحد (عبر AsyncDB) لآخر موقع فقط
+        user_map = _find_control(page.views[-1], lambda c: type(c).__name__ == "Map")
+        before = app.db_async.stats().get("clusters_in_bbox", {}).get("count", 0)
+        for step in range(10):
+            user_map.on_event(types.SimpleNamespace(
+                center=types.SimpleNamespace(latitude=33.5 + step * 0.01, longitude=36.28), zoom=12))
+            await asyncio.sleep(0.02)
+        await asyncio.sleep(1.0)
+        queries = app.db_async.stats().get("clusters_in_bbox", {}).get("count", 0) - before
+        print(f"[ui] 10 أحداث سحب للخريطة: {queries} استعلام علامات عبر AsyncDB")
+        assert queries == 1
+        # كل حدث في مهمة خاصة به كما في Flet، حتى لا تلغي LatestOnly مهمة القياس نفسها
+        dropdown("اختر المدينة").value = damascus
+        await asyncio.create_task(dropdown("اختر المدينة").on_change(None))
+        dropdown("اختر المنطقة").value = "المزة"
+        await asyncio.create_task(dropdown("اختر المنطقة").on_change(None))
+
+        await navigate("/owner", f"owner_{SUITE_SEED}_0")
+        # الرجوع للشاشتين: من ViewCache بدون بناء، والمستخدم يجد المزة كما تركها
+        await navigate("/user", f"user_{SUITE_SEED}_0")
+        assert dropdown("اختر المنطقة").value == "المزة"
+        await navigate("/owner", f"owner_{SUITE_SEED}_0")
+        # بيانات تغيرت أثناء غياب الشاشة: تُحدّث نتائجها في مكانها
+        app.db.add_property(app.db.get_user_by_username(f"owner_{SUITE_SEED}_1")["id"], int(damascus),
+                            "المزة", "منزل جديد", "", 200000, 33.5, 36.25, "")
+        await navigate("/user", f"user_{SUITE_SEED}_0")
+        await navigate("/login")
+
+    page = None
+    os.environ["CITYMOVER_UI_METRICS"] = "1"
+    try:
+        asyncio.run(run())
+    finally:
+        del os.environ["CITYMOVER_UI_METRICS"]
+        app.db_async.shutdown()
+
+
+def exercise_android_queries(owner_id: int, user_id: int):
+    """استدعاء كل دوال القراءة والكتابة في db_android مرة واحدة."""
+    city_id = db_android.get_cities()[0]["id"]
+    db_android.get_city_by_id(city_id)
+    search_id = db_android.save_search(user_id, city_id, "المزة", max_rent=200000, services=["مدرسة"])
+    db_android.save_search(user_id, city_id, has_location=True)
+    prop_id = db_android.add_property(owner_id, city_id, "المزة", "منزل", "وصف",
+                                      150000, 33.5, 36.3, "مدرسة")
+    db_android.update_property(prop_id, rent=160000)
+    db_android.get_user_by_credentials("owner1", "123456")
+    db_android.get_user_by_id(user_id)
+    db_android.get_properties_by_city(city_id)
+    db_android.get_properties_by_owner(owner_id)
+    db_android.get_property_by_id(prop_id)
+    db_android.search_properties()
+    db_android.search_properties(city_id=city_id, area="مز", max_rent=200000)
+    db_android.search_properties(area="مز")
+    db_android.search_properties(max_rent=200000)
+    db_android.get_all_areas_by_city(city_id)
+    db_android.get_area_facets(city_id)
+    db_android.get_services()
+    db_android.add_service("تكييف", ("مكيف", "مكيفات"))
+    db_android.get_properties_by_city_and_area(city_id, "المزة")
+    db_android.search_properties_text("منزل مدرسة", city_id=city_id)
+    db_android.properties_in_bbox(33.4, 36.2, 33.6, 36.4)
+    db_android.clusters_in_bbox(33.4, 36.2, 33.6, 36.4, zoom=12)
+    db_android.nearest_properties(33.5, 36.3, k=5, max_rent=500000, area="المزة")
+    first = db_android.get_properties_by_city_and_area(city_id, "المزة", limit=20)
+    db_android.get_properties_by_city_and_area(
+        city_id, "المزة", limit=20, after=db_android.next_page_cursor(first, 1))
+    exercise_search_combinations(db_android.search_listings, city_id)
+    db_android.get_saved_searches(user_id)
+    db_android.count_unread_notifications(user_id)
+    notifications = db_android.get_notifications(user_id, unread_only=True)
+    db_android.mark_notifications_read(user_id, up_to_id=notifications[0]["id"])
+    db_android.mark_notifications_read(user_id)
+    db_android.get_notifications(user_id)
+    db_android.check_db_status()
+    db_android.delete_property(prop_id, owner_id)
+    db_android.delete_saved_search(search_id, user_id)
+    server = sync.SyncServer(os.path.join(tempfile.mkdtemp(prefix="citymover_bench_"), "server.db")).start()
+    try:
+        db_android.sync_with_server(server.url, server.repo.register_sync_device("owner1"), batch_size=50)
+    finally:
+        server.stop()
+
+
+# قيم كل فلتر في تدقيق البحث المركب؛ كل التركيبات تُجرب مع كل ترتيب
+_SEARCH_FILTER_VALUES = {
+    "areas": (None, ["المزة"], ["المزة", "كفرسوسة"]),
+    "rent": ((None, None), (100000, None), (None, 500000), (100000, 500000)),
+    "services": (None, ["مدرسة", "مولدة"]),
+    "has_location": (False, True),
+}
+
+
+def exercise_search_combinations(search_listings, city_id: int):
+    """search_listings بكل تركيبة من الفلاتر (مع المدينة وبدونها، والمناطق تحتاج مدينة) وكل ترتيب،
+    مع الصفحة الثانية."""
+    combinations = itertools.product(
+        (None, city_id), *_SEARCH_FILTER_VALUES.values(), listing_search.SORTS,
+    )
+    for city, areas, (min_rent, max_rent), services, has_location, sort in combinations:
+        if areas and not city:
+            continue
+        near = (33.5138, 36.2765) if sort == "nearest" else None
+        page = search_listings(city, areas, min_rent, max_rent, services, has_location, sort, near,
+                               limit=2)
+        if page["cursor"]:
+            search_listings(city, areas, min_rent, max_rent, services, has_location, sort, near,
+                            limit=2, after=page["cursor"])
+
+
+def exercise_manager_queries(manager):
+    """استدعاء كل دوال DatabaseManager مرة واحدة."""
+    owner = manager.get_user_by_credentials("owner1", "123456")
+    user = manager.get_user_by_credentials("user1", "123456")
+    city_id = manager.get_cities()[0]["id"]
+    manager.get_city_by_id(city_id)
+    search_id = manager.save_search(user["id"], city_id, "المزة", 100000, services=["مدرسة"])
+    prop_id = manager.add_property(owner["id"], city_id, "المزة", "منزل", "وصف", 150000, 33.5, 36.3, "مدرسة")
+    manager.get_property_by_id(prop_id)
+    manager.update_property(prop_id, title="منزل", area="المزة", description="وصف", rent=160000,
+                            lat=33.5, lon=36.3, services="مدرسة")
+    manager.get_properties_by_owner(owner["id"])
+    list(manager.iter_properties_by_owner(owner["id"]))
+    list(manager.iter_search_properties(city_id, "المزة", max_rent=500000, min_rent=100000))
+    manager.get_all_areas_by_city(city_id)
+    manager.get_area_facets(city_id)
+    manager.get_services()
+    manager.add_service("تكييف", ("مكيف", "مكيفات"))
+    manager.search_properties_text("منزل مدرسة")
+    manager.properties_in_bbox(33.4, 36.2, 33.6, 36.4)
+    manager.clusters_in_bbox(33.4, 36.2, 33.6, 36.4, zoom=12)
+    manager.nearest_properties(33.5, 36.3, k=5)
+    first = manager.get_properties_by_city_and_area(city_id, "المزة", limit=20)
+    manager.get_properties_by_city_and_area(
+        city_id, "المزة", limit=20, after=manager.next_page_cursor(first, 1))
+    exercise_search_combinations(manager.search_listings, city_id)
+    # مطابقة الإدخال الكبير (add_properties_bulk) باستعلام واحد بدل المشغل
+    saved_searches.match_rows_after(manager.get_connection(), 0)
+    manager.get_saved_searches(user["id"])
+    manager.count_unread_notifications(user["id"])
+    manager.get_notifications(user["id"])
+    manager.mark_notifications_read(user["id"])
+    manager.delete_saved_search(search_id, user["id"])
+    # المزامنة: قراءة السجل بأشكالها الثلاثة وتطبيق دفعة (صفوف موجودة: تحديث) وتسجيل الإدخال الكبير
+    image_prop = manager.add_property(owner["id"], city_id, "المزة", "منزل", rent=150000)
+    with manager.get_connection() as conn:
+        conn.execute("INSERT INTO property_images (property_id, image_path) VALUES (?, 'bench.jpg')", (image_prop,))
+    manager.delete_property(prop_id, owner["id"])
+    changes = manager.changes_since(0, 1000)["changes"]
+    manager.changes_since(0, 50, exclude_origin="bench")
+    manager.changes_since(manager.get_sync_state("push_cursor", 0), 50, local_only=True)
+    manager.apply_changes(changes, origin="bench", pull_cursor=0)
+    manager.apply_changes(changes, origin="bench", owner_id=owner["id"])
+    manager.set_sync_state("push_cursor", 0)
+    token = manager.register_sync_device(owner["username"])
+    manager.sync_device_for_token(token)
+    change_log.log_properties_after(manager.get_connection(), 0)
+
+
+def new_temp_manager():
+    # استيراد main هنا لأنه يتطلب flet وينشئ city_mover.db في المجلد الحالي
+    import main as app
+    tmp_dir = tempfile.mkdtemp(prefix="citymover_bench_")
+    return app.DatabaseManager(os.path.join(tmp_dir, "bench_main.db"))
+
+
+# أحجام البيانات وعدد التكرارات لكل دالة في قياس suite
+SUITE_SIZES = (1000, 10000, 100000)
+SUITE_REPEATS = 20
+SUITE_SEED = 42
+# ملف نتائج suite (يُغير بـ --json)
+SUITE_JSON = "bench_results.json"
+# دوال db_android التي ليست استعلامات (لا تدخل في التغطية)
+_SUITE_SKIPPED = {"get_db_path", "current_repository", "get_connection", "get_cache", "init_db",
+                  "next_page_cursor", "data_generation", "enable_profiling", "disable_profiling",
+                  # يحتاج خادماً؛ مقاس في bench_sync
+                  "sync_with_server"}
+
+
+def suite_calls(target):
+    """(الاسم، الاستدعاء) لكل دالة قراءة وكتابة في target (db_android أو DatabaseManager)."""
+    owner = target.get_user_by_username(f"owner_{SUITE_SEED}_0")
+    user = target.get_user_by_username(f"user_{SUITE_SEED}_0")
+    city_id = next(c["id"] for c in target.get_cities() if c["name"] == "دمشق")
+    first_page = target.get_properties_by_city_and_area(city_id, "المزة", limit=20)
+    prop_id = first_page[0]["id"] if first_page else target.get_properties_by_owner(owner["id"])[0]["id"]
+    bbox = geo.viewport_bbox(33.5138, 36.2765, 14, 400, 250)
+    counter = iter(range(10 ** 9))
+
+    def add():
+        return target.add_property(owner["id"], city_id, "المزة", "شقة للقياس", "وصف", 150000,
+                                   33.51, 36.28, "مدرسة")
+
+    def add_and_delete():
+        target.delete_property(add(), owner["id"])
+
+    return [
+        ("get_cities", lambda: target.get_cities()),
+        ("get_city_by_id", lambda: target.get_city_by_id(city_id)),
+        ("get_all_areas_by_city", lambda: target.get_all_areas_by_city(city_id)),
+        ("get_area_facets", lambda: target.get_area_facets(city_id)),
+        ("get_services", lambda: target.get_services()),
+        # خدمة موجودة: القياس هو إعادة حساب قناع كل العقارات (retag_properties)
+        ("add_service", lambda: target.add_service("مدرسة", ("مدارس",))),
+        ("get_user_by_credentials",
+         lambda: target.get_user_by_credentials(owner["username"], synthetic_data.DEMO_PASSWORD)),
+        ("get_user_by_username", lambda: target.get_user_by_username(owner["username"])),
+        ("get_user_by_id", lambda: target.get_user_by_id(owner["id"])),
+        ("get_property_by_id", lambda: target.get_property_by_id(prop_id)),
+        ("get_properties_by_city", lambda: target.get_properties_by_city(city_id)),
+        ("get_properties_by_owner", lambda: target.get_properties_by_owner(owner["id"])),
+        ("get_properties_by_city_and_area",
+         lambda: target.get_properties_by_city_and_area(city_id, "المزة", limit=20)),
+        ("get_properties_by_city_and_area[page2]",
+         lambda: target.get_properties_by_city_and_area(
+             city_id, "المزة", limit=20, after=target.next_page_cursor(first_page, 20))),
+        ("search_properties", lambda: target.search_properties(city_id, "المزة", max_rent=1000000)),
+        ("search_properties_text", lambda: target.search_properties_text("شقة مفروشة")),
+        ("search_listings", lambda: target.search_listings(city_id, ["المزة", "كفرسوسة"], 200000,
+                                                           1500000, sort="cheapest")),
+        ("search_listings[services]",
+         lambda: target.search_listings(city_id, services=["مدرسة", "مولدة"], has_location=True)),
+        ("search_listings[nearest]",
+         lambda: target.search_listings(city_id, max_rent=1000000, sort="nearest",
+                                        near=(33.5138, 36.2765))),
+        ("properties_in_bbox", lambda: target.properties_in_bbox(*bbox)),
+        ("clusters_in_bbox", lambda: target.clusters_in_bbox(32.3, 35.7, 37.3, 42.4, zoom=7)),
+        ("nearest_properties", lambda: target.nearest_properties(33.5138, 36.2765, k=10)),
+        ("get_saved_searches", lambda: target.get_saved_searches(user["id"])),
+        ("get_notifications", lambda: target.get_notifications(user["id"])),
+        ("count_unread_notifications", lambda: target.count_unread_notifications(user["id"])),
+        ("mark_notifications_read", lambda: target.mark_notifications_read(user["id"])),
+        ("check_db_status", lambda: target.check_db_status()),
+        ("add_property", add),
+        ("save_search", lambda: target.save_search(user["id"], city_id, "المزة", max_rent=1000000)),
+        ("delete_saved_search",
+         lambda: target.delete_saved_search(target.save_search(user["id"], city_id), user["id"])),
+        ("update_property", lambda: target.update_property(prop_id, rent=150000 + next(counter))),
+        ("delete_property", add_and_delete),
+        ("create_user", lambda: target.create_user(f"bench_{next(counter)}", "123456", "user")),
+    ]
+
+
+def time_calls(calls, repeats: int):
+    """لكل استدعاء: الوسيط وp95 والأقصى بالميلي ثانية، وعدد الصفوف المُرجعة."""
+    results = {}
+    for name, call in calls:
+        call()  # تسخين: الاستعلامات المحضرة وذاكرة الصفحات
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = call()
+            times.append(time.perf_counter() - start)
+        times.sort()
+        results[name] = {
+            "median_ms": round(times[len(times) // 2] * 1000, 4),
+            "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))] * 1000, 4),
+            "max_ms": round(times[-1] * 1000, 4),
+            "rows": len(result) if isinstance(result, list) else None,
+        }
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+@benchmark("suite")
+def bench_suite(sizes=SUITE_SIZES, repeats: int = SUITE_REPEATS):
+    """كل دوال db_android وDatabaseManager على بيانات synthetic_data بعدة أحجام، والنتائج في SUITE_JSON."""
+    report = {
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "sqlite": sqlite3.sqlite_version,
+        "seed": SUITE_SEED,
+        "repeats": repeats,
+        "results": {},
+    }
+    public = {name for name, value in vars(db_android).items()
+              if callable(value) and not name.startswith("_") and getattr(value, "__module__", None) == "db_android"}
+
+    for size in sizes:
+        use_temp_android_db()
+        synthetic_data.generate(db_android.current_repository(), size, seed=SUITE_SEED)
+        targets = [("db_android", db_android)]
+        manager = new_temp_manager()
+        synthetic_data.generate(manager, size, seed=SUITE_SEED)
+        targets.append(("DatabaseManager", manager))
+
+        for label, target in targets:
+            calls = suite_calls(target)
+            missing = public - _SUITE_SKIPPED - {name for name, _ in calls}
+            if missing:
+                print(f"[suite] دوال بدون قياس: {sorted(missing)}")
+            results = time_calls(calls, repeats)
+            report["results"].setdefault(label, {})[str(size)] = results
+            slowest = sorted(results.items(), key=lambda item: -item[1]["median_ms"])[:3]
+            print(f"[suite] {label} {size} عقار: الأبطأ " + "، ".join(
+                f"{name} {r['median_ms']:.2f}ms" for name, r in slowest))
+
+    with open(SUITE_JSON, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[suite] النتائج في {os.path.abspath(SUITE_JSON)}")
+
+
+def compare_results(old_path: str, new_path: str, threshold: float = 1.5):
+    """مقارنة ملفي نتائج suite؛ يفشل إذا صار وسيط أي دالة أبطأ من threshold ضعف (وبفارق > 0.05ms)."""
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    regressions = 0
+    for label, sizes in new["results"].items():
+        for size, functions in sizes.items():
+            for name, result in functions.items():
+                before = old["results"].get(label, {}).get(size, {}).get(name)
+                if before is None:
+                    continue
+                ratio = result["median_ms"] / before["median_ms"] if before["median_ms"] else 1.0
+                if ratio > threshold and result["median_ms"] - before["median_ms"] > 0.05:
+                    regressions += 1
+                    print(f"[compare] أبطأ: {label} {size} {name}: "
+                          f"{before['median_ms']:.3f}ms ← {result['median_ms']:.3f}ms (×{ratio:.1f})")
+    print(f"[compare] {old.get('commit')} ← {new.get('commit')}: {regressions} تراجع")
+    return 1 if regressions else 0
+
+
+@benchmark("plans")
+def check_query_plans():
+    """يفشل إذا قام أي استعلام في db_android أو DatabaseManager بمسح جدول كامل.
+
+    هذا هو اختبار خطط الاستعلام في المشروع (لا توجد حزمة اختبارات): `python benchmarks.py plans`
+    يُرجع رمز خروج غير صفري عند أي مسح كامل، فيُشغّل قبل كل تعديل على الاستعلامات أو الفهارس.
+    """
+    use_temp_android_db()
+    owner = db_android.get_user_by_credentials("owner1", "123456")
+    user = db_android.get_user_by_credentials("user1", "123456")
+    seed_owner_properties(owner["id"], 200)
+    conn = db_android.get_connection()
+    db_android.get_cache().invalidate()
+    with StatementRecorder(conn) as recorder:
+        exercise_android_queries(owner["id"], user["id"])
+    problems = audit(conn, recorder.statements)
+    print(f"[plans] db_android: {len(set(recorder.statements))} استعلام")
+
+    manager = new_temp_manager()
+    manager.cache.invalidate()
+    conn = manager.get_connection()
+    with StatementRecorder(conn) as recorder:
+        exercise_manager_queries(manager)
+    problems += audit(conn, recorder.statements)
+    print(f"[plans] DatabaseManager: {len(set(recorder.statements))} استعلام")
+
+    for sql, scans in problems:
+        print(f"[plans] مسح كامل: {sql}\n        {scans}")
+    return 1 if problems else 0
+
+
+# آخر خطوة ترحيل قبل جداول الملخص (facets): مخطط الملفات الموجودة عند المستخدمين قبلها
+_PRE_FACETS_VERSION = 8
+
+
+@benchmark("migrate")
+def check_null_area_migration():
+    """ملف قديم فيه عقار بدون منطقة (area NULL): الترحيل حتى آخر خطوة، ثم إضافة عقار آخر بدون منطقة."""
+    repo = Repository(os.path.join(tempfile.mkdtemp(prefix="citymover_bench_"), "old.db"))
+    conn = repo.get_connection()
+    run_migrations(conn, MIGRATIONS[:_PRE_FACETS_VERSION])
+    owner_id = conn.execute("SELECT id FROM users WHERE username = 'owner1'").fetchone()[0]
+    city_id = conn.execute("SELECT id FROM cities WHERE name = 'دمشق'").fetchone()[0]
+    with conn:
+        conn.execute("INSERT INTO properties (owner_id, city_id, area, title, rent) VALUES (?, ?, NULL, ?, ?)",
+                     (owner_id, city_id, "منزل بدون منطقة", 100000))
+
+    applied = repo.init_db()
+    repo.add_property(owner_id, city_id, None, "منزل آخر بدون منطقة", rent=200000)
+    version = get_schema_version(conn)
+    listings = conn.execute(
+        "SELECT listings FROM area_facets WHERE city_id = ? AND area_key = ''", (city_id,)
+    ).fetchone()
+    print(f"[migrate] {applied} خطوة ترحيل حتى الإصدار {version} من {len(MIGRATIONS)}، "
+          f"عقارات بدون منطقة في الملخص: {listings[0] if listings else 0}")
+    return 0 if version == len(MIGRATIONS) and listings == (2,) else 1
+
+
+def main(argv):
+    global SUITE_JSON
+    if argv[:1] == ["compare"]:
+        if len(argv) < 3:
+            print("الاستخدام: benchmarks.py compare old.json new.json [threshold]")
+            return 1
+        return compare_results(argv[1], argv[2], *map(float, argv[3:4]))
+    if "--json" in argv:
+        i = argv.index("--json")
+        SUITE_JSON = argv[i + 1]
+        argv = argv[:i] + argv[i + 2:]
+    names = argv or list(BENCHMARKS)
+    failed = False
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"قياس غير معروف: {name}")
+            return 1
+        if BENCHMARKS[name]():
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
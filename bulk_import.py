@@ -0,0 +1,192 @@
+"""استيراد عقارات بالجملة من ملف CSV أو JSONL.
+
+    python bulk_import.py listings.csv --owner owner1 --db city_mover.db
+
+الأعمدة: city (اسم المدينة) أو city_id، area، title، description، rent، lat، lon،
+services، واختيارياً owner (اسم المستخدم) أو owner_id لكل صف بدلاً من --owner.
+الملف يُقرأ دفعات ولا يُحمّل كاملاً في الذاكرة. كل صف يمر بنفس قواعد نموذج المالك
+(listing_rules)، والصف المرفوض يُسجل مع رقم سطره ولا يوقف الاستيراد. كل دفعة
+تُدخل في معاملة واحدة عبر Repository.add_properties_bulk.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from arabic import normalize_arabic
+from listing_rules import ListingError, validate_listing
+from repository import get_repository
+
+# عدد الصفوف في كل معاملة
+DEFAULT_CHUNK_SIZE = 50000
+# عدد أخطاء الصفوف المحفوظة في التقرير (العدد الكلي يُحسب دائماً)
+MAX_REPORTED_ERRORS = 1000
+
+
+def read_rows(path: str, fmt: str = None):
+    """قراءة الملف صفاً صفاً: (رقم السطر، قاموس الحقول). fmt: "csv" أو "jsonl" (حسب الامتداد افتراضياً)."""
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    row = e
+                yield line_no, row
+
+
+class _Resolver:
+    """تحويل أسماء المدن والمالكين إلى أرقامهم، مع حفظ ما سبق البحث عنه."""
+
+    def __init__(self, repo, default_owner: str = None):
+        self.repo = repo
+        cities = repo.get_cities()
+        self.city_names = {c["id"]: c["name"] for c in cities}
+        self.cities_by_key = {normalize_arabic(c["name"]): (c["id"], c["name"]) for c in cities}
+        # نفس اسم المدينة يتكرر في آلاف الصفوف: التوحيد مرة واحدة لكل كتابة مختلفة
+        self.cities_by_name = {}
+        self.owners = {}
+        self.default_owner = default_owner
+
+    def city(self, row):
+        city_id = row.get("city_id")
+        if city_id not in (None, ""):
+            try:
+                city_id = int(city_id)
+            except (TypeError, ValueError):
+                raise ListingError(f"رقم مدينة غير صحيح: {city_id}") from None
+            if city_id not in self.city_names:
+                raise ListingError(f"المدينة غير موجودة: {city_id}")
+            return city_id, self.city_names[city_id]
+        name = row.get("city")
+        found = self.cities_by_name.get(name)
+        if found is None:
+            name = (name or "").strip()
+            if not name:
+                raise ListingError("الرجاء اختيار مدينة")
+            found = self.cities_by_key.get(normalize_arabic(name))
+            if found is None:
+                raise ListingError(f"المدينة غير موجودة: {name}")
+            self.cities_by_name[row.get("city")] = found
+        return found
+
+    def owner(self, row):
+        key = row.get("owner_id") or row.get("owner") or self.default_owner
+        if key in (None, ""):
+            raise ListingError("المالك غير محدد")
+        if key not in self.owners:
+            if row.get("owner_id"):
+                try:
+                    user = self.repo.get_user_by_id(int(key))
+                except (TypeError, ValueError):
+                    user = None
+            else:
+                user = self.repo.get_user_by_username(key)
+            self.owners[key] = user["id"] if user and user["role"] == "owner" else None
+        if self.owners[key] is None:
+            raise ListingError(f"المالك غير موجود: {key}")
+        return self.owners[key]
+
+
+def _text(value):
+    return None if value is None else str(value).strip()
+
+
+def _validate_chunk(chunk, resolve):
+    """(الصفوف الجاهزة للإدخال، [(رقم السطر، الخطأ)]) لدفعة من read_rows."""
+    valid, errors = [], []
+    for line_no, row in chunk:
+        try:
+            if not isinstance(row, dict):
+                raise ListingError(f"سطر غير صالح: {row}")
+            city_id, city_name = resolve.city(row)
+            owner_id = resolve.owner(row)
+            area, rent, lat, lon = validate_listing(
+                city_name, _text(row.get("area")), row.get("rent"), row.get("lat"), row.get("lon"),
+            )
+            valid.append((owner_id, city_id, area, _text(row.get("title")) or "",
+                          _text(row.get("description")), rent, lat, lon, _text(row.get("services"))))
+        except ListingError as err:
+            errors.append((line_no, str(err)))
+    return valid, errors
+
+
+def import_listings(db_path: str, path: str, owner: str = None, fmt: str = None,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE, progress=None):
+    """استيراد ملف كامل؛ يُرجع تقريراً بعدد الصفوف المقروءة والمضافة والمرفوضة وسرعتها.
+
+    قراءة الدفعة التالية والتحقق منها يجريان في خيط آخر أثناء إدخال الدفعة الحالية.
+    errors في التقرير: أول MAX_REPORTED_ERRORS خطأ كقائمة {"line", "error"}.
+    progress(report) تُستدعى بعد كل دفعة إن أُعطيت.
+    """
+    repo = get_repository(db_path)
+    repo.init_db()
+    resolve = _Resolver(repo, owner)
+    report = {"read": 0, "inserted": 0, "rejected": 0, "chunks": 0, "seconds": 0.0,
+              "rows_per_sec": 0.0, "errors": []}
+    started = time.perf_counter()
+
+    rows = read_rows(path, fmt)
+
+    def next_chunk():
+        chunk = list(islice(rows, chunk_size))
+        return len(chunk), _validate_chunk(chunk, resolve)
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="import") as reader:
+        pending = reader.submit(next_chunk)
+        while True:
+            count, (valid, errors) = pending.result()
+            if not count:
+                break
+            pending = reader.submit(next_chunk)
+
+            report["read"] += count
+            report["rejected"] += len(errors)
+            for line_no, error in errors[:MAX_REPORTED_ERRORS - len(report["errors"])]:
+                report["errors"].append({"line": line_no, "error": error})
+            if valid:
+                report["inserted"] += repo.add_properties_bulk(valid)
+            report["chunks"] += 1
+
+            report["seconds"] = round(time.perf_counter() - started, 3)
+            report["rows_per_sec"] = round(report["read"] / report["seconds"]) if report["seconds"] else 0.0
+            if progress:
+                progress(report)
+    return report
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="bulk_import.py")
+    parser.add_argument("path", help="ملف CSV أو JSONL")
+    parser.add_argument("--owner", help="اسم المالك للصفوف التي لا تحدد owner أو owner_id")
+    parser.add_argument("--db", default="city_mover.db")
+    parser.add_argument("--format", choices=("csv", "jsonl"))
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        print(f"الملف غير موجود: {args.path}")
+        return 1
+
+    def progress(report):
+        print(f"{report['read']} صف ({report['rows_per_sec']} صف/ث)، مرفوض: {report['rejected']}",
+              file=sys.stderr)
+
+    report = import_listings(args.db, args.path, args.owner, args.format, args.chunk_size, progress)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if report["rejected"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
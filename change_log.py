@@ -0,0 +1,459 @@
+"""سجل التغييرات للمزامنة بين الأجهزة (انظر sync.py).
+
+كل إضافة أو تعديل أو حذف في users وproperties وproperty_images تسجله المشغلات في
+change_log برقم تسلسلي seq يزيد دائماً (AUTOINCREMENT). للصف سطر واحد في السجل:
+التغيير الجديد يحل محل السابق (UNIQUE (tbl, key)) برقم جديد، فـ "كل ما تغير بعد
+المؤشر n" هو مسح لمجال من المفتاح الأساسي مهما كثرت تعديلات الصف نفسه.
+
+الصفوف تُعرّف بين الأجهزة بمفتاح لا يعتمد على id المحلي:
+
+    users            username
+    properties       sync_uid (معرّف عشوائي يُنشأ مع العقار)
+    property_images  sync_uid
+
+origin في السجل: NULL لتغيير محلي لم يُرسل بعد، أو الجهاز الذي جاء منه التغيير
+(apply_changes ثم mark_origin)، فلا يعود التغيير إلى مصدره ولا يُرسل ما جاء من الخادم إليه مرة أخرى.
+
+الحسابات يملكها الخادم: كلمات المرور لا تُرسل أبداً، والمستخدم يصل إلى الأجهزة باسمه ودوره
+فقط. الخادم يتجاهل المستخدمين القادمين من الأجهزة، وكل جهاز مسجل (sync_devices) مرتبط بحساب
+واحد لا يكتب إلا عقاراته وصورها.
+"""
+import hashlib
+import secrets
+import time
+
+from arabic import normalize_arabic
+
+TABLES = ("users", "properties", "property_images")
+PROPERTIES_INSERT_TRIGGER = "change_log_properties_ai"
+PROPERTIES_UID_TRIGGER = "change_log_properties_uid"
+UPDATE_TRIGGERS = {table: f"change_log_{table}_au" for table in ("properties", "property_images")}
+DEFAULT_BATCH_SIZE = 500
+
+# أعمدة كل جدول كما تُرسل (المراجع بالمفاتيح المشتركة: owner = username، property = sync_uid)
+_ROW_SQL = {
+    "users": """
+        SELECT username, username, role, created_at
+        FROM users WHERE username IN ({keys})
+    """,
+    "properties": """
+        SELECT p.sync_uid, p.sync_uid, u.username, c.name, c.lat, c.lon, p.area, p.title, p.description,
+               p.rent, p.lat, p.lon, p.services, p.created_at
+        FROM properties p
+        JOIN users u ON u.id = p.owner_id
+        JOIN cities c ON c.id = p.city_id
+        WHERE p.sync_uid IN ({keys})
+    """,
+    "property_images": """
+        SELECT i.sync_uid, i.sync_uid, p.sync_uid, i.image_path, i.created_at
+        FROM property_images i
+        JOIN properties p ON p.id = i.property_id
+        WHERE i.sync_uid IN ({keys})
+    """,
+}
+_ROW_FIELDS = {
+    "users": ("username", "role", "created_at"),
+    "properties": ("uid", "owner", "city", "city_lat", "city_lon", "area", "title", "description",
+                   "rent", "lat", "lon", "services", "created_at"),
+    "property_images": ("uid", "property", "image_path", "created_at"),
+}
+# الأعمدة التي يُرسل منها الصف (مع sync_uid الذي يملؤه مشغل المعرّف)
+_SYNCED_COLUMNS = {
+    "properties": ("owner_id", "city_id", "area", "title", "description", "rent", "lat", "lon", "services",
+                   "created_at", "sync_uid"),
+    "property_images": ("property_id", "image_path", "created_at", "sync_uid"),
+}
+# الجدول الذي يشير إليه كل صف (يجب أن يصل قبله)
+_PARENT = {"properties": ("users", "owner"), "property_images": ("properties", "property")}
+
+
+def new_uid():
+    # بادئة الوقت: المعرّفات الجديدة تُضاف في آخر فهرس sync_uid وفهرس السجل بدل مواقع عشوائية فيهما
+    return f"{time.time_ns():016x}{secrets.token_hex(8)}"
+
+
+def _log_sql(table, key, op):
+    # حذف ثم إدخال بدل INSERT OR REPLACE: داخل المشغل يحل محل OR REPLACE تعاملُ الجملة الخارجية
+    # مع التعارض (ON CONFLICT في apply_changes)
+    return (f"DELETE FROM change_log WHERE tbl = '{table}' AND key = {key}; "
+            f"INSERT INTO change_log (tbl, key, op) VALUES ('{table}', {key}, '{op}');")
+
+
+def create_change_log(conn):
+    """جدول السجل وحالة المزامنة والمعرّفات المشتركة والمشغلات، وتسجيل الصفوف الموجودة."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tbl TEXT NOT NULL,
+            key TEXT NOT NULL,
+            op TEXT NOT NULL CHECK (op IN ('upsert', 'delete')),
+            origin TEXT,
+            UNIQUE (tbl, key)
+        )
+    """)
+    # device_id ومؤشرا المزامنة (آخر seq أُرسل من هنا، وآخر seq وصل من الخادم)
+    conn.execute("CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    conn.execute("INSERT OR IGNORE INTO sync_state (name, value) VALUES ('device_id', ?)", (new_uid(),))
+
+    for table in ("properties", "property_images"):
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        if "sync_uid" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN sync_uid TEXT")
+        conn.execute(f"UPDATE {table} SET sync_uid = lower(hex(randomblob(16))) WHERE sync_uid IS NULL")
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_sync_uid ON {table}(sync_uid)")
+        # الإدخال من خارج Repository (بدون sync_uid): المعرّف يُنشأ هنا، وتحديثه يسجل التغيير
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS change_log_{table}_uid AFTER INSERT ON {table}
+            WHEN new.sync_uid IS NULL BEGIN
+                UPDATE {table} SET sync_uid = lower(hex(randomblob(16))) WHERE id = new.id;
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS change_log_{table}_ai AFTER INSERT ON {table}
+            WHEN new.sync_uid IS NOT NULL BEGIN
+                {_log_sql(table, "new.sync_uid", "upsert")}
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS change_log_{table}_ad AFTER DELETE ON {table}
+            WHEN old.sync_uid IS NOT NULL BEGIN
+                {_log_sql(table, "old.sync_uid", "delete")}
+            END
+        """)
+
+    create_update_triggers(conn)
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS change_log_users_ai AFTER INSERT ON users BEGIN
+            {_log_sql("users", "new.username", "upsert")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS change_log_users_au AFTER UPDATE ON users BEGIN
+            DELETE FROM change_log WHERE tbl = 'users' AND key = old.username AND old.username != new.username;
+            INSERT INTO change_log (tbl, key, op)
+            SELECT 'users', old.username, 'delete' WHERE old.username != new.username;
+            {_log_sql("users", "new.username", "upsert")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS change_log_users_ad AFTER DELETE ON users BEGIN
+            {_log_sql("users", "old.username", "delete")}
+        END
+    """)
+
+    # كل الصفوف الموجودة تغييرات محلية لم تُرسل بعد (الآباء قبل الأبناء)
+    conn.execute("INSERT OR IGNORE INTO change_log (tbl, key, op) SELECT 'users', username, 'upsert' FROM users")
+    for table in ("properties", "property_images"):
+        conn.execute(
+            f"INSERT OR IGNORE INTO change_log (tbl, key, op) SELECT '{table}', sync_uid, 'upsert' FROM {table}"
+        )
+
+
+def create_update_triggers(conn):
+    """تسجيل تعديل العقار أو الصورة عند تغير الأعمدة المرسلة فقط (_SYNCED_COLUMNS).
+
+    services_mask يُحسب في كل جهاز من services، فإعادة حسابه (retag_properties) لا تُرسل شيئاً.
+    """
+    for table, columns in _SYNCED_COLUMNS.items():
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {UPDATE_TRIGGERS[table]} AFTER UPDATE OF {", ".join(columns)} ON {table}
+            WHEN new.sync_uid IS NOT NULL BEGIN
+                {_log_sql(table, "new.sync_uid", "upsert")}
+            END
+        """)
+
+
+def fill_uids_after(conn, after_id: int):
+    """المعرّف المشترك للعقارات ذات id > after_id المضافة بدونه (بدل مشغل المعرّف في الإدخال الكبير)."""
+    conn.execute(
+        "UPDATE properties SET sync_uid = lower(hex(randomblob(16))) WHERE id > ? AND sync_uid IS NULL",
+        (after_id,),
+    )
+
+
+def log_properties_after(conn, after_id: int):
+    """تسجيل العقارات ذات id > after_id في السجل دفعة واحدة (بدل المشغل في الإدخال الكبير)."""
+    conn.execute(
+        "INSERT OR REPLACE INTO change_log (tbl, key, op) "
+        "SELECT 'properties', sync_uid, 'upsert' FROM properties WHERE id > ? AND sync_uid IS NOT NULL",
+        (after_id,),
+    )
+
+
+# ---------- الأجهزة المسجلة عند الخادم ----------
+
+def create_device_table(conn):
+    """رموز الأجهزة (مخزنة مجزأة بـ sha256) والحساب المرتبط بكل جهاز."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sync_devices (
+            token_hash TEXT PRIMARY KEY,
+            device_id TEXT NOT NULL UNIQUE,
+            user_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS sync_devices_users_ad AFTER DELETE ON users BEGIN
+            DELETE FROM sync_devices WHERE user_id = old.id;
+        END
+    """)
+
+
+def _token_hash(token: str):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def register_device(conn, user_id: int):
+    """تسجيل جهاز لحساب user_id؛ يُرجع رمزه (يُعرض مرة واحدة ولا يُخزن إلا مجزأً)."""
+    token = secrets.token_urlsafe(32)
+    conn.execute(
+        "INSERT INTO sync_devices (token_hash, device_id, user_id) VALUES (?, ?, ?)",
+        (_token_hash(token), new_uid(), user_id),
+    )
+    return token
+
+
+def device_for_token(conn, token: str):
+    """(device_id, user_id) للجهاز صاحب الرمز، أو None."""
+    if not token:
+        return None
+    return conn.execute(
+        "SELECT device_id, user_id FROM sync_devices WHERE token_hash = ?", (_token_hash(token),)
+    ).fetchone()
+
+
+# ---------- حالة المزامنة ----------
+
+def get_state(conn, name: str, default=None):
+    row = conn.execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else default
+
+
+def set_state(conn, name: str, value):
+    conn.execute(
+        "INSERT INTO sync_state (name, value) VALUES (?, ?) "
+        "ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+        (name, str(value)),
+    )
+
+
+# ---------- قراءة التغييرات ----------
+
+def _visible(origin, exclude_origin, local_only):
+    if local_only:
+        return origin is None
+    return origin is None or origin != exclude_origin
+
+
+def changes_since(conn, since: int, limit: int = DEFAULT_BATCH_SIZE, exclude_origin: str = None,
+                  local_only: bool = False):
+    """دفعة من التغييرات بعد المؤشر since بترتيب seq.
+
+    exclude_origin: لا تُرسل التغييرات التي جاءت من هذا الجهاز (طلب pull).
+    local_only: التغييرات المحلية فقط (origin IS NULL) لإرسالها للخادم (push).
+    يُرجع {"changes": [...], "cursor": آخر seq في الدفعة, "more": bool}. كل تغيير
+    {"table", "op", "key", "row"}؛ الصف الذي يشير إلى أب (مالك أو عقار) تغيّر بعده يسبقه
+    الأب نفسه، حتى يمكن تطبيق كل دفعة وحدها وبالترتيب.
+    """
+    if local_only:
+        entries = conn.execute(
+            "SELECT seq, tbl, key, op FROM change_log WHERE seq > ? AND origin IS NULL ORDER BY seq LIMIT ?",
+            (since, limit),
+        ).fetchall()
+    else:
+        entries = conn.execute(
+            "SELECT seq, tbl, key, op FROM change_log WHERE seq > ? AND (origin IS NULL OR origin != ?) "
+            "ORDER BY seq LIMIT ?",
+            (since, exclude_origin or "", limit),
+        ).fetchall()
+    if not entries:
+        return {"changes": [], "cursor": since, "more": False}
+    last = entries[-1][0]
+
+    rows = {table: _rows(conn, table, [key for _, tbl, key, op in entries if tbl == table and op == "upsert"])
+            for table in TABLES}
+    changes = []
+    sent = set()
+
+    def add(seq, table, op, key, row):
+        sent.add((table, key))
+        if row is not None and table in _PARENT:
+            parent_table, field = _PARENT[table]
+            parent_key = row[field]
+            if (parent_table, parent_key) not in sent:
+                parent = conn.execute(
+                    "SELECT seq, op, origin FROM change_log WHERE tbl = ? AND key = ?", (parent_table, parent_key)
+                ).fetchone()
+                # الأب (أو أب الأب) تغيّر بعد هذا التغيير، في دفعة لاحقة أو بعده في هذه الدفعة: يُرسل قبله
+                if parent and parent[0] > seq and parent[1] == "upsert" and _visible(
+                        parent[2], exclude_origin, local_only):
+                    parent_row = rows[parent_table].get(parent_key) or _rows(
+                        conn, parent_table, [parent_key]).get(parent_key)
+                    if parent_row is not None:
+                        add(seq, parent_table, "upsert", parent_key, parent_row)
+        changes.append({"table": table, "op": op, "key": key, "row": row})
+
+    for seq, table, key, op in entries:
+        if (table, key) in sent:
+            continue
+        if op == "delete":
+            add(seq, table, op, key, None)
+        elif key in rows[table]:
+            add(seq, table, op, key, rows[table][key])
+    return {"changes": changes, "cursor": last, "more": len(entries) == limit}
+
+
+def _rows(conn, table, keys):
+    if not keys:
+        return {}
+    fields = _ROW_FIELDS[table]
+    sql = _ROW_SQL[table].format(keys=", ".join("?" * len(keys)))
+    return {row[0]: dict(zip(fields, row[1:])) for row in conn.execute(sql, keys)}
+
+
+# ---------- تطبيق التغييرات ----------
+
+def last_seq(conn):
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+
+
+def mark_origin(conn, after_seq: int, origin: str):
+    """تعليم تغييرات السجل بعد after_seq بمصدرها (بعد apply_changes في نفس المعاملة)."""
+    conn.execute("UPDATE change_log SET origin = ? WHERE seq > ?", (origin, after_seq))
+
+
+def apply_changes(conn, changes, services_mask=lambda text: 0, owner_id: int = None):
+    """تطبيق دفعة تغييرات من جهاز آخر (أو من الخادم) في المعاملة الحالية.
+
+    الصف الموجود يُستبدل بالقادم (آخر كتابة تصل للخادم هي الباقية). services_mask يحسب
+    قناع الخدمات محلياً (service_tags). بعدها mark_origin حتى لا تُعاد هذه التغييرات لمصدرها.
+    owner_id: الخادم يطبق دفعة جهاز مرتبط بهذا الحساب؛ تُتخطى المستخدمون وكل ما يخص عقارات
+    مالك آخر. بدونه (الجهاز يطبق دفعة الخادم) يُقبل كل شيء.
+    يُرجع {"applied": n, "skipped": n} (المتخطى: صف يشير إلى مالك أو عقار غير موجود، أو غير مسموح).
+    """
+    applier = _Applier(conn, services_mask, owner_id)
+    applied = skipped = 0
+    for change in changes:
+        table, op, key, row = change["table"], change["op"], change["key"], change["row"]
+        if table not in TABLES:
+            raise ValueError(f"جدول غير معروف في المزامنة: {table}")
+        if op == "delete":
+            done = applier.delete(table, key)
+        else:
+            done = getattr(applier, table)(row)
+        if done:
+            applied += 1
+        else:
+            skipped += 1
+    return {"applied": applied, "skipped": skipped}
+
+
+def _unusable_password():
+    # حساب وصل من الخادم: لا يُدخل به على هذا الجهاز (لا توجد كلمة مرور تطابقه)
+    return "!" + secrets.token_hex(16)
+
+
+class _Applier:
+    """كتابة صفوف الدفعة مع حفظ أرقام المالكين والمدن (تتكرر في كل عقارات الدفعة)."""
+
+    def __init__(self, conn, services_mask, owner_id=None):
+        self.conn = conn
+        self.services_mask = services_mask
+        self.owner_id = owner_id
+        self.owners = {}
+        self.cities = {}
+
+    def delete(self, table, key):
+        if self.owner_id is not None:
+            if table == "users":
+                return False
+            if table == "properties":
+                found = self.conn.execute(
+                    "SELECT owner_id FROM properties WHERE sync_uid = ?", (key,)).fetchone()
+            else:
+                found = self.conn.execute(
+                    "SELECT p.owner_id FROM property_images i JOIN properties p ON p.id = i.property_id "
+                    "WHERE i.sync_uid = ?", (key,)).fetchone()
+            if found is not None and found[0] != self.owner_id:
+                return False
+        column = "username" if table == "users" else "sync_uid"
+        self.conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (key,))
+        self.owners.pop(key, None)
+        return True
+
+    def users(self, row):
+        if self.owner_id is not None:
+            return False
+        self.conn.execute(
+            """
+            INSERT INTO users (username, password, role, created_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (username) DO UPDATE SET role = excluded.role
+            """,
+            (row["username"], _unusable_password(), row["role"], row["created_at"]),
+        )
+        return True
+
+    def _owner_id(self, username):
+        owner_id = self.owners.get(username)
+        if owner_id is None:
+            found = self.conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+            if found is None:
+                return None
+            owner_id = self.owners[username] = found[0]
+        return owner_id
+
+    def _city_id(self, row):
+        city_id = self.cities.get(row["city"])
+        if city_id is None:
+            # مدينة أُضيفت في جهاز آخر
+            self.conn.execute(
+                "INSERT INTO cities (name, lat, lon) VALUES (?, ?, ?) ON CONFLICT (name) DO NOTHING",
+                (row["city"], row["city_lat"], row["city_lon"]),
+            )
+            city_id = self.cities[row["city"]] = self.conn.execute(
+                "SELECT id FROM cities WHERE name = ?", (row["city"],)
+            ).fetchone()[0]
+        return city_id
+
+    def properties(self, row):
+        owner_id = self._owner_id(row["owner"])
+        if owner_id is None or self.owner_id not in (None, owner_id):
+            return False
+        # WHERE: عقار موجود لمالك آخر لا يُستبدل
+        cur = self.conn.execute(
+            """
+            INSERT INTO properties
+            (sync_uid, owner_id, city_id, area, area_key, title, description, rent, lat, lon, services,
+             services_mask, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (sync_uid) DO UPDATE SET
+                owner_id = excluded.owner_id, city_id = excluded.city_id, area = excluded.area,
+                area_key = excluded.area_key, title = excluded.title, description = excluded.description,
+                rent = excluded.rent, lat = excluded.lat, lon = excluded.lon, services = excluded.services,
+                services_mask = excluded.services_mask
+            WHERE ? IS NULL OR properties.owner_id = ?
+            """,
+            (row["uid"], owner_id, self._city_id(row), row["area"], normalize_arabic(row["area"]),
+             row["title"], row["description"], row["rent"], row["lat"], row["lon"], row["services"],
+             self.services_mask(row["services"]), row["created_at"], self.owner_id, self.owner_id),
+        )
+        return cur.rowcount > 0
+
+    def property_images(self, row):
+        prop = self.conn.execute(
+            "SELECT id FROM properties WHERE sync_uid = ? AND (? IS NULL OR owner_id = ?)",
+            (row["property"], self.owner_id, self.owner_id),
+        ).fetchone()
+        if prop is None:
+            return False
+        cur = self.conn.execute(
+            """
+            INSERT INTO property_images (sync_uid, property_id, image_path, created_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (sync_uid) DO UPDATE SET
+                property_id = excluded.property_id, image_path = excluded.image_path
+            WHERE ? IS NULL OR property_images.property_id IN (SELECT id FROM properties WHERE owner_id = ?)
+            """,
+            (row["uid"], prop[0], row["image_path"], row["created_at"], self.owner_id, self.owner_id),
+        )
+        return cur.rowcount > 0
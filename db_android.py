@@ -1,8 +1,10 @@
-import sqlite3
 import os
 from pathlib import Path
 import platform
 
+from repository import get_repository
+from sync import SyncClient
+
 # تحديد مسار قاعدة البيانات بناءً على النظام
 def get_db_path():
     system = platform.system().lower()
@@ -19,418 +21,164 @@ def get_db_path():
 
 DB_FILE = get_db_path()
 
+def current_repository():
+    # DB_FILE قابل للتغيير (في القياسات مثلاً)، لذلك نأخذ الـ Repository الخاص بالمسار الحالي
+    return get_repository(DB_FILE)
+
 def get_connection():
-    # التأكد من وجود المجلدات
-    db_dir = os.path.dirname(DB_FILE)
-    if db_dir and not os.path.exists(db_dir):
-        os.makedirs(db_dir, exist_ok=True)
-    
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row  # لجعل النتائج كـ dictionaries
-    return conn
+    return current_repository().get_connection()
+
+def get_cache():
+    return current_repository().cache
 
 def init_db():
-    """إنشاء الجداول الأساسية إذا لم تكن موجودة."""
-    print(f"جاري تهيئة قاعدة البيانات في: {DB_FILE}")
-    
-    with get_connection() as conn:
-        cur = conn.cursor()
-
-        # جدول المستخدمين
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                role TEXT NOT NULL CHECK(role IN ('user', 'owner', 'admin')),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """
-        )
-
-        # جدول المدن
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS cities (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """
-        )
-
-        # جدول العقارات / المنازل
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS properties (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                owner_id INTEGER NOT NULL,
-                city_id INTEGER NOT NULL,
-                area TEXT,
-                title TEXT NOT NULL,
-                description TEXT,
-                rent INTEGER,
-                lat REAL,
-                lon REAL,
-                services TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(owner_id) REFERENCES users(id) ON DELETE CASCADE,
-                FOREIGN KEY(city_id) REFERENCES cities(id) ON DELETE CASCADE
-            )
-            """
-        )
-
-        # جدول للصور (اختياري للمستقبل)
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS property_images (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                property_id INTEGER NOT NULL,
-                image_path TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(property_id) REFERENCES properties(id) ON DELETE CASCADE
-            )
-            """
-        )
-
-        conn.commit()
-
-        # تعبئة المدن الافتراضية إذا كانت فارغة
-        cur.execute("SELECT COUNT(*) FROM cities")
-        count = cur.fetchone()[0]
-        if count == 0:
-            default_cities = [
-                "دمشق", "حلب", "حمص", "حماة", "اللاذقية", "طرطوس",
-                "دير الزور", "الرقة", "الحسكة", "ريف دمشق",
-                "درعا", "القنيطرة", "سويدا", "إدلب"
-            ]
-            cur.executemany(
-                "INSERT INTO cities (name) VALUES (?)",
-                [(c,) for c in default_cities]
-            )
-            print(f"تم إضافة {len(default_cities)} مدينة افتراضية")
-
-        # إنشاء مستخدمين تجريبيين إذا لم يوجدوا
-        cur.execute("SELECT COUNT(*) FROM users")
-        user_count = cur.fetchone()[0]
-        if user_count == 0:
-            demo_users = [
-                ("user1", "123456", "user"),
-                ("owner1", "123456", "owner"),
-            ]
-            cur.executemany(
-                "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
-                demo_users,
-            )
-            print("تم إنشاء المستخدمين التجريبيين: user1/123456 و owner1/123456")
-
-        conn.commit()
-    
-    print("تم تهيئة قاعدة البيانات بنجاح!")
+    """تطبيق خطوات الترحيل الناقصة فقط؛ عند التشغيل الدافئ لا يُنفذ أي DDL."""
+    applied = current_repository().init_db()
+    if applied:
+        print(f"تم تهيئة قاعدة البيانات في: {DB_FILE} ({applied} خطوة ترحيل)")
+    return applied
 
 def create_user(username: str, password: str, role: str):
-    with get_connection() as conn:
-        cur = conn.cursor()
-        try:
-            cur.execute(
-                "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
-                (username, password, role),
-            )
-            conn.commit()
-            return cur.lastrowid
-        except sqlite3.IntegrityError:
-            raise Exception("اسم المستخدم موجود مسبقاً")
+    return current_repository().create_user(username, password, role)
 
 def get_user_by_credentials(username: str, password: str):
-    with get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT id, username, role FROM users WHERE username=? AND password=?",
-            (username, password),
-        )
-        row = cur.fetchone()
-        if row:
-            return {"id": row[0], "username": row[1], "role": row[2]}
-        return None
+    return current_repository().get_user_by_credentials(username, password)
+
+def get_user_by_username(username: str):
+    return current_repository().get_user_by_username(username)
 
 def get_user_by_id(user_id: int):
-    with get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT id, username, role FROM users WHERE id=?",
-            (user_id,)
-        )
-        row = cur.fetchone()
-        if row:
-            return {"id": row[0], "username": row[1], "role": row[2]}
-        return None
+    return current_repository().get_user_by_id(user_id)
 
 def get_cities():
-    with get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT id, name FROM cities ORDER BY name")
-        return [{"id": r[0], "name": r[1]} for r in cur.fetchall()]
+    return current_repository().get_cities()
 
 def get_city_by_id(city_id: int):
-    with get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT id, name FROM cities WHERE id=?", (city_id,))
-        r = cur.fetchone()
-        if r:
-            return {"id": r[0], "name": r[1]}
-        return None
+    return current_repository().get_city_by_id(city_id)
 
 def add_property(owner_id: int, city_id: int, area: str, title: str, description: str,
                  rent: int, lat: float, lon: float, services: str):
-    with get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO properties (owner_id, city_id, area, title, description, rent, lat, lon, services)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (owner_id, city_id, area, title, description, rent, lat, lon, services),
-        )
-        conn.commit()
-        return cur.lastrowid
+    return current_repository().add_property(
+        owner_id, city_id, area, title, description, rent, lat, lon, services
+    )
 
 def update_property(property_id: int, **kwargs):
-    """تحديث بيانات عقار"""
-    allowed_fields = ['title', 'area', 'description', 'rent', 'lat', 'lon', 'services']
-    updates = {k: v for k, v in kwargs.items() if k in allowed_fields and v is not None}
-    
-    if not updates:
-        return False
-        
-    set_clause = ", ".join([f"{k}=?" for k in updates.keys()])
-    values = list(updates.values())
-    values.append(property_id)
-    
-    with get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute(f"UPDATE properties SET {set_clause} WHERE id=?", values)
-        conn.commit()
-        return cur.rowcount > 0
+    """تحديث بيانات عقار (الحقول بقيمة None تُترك كما هي)"""
+    updates = {k: v for k, v in kwargs.items() if v is not None}
+    return current_repository().update_property(property_id, **updates)
 
 def delete_property(property_id: int, owner_id: int):
     """حذف عقار (المالك يمكنه حذف عقاره فقط)"""
-    with get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("DELETE FROM properties WHERE id=? AND owner_id=?", (property_id, owner_id))
-        conn.commit()
-        return cur.rowcount > 0
+    return current_repository().delete_property(property_id, owner_id)
 
 def get_properties_by_city(city_id: int):
-    with get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT p.id, p.title, p.area, p.description, p.rent, p.lat, p.lon, p.services,
-                   u.username, u.id as owner_id
-            FROM properties p
-            JOIN users u ON p.owner_id = u.id
-            WHERE p.city_id=?
-            ORDER BY p.created_at DESC
-            """,
-            (city_id,),
-        )
-        res = []
-        for r in cur.fetchall():
-            res.append(
-                {
-                    "id": r[0],
-                    "title": r[1],
-                    "area": r[2],
-                    "description": r[3],
-                    "rent": r[4],
-                    "lat": r[5],
-                    "lon": r[6],
-                    "services": r[7],
-                    "owner_username": r[8],
-                    "owner_id": r[9],
-                }
-            )
-        return res
+    return current_repository().get_properties_by_city(city_id)
 
 def get_properties_by_owner(owner_id: int):
-    with get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT p.id, p.title, p.area, p.description, p.rent, p.lat, p.lon, p.services, p.city_id
-            FROM properties p
-            WHERE p.owner_id=?
-            ORDER BY p.created_at DESC
-            """,
-            (owner_id,),
-        )
-        res = []
-        for r in cur.fetchall():
-            res.append(
-                {
-                    "id": r[0],
-                    "title": r[1],
-                    "area": r[2],
-                    "description": r[3],
-                    "rent": r[4],
-                    "lat": r[5],
-                    "lon": r[6],
-                    "services": r[7],
-                    "city_id": r[8],
-                }
-            )
-        return res
+    return current_repository().get_properties_by_owner(owner_id)
 
 def get_property_by_id(property_id: int):
-    with get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT p.id, p.title, p.area, p.description, p.rent, p.lat, p.lon, p.services,
-                   p.owner_id, p.city_id, u.username as owner_username
-            FROM properties p
-            JOIN users u ON p.owner_id = u.id
-            WHERE p.id=?
-            """,
-            (property_id,),
-        )
-        r = cur.fetchone()
-        if r:
-            return {
-                "id": r[0],
-                "title": r[1],
-                "area": r[2],
-                "description": r[3],
-                "rent": r[4],
-                "lat": r[5],
-                "lon": r[6],
-                "services": r[7],
-                "owner_id": r[8],
-                "city_id": r[9],
-                "owner_username": r[10],
-            }
-        return None
-
-def search_properties(city_id: int = None, area: str = None, max_rent: int = None):
+    return current_repository().get_property_by_id(property_id)
+
+def search_properties(city_id: int = None, area: str = None, max_rent: int = None,
+                      min_rent: int = None):
     """بحث في العقارات"""
-    query = """
-        SELECT p.id, p.title, p.area, p.description, p.rent, p.lat, p.lon, p.services,
-               u.username, c.name as city_name
-        FROM properties p
-        JOIN users u ON p.owner_id = u.id
-        JOIN cities c ON p.city_id = c.id
-        WHERE 1=1
-    """
-    params = []
-    
-    if city_id:
-        query += " AND p.city_id = ?"
-        params.append(city_id)
-    
-    if area:
-        query += " AND p.area LIKE ?"
-        params.append(f"%{area}%")
-    
-    if max_rent:
-        query += " AND p.rent <= ?"
-        params.append(max_rent)
-    
-    query += " ORDER BY p.created_at DESC"
-    
-    with get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute(query, params)
-        res = []
-        for r in cur.fetchall():
-            res.append(
-                {
-                    "id": r[0],
-                    "title": r[1],
-                    "area": r[2],
-                    "description": r[3],
-                    "rent": r[4],
-                    "lat": r[5],
-                    "lon": r[6],
-                    "services": r[7],
-                    "owner_username": r[8],
-                    "city_name": r[9],
-                }
-            )
-        return res
+    return current_repository().search_properties(city_id, area, max_rent, min_rent)
+
+def search_properties_text(text: str, city_id: int = None, limit: int = 50):
+    """بحث نصي (FTS5) في العنوان والوصف والخدمات والمنطقة، مرتب حسب الصلة"""
+    return current_repository().search_properties_text(text, city_id=city_id, limit=limit)
+
+def properties_in_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float, limit: int = 200):
+    """العقارات داخل مستطيل إحداثيات (منطقة العرض في الخريطة) عبر فهرس R*Tree"""
+    return current_repository().properties_in_bbox(min_lat, min_lon, max_lat, max_lon, limit=limit)
+
+def clusters_in_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float, zoom: float):
+    """تجمعات العقارات (المركز والعدد) لمنطقة العرض ومستوى التكبير الحاليين"""
+    return current_repository().clusters_in_bbox(min_lat, min_lon, max_lat, max_lon, zoom)
+
+def nearest_properties(lat: float, lon: float, k: int = 10, min_rent: int = None,
+                       max_rent: int = None, area: str = None):
+    """أقرب k عقار لنقطة على الخريطة، مع تصفية اختيارية بالإيجار والمنطقة"""
+    return current_repository().nearest_properties(
+        lat, lon, k=k, min_rent=min_rent, max_rent=max_rent, area=area
+    )
+
+def search_listings(city_id: int = None, areas=None, min_rent: int = None, max_rent: int = None,
+                    services=None, has_location: bool = False, sort: str = "newest",
+                    near: tuple = None, limit: int = 20, after: tuple = None):
+    """بحث مركب (مناطق متعددة، مجال إيجار، خدمات، موقع) مع ترتيب وصفحة والعدد الكلي"""
+    return current_repository().search_listings(
+        city_id, areas, min_rent, max_rent, services, has_location, sort, near, limit, after
+    )
 
 def get_all_areas_by_city(city_id: int):
     """جلب جميع المناطق المتاحة لمدينة معينة"""
-    with get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT DISTINCT area FROM properties 
-            WHERE city_id = ? AND area IS NOT NULL AND area != ''
-            ORDER BY area
-        """, (city_id,))
-        return [row[0] for row in cur.fetchall()]
-
-def get_properties_by_city_and_area(city_id: int, area: str):
-    """جلب العقارات بناءً على المدينة والمنطقة"""
-    with get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT p.id, p.title, p.area, p.description, p.rent, p.lat, p.lon, p.services,
-                   u.username as owner_username, u.id as owner_id
-            FROM properties p
-            JOIN users u ON p.owner_id = u.id
-            WHERE p.city_id = ? AND p.area = ?
-            ORDER BY p.created_at DESC
-        """, (city_id, area))
-        properties = []
-        for row in cur.fetchall():
-            properties.append({
-                "id": row[0],
-                "title": row[1],
-                "area": row[2],
-                "description": row[3],
-                "rent": row[4],
-                "lat": row[5],
-                "lon": row[6],
-                "services": row[7],
-                "owner_username": row[8],
-                "owner_id": row[9]
-            })
-        return properties
+    return current_repository().get_all_areas_by_city(city_id)
+
+def get_area_facets(city_id: int):
+    """عدد العقارات والإيجارات (الأقل والوسيط والأعلى وتوزيعها) لكل منطقة في مدينة"""
+    return current_repository().get_area_facets(city_id)
+
+def get_services():
+    """قائمة الخدمات المعروفة (مدرسة، مولدة، مواصلات...) لخيارات البحث"""
+    return current_repository().get_services()
+
+def add_service(name: str, synonyms=()):
+    """إضافة خدمة جديدة بمرادفاتها وإعادة حساب خدمات العقارات الموجودة"""
+    return current_repository().add_service(name, synonyms)
+
+def save_search(user_id: int, city_id: int, area: str = None, min_rent: int = None, max_rent: int = None,
+                services=None, has_location: bool = False, name: str = None):
+    """حفظ بحث للمستخدم مع تنبيه عند إضافة عقار يطابقه"""
+    return current_repository().save_search(
+        user_id, city_id, area, min_rent, max_rent, services, has_location, name
+    )
+
+def get_saved_searches(user_id: int):
+    """عمليات البحث المحفوظة للمستخدم (الأحدث أولاً)"""
+    return current_repository().get_saved_searches(user_id)
+
+def delete_saved_search(search_id: int, user_id: int):
+    """حذف بحث محفوظ مع تنبيهاته"""
+    return current_repository().delete_saved_search(search_id, user_id)
+
+def get_notifications(user_id: int, unread_only: bool = False, limit: int = 50):
+    """أحدث تنبيهات المستخدم بالعقارات المطابقة لعمليات بحثه المحفوظة"""
+    return current_repository().get_notifications(user_id, unread_only, limit)
+
+def count_unread_notifications(user_id: int):
+    """عدد التنبيهات غير المقروءة"""
+    return current_repository().count_unread_notifications(user_id)
+
+def mark_notifications_read(user_id: int, up_to_id: int = None):
+    """تعليم التنبيهات مقروءة"""
+    return current_repository().mark_notifications_read(user_id, up_to_id)
+
+def sync_with_server(url: str, token: str = None, batch_size: int = 500):
+    """إرسال التغييرات المحلية إلى خادم المزامنة ثم استقبال تغييراته (sync.py)"""
+    return SyncClient(current_repository(), url, token, batch_size).sync()
+
+def get_properties_by_city_and_area(city_id: int, area: str, limit: int = None, after: tuple = None):
+    """جلب العقارات بناءً على المدينة والمنطقة (صفحة واحدة مع limit، انظر next_page_cursor)"""
+    return current_repository().get_properties_by_city_and_area(city_id, area, limit=limit, after=after)
+
+def next_page_cursor(page: list, limit: int):
+    """مؤشر الصفحة التالية، أو None إذا كانت هذه الصفحة الأخيرة."""
+    return current_repository().next_page_cursor(page, limit)
+
+def enable_profiling(slow_ms: float = 100.0):
+    """قياس زمن الاستعلامات وتسجيل ما يتجاوز slow_ms؛ النتائج في check_db_status()["profiling"]"""
+    return current_repository().enable_profiling(slow_ms)
+
+def disable_profiling():
+    current_repository().disable_profiling()
 
 # دالة مساعدة لفحص حالة قاعدة البيانات
 def check_db_status():
     """فحص حالة قاعدة البيانات"""
-    try:
-        with get_connection() as conn:
-            cur = conn.cursor()
-            
-            # فحص الجداول
-            cur.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            tables = [row[0] for row in cur.fetchall()]
-            
-            # فحص عدد المستخدمين
-            cur.execute("SELECT COUNT(*) FROM users")
-            user_count = cur.fetchone()[0]
-            
-            # فحص عدد العقارات
-            cur.execute("SELECT COUNT(*) FROM properties")
-            property_count = cur.fetchone()[0]
-            
-            return {
-                "db_file": DB_FILE,
-                "tables": tables,
-                "user_count": user_count,
-                "property_count": property_count,
-                "status": "healthy"
-            }
-    except Exception as e:
-        return {
-            "db_file": DB_FILE,
-            "error": str(e),
-            "status": "error"
-        }
+    return current_repository().check_db_status()
 
 # تهيئة قاعدة البيانات تلقائياً عند الاستيراد
 if __name__ != "__main__":
-    init_db()
\ No newline at end of file
+    init_db()
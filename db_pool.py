@@ -0,0 +1,111 @@
+import sqlite3
+import threading
+import os
+
+# إعدادات PRAGMA الافتراضية، تُطبق مرة واحدة عند فتح كل اتصال
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -8000,      # بالكيلوبايت (حوالي 8MB)
+    "mmap_size": 67108864,    # 64MB
+    "busy_timeout": 5000,     # بالميلي ثانية
+}
+
+
+class PooledConnection(sqlite3.Connection):
+    """اتصال عادي يقبل weakref (read_cache.ReadCache يحفظ حالة لكل اتصال دون إبقائه مفتوحاً)."""
+
+
+class ConnectionPool:
+    """اتصال SQLite طويل العمر لكل خيط (thread) بدلاً من اتصال جديد لكل استعلام."""
+
+    def __init__(self, db_path: str, pragmas: dict = None, row_factory=None):
+        self.db_path = db_path
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.row_factory = row_factory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._generation = 0
+        self.connects = 0
+        self.checkouts = 0
+
+    def _open(self):
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+
+        # check_same_thread=False فقط ليتمكن _prune_dead من إغلاق اتصالات الخيوط المنتهية؛
+        # كل اتصال يبقى مستخدماً من خيط واحد
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, factory=PooledConnection)
+        if self.row_factory is not None:
+            conn.row_factory = self.row_factory
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+
+        with self._lock:
+            self._prune_dead()
+            self._connections.append((threading.current_thread(), conn))
+            self.connects += 1
+        return conn
+
+    def _prune_dead(self):
+        # إغلاق اتصالات الخيوط المنتهية (مثل threading.Timer) حتى لا تتراكم
+        alive = []
+        for thread, conn in self._connections:
+            if thread.is_alive():
+                alive.append((thread, conn))
+            else:
+                conn.close()
+        self._connections = alive
+
+    def get_connection(self):
+        """إرجاع اتصال الخيط الحالي، وفتحه عند أول استخدام فقط."""
+        self.checkouts += 1
+        cached = getattr(self._local, "conn", None)
+        if cached is not None and cached[0] == self._generation:
+            return cached[1]
+        conn = self._open()
+        self._local.conn = (self._generation, conn)
+        return conn
+
+    def close_all(self):
+        """إغلاق جميع الاتصالات المفتوحة (عند إنهاء التطبيق أو في الاختبارات)."""
+        with self._lock:
+            for _, conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections.clear()
+            self._generation += 1
+
+    def stats(self):
+        return {
+            "db_file": self.db_path,
+            "connects": self.connects,
+            "checkouts": self.checkouts,
+            "open_connections": len(self._connections),
+            "pragmas": dict(self.pragmas),
+        }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str, pragmas: dict = None, row_factory=None):
+    """مجمع الاتصالات المشترك لملف قاعدة بيانات معين (يُنشأ مرة واحدة)."""
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(db_path, pragmas=pragmas, row_factory=row_factory)
+            _pools[key] = pool
+        return pool
+
+
+def close_all_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close_all()
@@ -0,0 +1,157 @@
+"""تصدير العقارات إلى CSV أو JSONL أو Parquet.
+
+    python export.py search --city دمشق --area المزة --max-rent 500000 -o damascus.csv
+    python export.py owner owner1 --format jsonl -o owner1.jsonl
+
+الصفوف تُقرأ من مؤشر SQLite دفعةً دفعة (Repository.iter_search_properties و
+iter_properties_by_owner) وتُكتب مباشرة، فالذاكرة ثابتة مهما كان عدد الصفوف.
+Parquet يحتاج مكتبة pyarrow (اختيارية) ويُكتب مجموعة صفوف (row group) لكل دفعة.
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from itertools import islice
+
+from arabic import normalize_arabic
+from repository import get_repository, SearchResult, OwnerListing
+
+# pyarrow اختيارية: بدونها يبقى CSV وJSONL متاحين
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+FORMATS = ("csv", "jsonl", "parquet")
+# عدد الصفوف في كل row group في Parquet (وهو أقصى ما يُحمل في الذاكرة)
+PARQUET_ROW_GROUP = 50000
+# أنواع الأعمدة في Parquet؛ باقي الأعمدة نصوص
+_INT_COLUMNS = {"id", "rent", "city_id", "owner_id"}
+_FLOAT_COLUMNS = {"lat", "lon"}
+
+
+def write_csv(records, fields, out):
+    writer = csv.writer(out)
+    writer.writerow(fields)
+    count = 0
+    for count, record in enumerate(records, 1):
+        writer.writerow(record)
+    return count
+
+
+def write_jsonl(records, fields, out):
+    count = 0
+    for count, record in enumerate(records, 1):
+        out.write(json.dumps(dict(zip(fields, record)), ensure_ascii=False))
+        out.write("\n")
+    return count
+
+
+def _parquet_type(field):
+    if field in _INT_COLUMNS:
+        return pa.int64()
+    if field in _FLOAT_COLUMNS:
+        return pa.float64()
+    return pa.string()
+
+
+def write_parquet(records, fields, path, row_group: int = PARQUET_ROW_GROUP):
+    if pq is None:
+        raise RuntimeError("تصدير Parquet يحتاج مكتبة pyarrow: pip install pyarrow")
+    schema = pa.schema([(f, _parquet_type(f)) for f in fields])
+    records = iter(records)
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        while True:
+            batch = list(islice(records, row_group))
+            if not batch:
+                break
+            columns = [pa.array(column, type=t) for column, t in zip(zip(*batch), schema.types)]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+            count += len(batch)
+    return count
+
+
+def export_records(records, fields, fmt: str, path: str = None):
+    """كتابة السجلات بالتنسيق fmt إلى path (أو stdout لـ CSV وJSONL)؛ يُرجع عدد الصفوف."""
+    if fmt == "parquet":
+        if not path:
+            raise ValueError("تصدير Parquet يحتاج مسار ملف")
+        return write_parquet(records, fields, path)
+    write = write_csv if fmt == "csv" else write_jsonl
+    if not path:
+        return write(records, fields, sys.stdout)
+    with open(path, "w", encoding="utf-8", newline="") as out:
+        return write(records, fields, out)
+
+
+def export_search(db_path: str, fmt: str, path: str = None, city_id: int = None, area: str = None,
+                  min_rent: int = None, max_rent: int = None):
+    """تصدير نتائج search_properties بنفس فلاترها."""
+    records = get_repository(db_path).iter_search_properties(city_id, area, max_rent, min_rent)
+    return export_records(records, SearchResult._fields, fmt, path)
+
+
+def export_owner(db_path: str, owner_id: int, fmt: str, path: str = None):
+    """تصدير كل عقارات مالك (نفس حقول get_properties_by_owner)."""
+    records = get_repository(db_path).iter_properties_by_owner(owner_id)
+    return export_records(records, OwnerListing._fields, fmt, path)
+
+
+def _guess_format(path):
+    for fmt in FORMATS:
+        if path and path.endswith("." + fmt):
+            return fmt
+    return "csv"
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="export.py")
+    parser.add_argument("--db", default="city_mover.db")
+    parser.add_argument("--format", choices=FORMATS, help="حسب امتداد الملف افتراضياً، وإلا csv")
+    parser.add_argument("-o", "--output", help="ملف الإخراج (stdout افتراضياً لـ CSV وJSONL)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    search = sub.add_parser("search", help="العقارات حسب المدينة والمنطقة والإيجار")
+    search.add_argument("--city", help="اسم المدينة")
+    search.add_argument("--area")
+    search.add_argument("--min-rent", type=int)
+    search.add_argument("--max-rent", type=int)
+
+    owner = sub.add_parser("owner", help="كل عقارات مالك")
+    owner.add_argument("username")
+
+    args = parser.parse_args(argv)
+    fmt = args.format or _guess_format(args.output)
+    if fmt == "parquet" and (pq is None or not args.output):
+        print("تصدير Parquet يحتاج مكتبة pyarrow ومسار ملف (-o)", file=sys.stderr)
+        return 1
+    repo = get_repository(args.db)
+    repo.init_db()
+    started = time.perf_counter()
+
+    if args.command == "search":
+        city_id = None
+        if args.city:
+            matches = [c for c in repo.get_cities()
+                       if normalize_arabic(c["name"]) == normalize_arabic(args.city)]
+            if not matches:
+                print(f"المدينة غير موجودة: {args.city}", file=sys.stderr)
+                return 1
+            city_id = matches[0]["id"]
+        count = export_search(args.db, fmt, args.output, city_id, args.area, args.min_rent, args.max_rent)
+    else:
+        user = repo.get_user_by_username(args.username)
+        if user is None:
+            print(f"المستخدم غير موجود: {args.username}", file=sys.stderr)
+            return 1
+        count = export_owner(args.db, user["id"], fmt, args.output)
+
+    print(f"تم تصدير {count} عقار في {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,178 @@
+"""ملخص العقارات لكل منطقة: العدد وأقل وأعلى إيجار وتوزيع الإيجارات على فئات.
+
+الملخص في جدولين تحدّثهما المشغلات مع كل إضافة أو تعديل أو حذف في properties، فقراءة
+ملخص مدينة كاملة مسح لمجال من المفتاح الأساسي (city_id, ...) بدلاً من GROUP BY على
+كل عقاراتها مع كل تغيير في القائمة المنسدلة:
+
+    area_facets     (city_id, area_key) -> area, listings, rent_min, rent_max
+    rent_histogram  (city_id, area_key, bucket) -> count
+
+العقارات بدون منطقة (area NULL في الملفات القديمة) تُجمع تحت area_key = '' و area = ''.
+"""
+from records import record_type
+
+# حدود فئات الإيجار (ل.س): الفئة i من RENT_BUCKETS[i] حتى ما قبل RENT_BUCKETS[i + 1]، والأخيرة مفتوحة
+RENT_BUCKETS = (0, 200000, 400000, 600000, 800000, 1000000, 1500000, 2000000, 3000000)
+
+INSERT_TRIGGER = "area_facets_ai"
+
+# histogram: عدد العقارات في كل فئة بترتيب RENT_BUCKETS؛ rent_median تقريبي (انظر _median)
+AreaFacet = record_type("AreaFacet", ("area", "area_key", "listings", "rent_min", "rent_median",
+                                      "rent_max", "histogram"))
+
+
+def _bucket_sql(rent):
+    cases = " ".join(f"WHEN {rent} < {high} THEN {i}" for i, high in enumerate(RENT_BUCKETS[1:]))
+    return f"CASE {cases} ELSE {len(RENT_BUCKETS) - 1} END"
+
+
+# الإيجار الأقل والأعلى عند الإضافة: MIN(x, NULL) في SQLite تعطي NULL، فنأخذ الموجود منهما
+_MERGE_RANGE = """
+    rent_min = COALESCE(MIN(rent_min, excluded.rent_min), rent_min, excluded.rent_min),
+    rent_max = COALESCE(MAX(rent_max, excluded.rent_max), rent_max, excluded.rent_max)
+"""
+
+
+def _add_row_sql(row):
+    return f"""
+        INSERT INTO area_facets (city_id, area_key, area, listings, rent_min, rent_max)
+        VALUES ({row}.city_id, {row}.area_key, COALESCE({row}.area, ''), 1, {row}.rent, {row}.rent)
+        ON CONFLICT (city_id, area_key) DO UPDATE SET
+            area = MIN(area, excluded.area),
+            listings = listings + 1,
+            {_MERGE_RANGE};
+        INSERT INTO rent_histogram (city_id, area_key, bucket, count)
+        SELECT {row}.city_id, {row}.area_key, {_bucket_sql(f"{row}.rent")}, 1
+        WHERE {row}.rent IS NOT NULL
+        ON CONFLICT (city_id, area_key, bucket) DO UPDATE SET count = count + 1;
+    """
+
+
+def _remove_row_sql(row):
+    # أقل وأعلى إيجار يُعاد حسابهما فقط عند حذف أحدهما، من عقارات المنطقة نفسها
+    # (فهرس city_id, area_key)، والعقار المحذوف لم يعد في الجدول
+    area = f"city_id = {row}.city_id AND area_key = {row}.area_key"
+    return f"""
+        UPDATE area_facets SET listings = listings - 1 WHERE {area};
+        DELETE FROM area_facets WHERE {area} AND listings <= 0;
+        UPDATE area_facets SET
+            rent_min = (SELECT MIN(rent) FROM properties WHERE {area}),
+            rent_max = (SELECT MAX(rent) FROM properties WHERE {area})
+        WHERE {area} AND {row}.rent IN (rent_min, rent_max);
+        UPDATE rent_histogram SET count = count - 1
+        WHERE {area} AND bucket = {_bucket_sql(f"{row}.rent")} AND {row}.rent IS NOT NULL;
+        DELETE FROM rent_histogram WHERE {area} AND count <= 0;
+    """
+
+
+def create_facet_tables(conn):
+    """إنشاء جداول الملخص ومشغلاتها، وتعبئتها من العقارات الموجودة."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS area_facets (
+            city_id INTEGER NOT NULL,
+            area_key TEXT NOT NULL,
+            area TEXT NOT NULL,
+            listings INTEGER NOT NULL,
+            rent_min INTEGER,
+            rent_max INTEGER,
+            PRIMARY KEY (city_id, area_key)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rent_histogram (
+            city_id INTEGER NOT NULL,
+            area_key TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (city_id, area_key, bucket)
+        ) WITHOUT ROWID
+    """)
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS area_facets_ai AFTER INSERT ON properties BEGIN
+            {_add_row_sql("new")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS area_facets_ad AFTER DELETE ON properties BEGIN
+            {_remove_row_sql("old")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS area_facets_au
+        AFTER UPDATE OF city_id, area, area_key, rent ON properties BEGIN
+            {_remove_row_sql("old")}
+            {_add_row_sql("new")}
+        END
+    """)
+    rebuild_facets(conn)
+
+
+def rebuild_facets(conn):
+    """إعادة حساب الملخص كاملاً من جدول properties."""
+    conn.execute("DELETE FROM area_facets")
+    conn.execute("DELETE FROM rent_histogram")
+    add_rows_after(conn, 0)
+
+
+def add_rows_after(conn, after_id: int):
+    """إضافة العقارات ذات id > after_id إلى الملخص، مجمّعة حسب المنطقة (استعلامان لكل دفعة)."""
+    conn.execute(f"""
+        INSERT INTO area_facets (city_id, area_key, area, listings, rent_min, rent_max)
+        SELECT city_id, area_key, COALESCE(MIN(area), ''), COUNT(*), MIN(rent), MAX(rent)
+        FROM properties
+        WHERE id > ?
+        GROUP BY city_id, area_key
+        ON CONFLICT (city_id, area_key) DO UPDATE SET
+            area = MIN(area, excluded.area),
+            listings = listings + excluded.listings,
+            {_MERGE_RANGE}
+    """, (after_id,))
+    conn.execute(f"""
+        INSERT INTO rent_histogram (city_id, area_key, bucket, count)
+        SELECT city_id, area_key, {_bucket_sql("rent")}, COUNT(*)
+        FROM properties
+        WHERE id > ? AND rent IS NOT NULL
+        GROUP BY 1, 2, 3
+        ON CONFLICT (city_id, area_key, bucket) DO UPDATE SET count = count + excluded.count
+    """, (after_id,))
+
+
+def _median(histogram, rent_min, rent_max):
+    # الوسيط داخل الفئة التي يقع فيها نصف العقارات، بافتراض توزيع متساوٍ داخلها؛
+    # الخطأ أقل من عرض الفئة، ولا يخرج عن [rent_min, rent_max]
+    half = sum(histogram) / 2
+    if not half:
+        return None
+    before = 0
+    for i, count in enumerate(histogram):
+        if count and before + count >= half:
+            low = max(RENT_BUCKETS[i], rent_min)
+            high = min(RENT_BUCKETS[i + 1], rent_max) if i + 1 < len(RENT_BUCKETS) else rent_max
+            return int(low + (high - low) * (half - before) / count)
+        before += count
+    return rent_max
+
+
+def city_facets(conn, city_id: int):
+    """ملخص كل مناطق مدينة (AreaFacet) مرتبة حسب الاسم الموحد؛ استعلامان على المفتاح الأساسي."""
+    histograms = {}
+    for area_key, bucket, count in conn.execute(
+        "SELECT area_key, bucket, count FROM rent_histogram WHERE city_id = ?", (city_id,)
+    ):
+        histograms.setdefault(area_key, [0] * len(RENT_BUCKETS))[bucket] = count
+
+    empty = (0,) * len(RENT_BUCKETS)
+    facets = []
+    for area_key, area, listings, rent_min, rent_max in conn.execute(
+        """
+        SELECT area_key, area, listings, rent_min, rent_max FROM area_facets
+        WHERE city_id = ? AND area_key != ''
+        ORDER BY area_key
+        """,
+        (city_id,),
+    ):
+        histogram = tuple(histograms.get(area_key, empty))
+        facets.append(AreaFacet((area, area_key, listings, rent_min,
+                                 _median(histogram, rent_min, rent_max), rent_max, histogram)))
+    return facets
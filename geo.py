@@ -0,0 +1,239 @@
+import heapq
+import math
+import sqlite3
+from array import array
+
+from records import record_type
+
+# numpy اختياري: يُستخدم لحساب المسافات دفعة واحدة إذا كان مثبتاً
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+# فهرس R*Tree لإحداثيات العقارات: كل عقار نقطة (min = max)، ويُحدَّث بالمشغلات
+_RTREE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS properties_rtree USING rtree(
+        id, min_lat, max_lat, min_lon, max_lon
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS properties_rtree_ai AFTER INSERT ON properties
+    WHEN new.lat IS NOT NULL AND new.lon IS NOT NULL BEGIN
+        INSERT INTO properties_rtree VALUES (new.id, new.lat, new.lat, new.lon, new.lon);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS properties_rtree_au AFTER UPDATE OF lat, lon ON properties BEGIN
+        DELETE FROM properties_rtree WHERE id = old.id;
+        INSERT INTO properties_rtree
+        SELECT new.id, new.lat, new.lat, new.lon, new.lon
+        WHERE new.lat IS NOT NULL AND new.lon IS NOT NULL;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS properties_rtree_ad AFTER DELETE ON properties BEGIN
+        DELETE FROM properties_rtree WHERE id = old.id;
+    END
+    """,
+    """
+    INSERT OR REPLACE INTO properties_rtree
+    SELECT id, lat, lat, lon, lon FROM properties
+    WHERE lat IS NOT NULL AND lon IS NOT NULL
+    """,
+]
+
+INSERT_TRIGGER = "properties_rtree_ai"
+
+# بديل عند بناء SQLite بدون R*Tree: فهرس عادي يكفي لتضييق خط العرض
+_FALLBACK_INDEX = "CREATE INDEX IF NOT EXISTS idx_properties_lat_lon ON properties(lat, lon)"
+
+
+def create_spatial_index(conn):
+    """إنشاء فهرس R*Tree للإحداثيات، أو فهرس (lat, lon) إذا لم يتوفر R*Tree."""
+    try:
+        for sql in _RTREE_DDL:
+            conn.execute(sql)
+    except sqlite3.OperationalError as e:
+        if "rtree" not in str(e):
+            raise
+        conn.execute(_FALLBACK_INDEX)
+        return False
+    return True
+
+
+def index_rows_after(conn, after_id: int):
+    """إضافة إحداثيات العقارات ذات id > after_id إلى R*Tree دفعة واحدة."""
+    conn.execute(
+        "INSERT INTO properties_rtree SELECT id, lat, lat, lon, lon FROM properties "
+        "WHERE id > ? AND lat IS NOT NULL AND lon IS NOT NULL",
+        (after_id,),
+    )
+
+
+def has_spatial_index(conn):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='properties_rtree'"
+    ).fetchone()
+    return row is not None
+
+
+_MARKER_COLUMNS = "p.id, p.title, p.area, p.rent, p.lat, p.lon, p.city_id"
+_LISTING_COLUMNS = """p.id, p.title, p.area, p.description, p.rent, p.lat, p.lon, p.services,
+               u.username, u.id, p.city_id"""
+
+MARKER_FIELDS = ("id", "title", "area", "rent", "lat", "lon", "city_id")
+Marker = record_type("Marker", MARKER_FIELDS)
+# عقار قريب: أعمدة _LISTING_COLUMNS ثم المسافة
+NearbyListing = record_type("NearbyListing", (
+    "id", "title", "area", "description", "rent", "lat", "lon", "services",
+    "owner_username", "owner_id", "city_id", "distance_km",
+))
+
+
+def _select_in_bbox(conn, columns: str, bbox: tuple, joins: str = "", filters: str = "",
+                    params: tuple = (), limit: int = None):
+    # R*Tree يخزن الإحداثيات بدقة 32-bit مقربة للخارج، لذلك نعيد التحقق من
+    # القيم الأصلية في جدول properties
+    min_lat, min_lon, max_lat, max_lon = bbox
+    if has_spatial_index(conn):
+        query = f"""
+            SELECT {columns}
+            FROM properties_rtree r
+            JOIN properties p ON p.id = r.id
+            {joins}
+            WHERE r.min_lat >= ? AND r.max_lat <= ? AND r.min_lon >= ? AND r.max_lon <= ?
+              AND p.lat BETWEEN ? AND ? AND p.lon BETWEEN ? AND ?
+        """
+        args = [min_lat, max_lat, min_lon, max_lon, min_lat, max_lat, min_lon, max_lon]
+    else:
+        query = f"""
+            SELECT {columns}
+            FROM properties p
+            {joins}
+            WHERE p.lat BETWEEN ? AND ? AND p.lon BETWEEN ? AND ?
+        """
+        args = [min_lat, max_lat, min_lon, max_lon]
+    query += filters
+    args.extend(params)
+    if limit:
+        query += " LIMIT ?"
+        args.append(limit)
+    return conn.execute(query, args).fetchall()
+
+
+def properties_in_bbox(conn, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                       limit: int = 200):
+    """العقارات داخل مستطيل الإحداثيات (حقول خفيفة تكفي لرسم العلامات على الخريطة)."""
+    rows = _select_in_bbox(conn, _MARKER_COLUMNS, (min_lat, min_lon, max_lat, max_lon), limit=limit)
+    return list(map(Marker, rows))
+
+
+def haversine_km(lat: float, lon: float, lats, lons):
+    """المسافة بالكيلومتر من نقطة واحدة إلى مصفوفتي إحداثيات (array('d') أو list)."""
+    lat1 = math.radians(lat)
+    if np is not None:
+        lat2 = np.radians(np.frombuffer(lats, dtype=np.float64) if isinstance(lats, array) else lats)
+        lon2 = np.radians(np.frombuffer(lons, dtype=np.float64) if isinstance(lons, array) else lons)
+        a = (np.sin((lat2 - lat1) / 2) ** 2
+             + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - math.radians(lon)) / 2) ** 2)
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+    lon1 = math.radians(lon)
+    cos_lat1 = math.cos(lat1)
+    sin, cos, radians = math.sin, math.cos, math.radians
+    return [
+        2 * EARTH_RADIUS_KM * math.asin(math.sqrt(
+            sin((radians(la) - lat1) / 2) ** 2
+            + cos_lat1 * cos(radians(la)) * sin((radians(lo) - lon1) / 2) ** 2
+        ))
+        for la, lo in zip(lats, lons)
+    ]
+
+
+def bbox_around(lat: float, lon: float, radius_km: float):
+    """مربع حول نقطة بنصف قطر radius_km؛ يُرجع (min_lat, min_lon, max_lat, max_lon)."""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    dlon = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01))
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+def nearest_properties(conn, lat: float, lon: float, k: int = 10, min_rent: int = None,
+                       max_rent: int = None, area_key: str = None,
+                       start_radius_km: float = 0.5, max_radius_km: float = 800.0,
+                       filters: str = "", params: tuple = ()):
+    """أقرب k عقار لنقطة، مع تصفية اختيارية بالإيجار والمنطقة.
+
+    المرشحون يأتون من الفهرس المكاني داخل مربع يتضاعف حجمه حتى يحتوي k عقاراً
+    داخل الدائرة المرسومة فيه (وعندها لا يمكن أن يوجد عقار أقرب خارج المربع)،
+    ثم تُرتب المسافات دفعة واحدة على مصفوفات إحداثيات مضغوطة.
+    كل عنصر في النتيجة يحتوي distance_km. filters (" AND ..." على p) وparams
+    شروط إضافية من البحث المركب (listing_search).
+    """
+    params = list(params)
+    if min_rent is not None:
+        filters += " AND p.rent >= ?"
+        params.append(min_rent)
+    if max_rent is not None:
+        filters += " AND p.rent <= ?"
+        params.append(max_rent)
+    if area_key:
+        filters += " AND p.area_key = ?"
+        params.append(area_key)
+
+    radius = start_radius_km
+    while True:
+        rows = _select_in_bbox(
+            conn, _LISTING_COLUMNS, bbox_around(lat, lon, radius),
+            joins="JOIN users u ON u.id = p.owner_id", filters=filters, params=tuple(params),
+        )
+        if not rows:
+            if radius >= max_radius_km:
+                return []
+            radius *= 2
+            continue
+
+        lats = array("d", (r[5] for r in rows))
+        lons = array("d", (r[6] for r in rows))
+        distances = haversine_km(lat, lon, lats, lons)
+
+        if np is not None:
+            order = np.argsort(distances, kind="stable")[:k]
+            ranked = [(float(distances[i]), i) for i in order]
+        else:
+            ranked = heapq.nsmallest(k, ((d, i) for i, d in enumerate(distances)))
+
+        within = sum(1 for d, _ in ranked if d <= radius)
+        if within >= k or radius >= max_radius_km:
+            return [NearbyListing(rows[i] + (round(d, 3),)) for d, i in ranked]
+        radius *= 2
+
+
+def viewport_bbox(center_lat: float, center_lon: float, zoom: float,
+                  width_px: float, height_px: float, tile_size: int = 256):
+    """حساب مستطيل الإحداثيات الظاهر في الخريطة من المركز ومستوى التكبير (Web Mercator).
+
+    يُرجع (min_lat, min_lon, max_lat, max_lon).
+    """
+    world_px = tile_size * (2 ** zoom)
+
+    def to_px(lat, lon):
+        x = (lon + 180.0) / 360.0 * world_px
+        s = math.sin(math.radians(max(min(lat, 85.05), -85.05)))
+        y = (0.5 - math.log((1 + s) / (1 - s)) / (4 * math.pi)) * world_px
+        return x, y
+
+    def to_latlon(x, y):
+        lon = x / world_px * 360.0 - 180.0
+        n = math.pi - 2 * math.pi * y / world_px
+        lat = math.degrees(math.atan(math.sinh(n)))
+        return lat, lon
+
+    cx, cy = to_px(center_lat, center_lon)
+    top_lat, left_lon = to_latlon(cx - width_px / 2, cy - height_px / 2)
+    bottom_lat, right_lon = to_latlon(cx + width_px / 2, cy + height_px / 2)
+    return bottom_lat, left_lon, top_lat, right_lon
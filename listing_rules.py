@@ -0,0 +1,51 @@
+"""قواعد قبول عقار جديد، مشتركة بين نموذج المالك في main.py والاستيراد الكبير."""
+from arabic import normalize_arabic
+
+DAMASCUS = "دمشق"
+# مناطق دمشق المفعلة
+DAMASCUS_ACTIVE_AREAS = ["المزة", "كفرسوسة", "الميدان"]
+# المفاتيح الموحدة، ليُقبل "المزه" أو "الميدان" المكتوبة يدوياً بأي شكل
+DAMASCUS_ACTIVE_AREA_KEYS = {normalize_arabic(a) for a in DAMASCUS_ACTIVE_AREAS}
+
+# جميع مناطق دمشق (قائمة المناطق في الواجهة)
+DAMASCUS_ALL_AREAS = [
+    "المزة", "كفرسوسة", "الميدان", "القدم", "القصاع", "المالكي", "أبو رمانة",
+    "البرامكة", "ركن الدين", "الصالحية", "الشعلان", "المهاجرين", "العدوي",
+    "القنوات", "باب توما", "باب شرقي", "ساروجة", "العفيف", "الجسر الأبيض",
+    "الزاهرة", "الرحمانية", "دمر", "السبينة", "جوبر", "حرستا", "دوما",
+    "داريا", "معضمية الشام", "صحنايا", "الكسوة", "التضامن", "الهامة",
+    "قدسيا", "يملك", "القدم", "القابون", "برزة", "القطيفة", "الخضيري",
+    "الزبداني", "بلد", "جرمانا", "سقبا", "معربا", "عربين", "حزة", "ببيلا"
+]
+
+
+class ListingError(ValueError):
+    """عقار مرفوض؛ نص الخطأ هو الرسالة المعروضة للمستخدم."""
+
+
+def is_area_allowed(city_name: str, area: str):
+    return city_name != DAMASCUS or normalize_arabic(area) in DAMASCUS_ACTIVE_AREA_KEYS
+
+
+def validate_listing(city_name: str, area, rent=None, lat=None, lon=None):
+    """التحقق من حقول عقار جديد وتحويلها: يُرجع (area, rent, lat, lon) أو يرفع ListingError.
+
+    القيم الفارغة ("" أو None) للإيجار والإحداثيات تصبح None.
+    """
+    area = (area or "").strip()
+    if not area:
+        raise ListingError("الرجاء اختيار أو كتابة منطقة")
+    if not is_area_allowed(city_name, area):
+        raise ListingError(
+            f"لدمشق: يمكنك فقط إضافة عقارات في المناطق التالية: {', '.join(DAMASCUS_ACTIVE_AREAS)}"
+        )
+    try:
+        rent = int(rent) if rent not in (None, "") else None
+    except (TypeError, ValueError):
+        raise ListingError("الإيجار يجب أن يكون رقماً") from None
+    try:
+        lat = float(lat) if lat not in (None, "") else None
+        lon = float(lon) if lon not in (None, "") else None
+    except (TypeError, ValueError):
+        raise ListingError("إحداثيات غير صحيحة") from None
+    return area, rent, lat, lon
@@ -0,0 +1,185 @@
+"""بحث مركب في العقارات: مدينة ومناطق متعددة ومجال إيجار وخدمات مطلوبة ووجود موقع،
+مع ترتيب (الأحدث أو الأرخص أو الأقرب) وصفحة من النتائج مع العدد الكلي.
+
+كل ترتيب له فهرس يبدأ بأعمدة التصفية ثم عمود الترتيب، فتُقرأ الصفحة من موقع في
+الفهرس (keyset) بدون مسح ولا ترتيب كل النتائج:
+
+    الأحدث   (city_id, area_key, created_at) / (city_id, created_at) / (created_at)
+    الأرخص   (city_id, area_key, rent) / (city_id, rent) / (rent)
+    الأقرب   R*Tree (geo.nearest_properties)
+
+الخدمات المطلوبة شرط على قناع البتات services_mask (service_tags) في صف العقار نفسه،
+وعدّها في مدينة من الفهرس (city_id, services_mask) وحده.
+
+benchmarks.py plans يدقق خطة كل تركيبة من الفلاتر.
+"""
+import heapq
+from itertools import islice
+
+import geo
+import service_tags
+from arabic import normalize_arabic
+from records import record_type
+
+SORTS = ("newest", "cheapest", "nearest")
+DEFAULT_PAGE_SIZE = 20
+
+# فهارس ترتيب "الأرخص"؛ فهارس "الأحدث" موجودة منذ الترحيلات الأولى
+RENT_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_properties_city_area_key_rent ON properties(city_id, area_key, rent)",
+    "CREATE INDEX IF NOT EXISTS idx_properties_city_rent ON properties(city_id, rent)",
+    "CREATE INDEX IF NOT EXISTS idx_properties_rent ON properties(rent)",
+]
+
+SearchListing = record_type("SearchListing", (
+    "id", "title", "area", "description", "rent", "lat", "lon", "services",
+    "owner_username", "owner_id", "city_id", "created_at",
+))
+# total: عدد كل النتائج (في الصفحة الأولى فقط، وإلا None)؛ cursor: after للصفحة التالية أو None
+SearchPage = record_type("SearchPage", ("total", "results", "cursor"))
+
+_COLUMNS = """p.id, p.title, p.area, p.description, p.rent, p.lat, p.lon, p.services,
+              u.username, u.id, p.city_id, p.created_at"""
+
+
+def create_rent_indexes(conn):
+    for sql in RENT_INDEXES:
+        conn.execute(sql)
+
+
+def _filters(conn, city_id, min_rent, max_rent, services, located):
+    where, params = "", []
+    if city_id:
+        where += " AND p.city_id = ?"
+        params.append(city_id)
+    if min_rent is not None:
+        where += " AND p.rent >= ?"
+        params.append(min_rent)
+    if max_rent is not None:
+        where += " AND p.rent <= ?"
+        params.append(max_rent)
+    if located:
+        where += " AND p.lat IS NOT NULL AND p.lon IS NOT NULL"
+    if services:
+        # كل الخدمات المطلوبة في قناع واحد (service_tags): شرط على رقم في نفس صف العقار
+        required = service_tags.required_mask(conn, services)
+        where += " AND p.services_mask & ? = ?"
+        params.extend((required, required))
+    return where, params
+
+
+def _area_filter(area_keys):
+    if not area_keys:
+        return "", []
+    if len(area_keys) == 1:
+        return " AND p.area_key = ?", list(area_keys)
+    return f" AND p.area_key IN ({', '.join('?' * len(area_keys))})", list(area_keys)
+
+
+def _total(conn, city_id, area_keys, where, params, from_facets, located, services):
+    if from_facets and city_id:
+        # بدون فلاتر إيجار أو خدمات أو موقع: العدد من جدول الملخص (facets) بدون عدّ العقارات
+        area_where, area_params = _area_filter(area_keys)
+        return conn.execute(
+            f"SELECT COALESCE(SUM(listings), 0) FROM area_facets p WHERE p.city_id = ? {area_where}",
+            [city_id, *area_params],
+        ).fetchone()[0]
+    area_where, area_params = _area_filter(area_keys)
+    if located and not city_id and geo.has_spatial_index(conn):
+        # العقارات ذات الموقع هي ما في R*Tree؛ بدون مدينة هو الفهرس الذي يحصرها
+        # (CROSS JOIN يثبت ترتيب الجدولين في SQLite: R*Tree أولاً)
+        query = (f"SELECT COUNT(*) FROM properties_rtree r CROSS JOIN properties p ON p.id = r.id "
+                 f"WHERE 1=1 {where}{area_where}")
+    elif services and not area_keys:
+        # الخدمات والإيجار من الفهرس نفسه (service_tags)؛ وإلا يختار SQLite فهرس الإيجار
+        # ويقرأ صف كل عقار في المجال ليفحص القناع
+        query = (f"SELECT COUNT(*) FROM properties p INDEXED BY {service_tags.COUNT_INDEX} "
+                 f"WHERE 1=1 {where}")
+    else:
+        query = f"SELECT COUNT(*) FROM properties p WHERE 1=1 {where}{area_where}"
+    return conn.execute(query, [*params, *area_params]).fetchone()[0]
+
+
+def _page(conn, where, params, sort, limit, after):
+    if sort == "cheapest":
+        order = "p.rent, p.id"
+        if after:
+            where += " AND (p.rent, p.id) > (?, ?)"
+            params.extend(after)
+    else:
+        order = "p.created_at DESC, p.id DESC"
+        if after:
+            where += " AND (p.created_at, p.id) < (?, ?)"
+            params.extend(after)
+    return conn.execute(
+        f"""
+        SELECT {_COLUMNS}
+        FROM properties p
+        JOIN users u ON u.id = p.owner_id
+        WHERE 1=1 {where}
+        ORDER BY {order}
+        LIMIT ?
+        """,
+        (*params, limit),
+    ).fetchall()
+
+
+def search(conn, city_id: int = None, areas=None, min_rent: int = None, max_rent: int = None,
+           services=None, has_location: bool = False, sort: str = "newest", near: tuple = None,
+           limit: int = DEFAULT_PAGE_SIZE, after: tuple = None):
+    """صفحة واحدة من نتائج البحث المركب (SearchPage).
+
+    areas وservices قوائم (المنطقة بأي كتابة، والخدمة اسم من service_tags أو مرادف له؛
+    خدمة غير معروفة ValueError).
+    sort: newest أو cheapest (العقارات بدون إيجار لا تظهر فيه) أو nearest مع near=(lat, lon)
+    (العقارات بدون موقع لا تظهر فيه، ونتائجه geo.NearbyListing مع distance_km).
+    after هو cursor الصفحة السابقة.
+    """
+    if sort not in SORTS:
+        raise ValueError(f"ترتيب غير معروف: {sort}")
+    if sort == "nearest" and near is None:
+        raise ValueError("الترتيب حسب الأقرب يحتاج near=(lat, lon)")
+    if areas and not city_id:
+        # أسماء المناطق خاصة بكل مدينة، وفهارس المنطقة تبدأ بـ city_id
+        raise ValueError("البحث بالمناطق يحتاج city_id")
+
+    area_keys = sorted({normalize_arabic(a) for a in areas or () if a})
+    services = [s for s in services or () if s and s.strip()]
+    located = has_location or sort == "nearest"
+    where, params = _filters(conn, city_id, min_rent, max_rent, services, located)
+    if sort == "cheapest":
+        where += " AND p.rent IS NOT NULL"
+    total = None
+    if not after:
+        from_facets = (sort == "newest" and min_rent is None and max_rent is None
+                       and not services and not located)
+        total = _total(conn, city_id, area_keys, where, params, from_facets, located, bool(services))
+
+    if sort == "nearest":
+        # الصفحة n هي العناصر بعد أول offset من أقرب offset + limit عقاراً
+        area_where, area_params = _area_filter(area_keys)
+        offset = after[0] if after else 0
+        nearest = geo.nearest_properties(conn, near[0], near[1], k=offset + limit,
+                                         filters=where + area_where, params=(*params, *area_params))
+        results = nearest[offset:]
+        cursor = (offset + limit,) if len(results) == limit else None
+        return SearchPage((total, results, cursor))
+
+    if len(area_keys) > 1:
+        # عدة مناطق: صفحة من كل منطقة على فهرسها ثم دمجها، بدلاً من ترتيب كل عقارات المناطق
+        pages = [_page(conn, where + " AND p.area_key = ?", [*params, key], sort, limit, after)
+                 for key in area_keys]
+        if sort == "cheapest":
+            rows = heapq.merge(*pages, key=lambda r: (r[4], r[0]))
+        else:
+            rows = heapq.merge(*pages, key=lambda r: (r[11], r[0]), reverse=True)
+        rows = list(islice(rows, limit))
+    else:
+        area_where, area_params = _area_filter(area_keys)
+        rows = _page(conn, where + area_where, [*params, *area_params], sort, limit, after)
+    results = list(map(SearchListing, rows))
+    cursor = None
+    if len(results) == limit:
+        last = results[-1]
+        cursor = (last["rent"] if sort == "cheapest" else last["created_at"], last["id"])
+    return SearchPage((total, results, cursor))
@@ -1,9 +1,20 @@
+import asyncio
 import flet as ft
 import sqlite3
 import os
 from pathlib import Path
 from datetime import datetime
 
+from repository import Repository
+from listing_rules import (DAMASCUS, DAMASCUS_ACTIVE_AREAS, DAMASCUS_ALL_AREAS, ListingError,
+                           is_area_allowed, validate_listing)
+import geo
+import tile_cache
+import sync
+from arabic import normalize_arabic
+from async_db import AsyncDB, LatestOnly
+from ui_metrics import UIMetrics
+
 # استيراد مكتبة flet_map إذا كانت متوفرة
 try:
     import flet_map as map
@@ -55,156 +66,80 @@ except ImportError:
     map.MapInteractiveFlag = MapInteractiveFlag
     map.MapInteractionConfiguration = MapInteractionConfiguration
 
-# قاعدة البيانات
-class DatabaseManager:
-    def __init__(self):
-        self.db_path = "city_mover.db"
+class LoadingState:
+    """شريط تحميل يبقى ظاهراً ما دام هناك طلب واحد على الأقل قيد التنفيذ.
+
+        with loading:
+            props = await db_async.get_properties_by_owner(user_id)
+    """
+
+    def __init__(self, page: ft.Page):
+        self.page = page
+        self.bar = ft.ProgressBar(visible=False)
+        self._active = 0
+
+    def __enter__(self):
+        self._active += 1
+        self.bar.visible = True
+        self.page.update()
+        return self
+
+    def __exit__(self, *exc):
+        self._active -= 1
+        self.bar.visible = self._active > 0
+        self.page.update()
+
+class ViewCache:
+    """الشاشات المبنية حسب (route، رقم المستخدم)، حتى لا يُعاد بناؤها مع كل انتقال.
+
+    الشاشة المحفوظة تبقى بحالتها (المدينة والمنطقة المختارة والنتائج). عند الرجوع إليها
+    يُستدعى on_show(stale) المحفوظ في view.data، وstale صحيح إذا تغيرت البيانات في
+    القاعدة منذ إخفائها (data_generation) فتُحدّث نتائجها في مكانها.
+    """
+
+    def __init__(self, generation):
+        self._generation = generation
+        self._entries = {}
+
+    def get(self, key):
+        """(view، stale) للشاشة المحفوظة، أو (None، False)."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, False
+        return entry["view"], entry["hidden_at"] != self._generation()
+
+    def put(self, key, view):
+        self._entries[key] = {"view": view, "hidden_at": None}
+
+    def hide(self, view):
+        # البيانات التي تتغير بعد هذه اللحظة لم تظهر في الشاشة
+        for entry in self._entries.values():
+            if entry["view"] is view:
+                entry["hidden_at"] = self._generation()
+
+    def invalidate(self, route: str = None, user_id=None):
+        """حذف الشاشات المطابقة (None يطابق الكل)، فتُبنى من جديد عند فتحها."""
+        for key in list(self._entries):
+            if route in (None, key[0]) and user_id in (None, key[1]):
+                del self._entries[key]
+
+# قاعدة البيانات: كل الاستعلامات في repository.Repository
+class DatabaseManager(Repository):
+    def __init__(self, db_path: str = "city_mover.db"):
+        super().__init__(db_path)
         self.init_db()
 
-    def get_connection(self):
-        return sqlite3.connect(self.db_path)
-
-    def init_db(self):
-        conn = self.get_connection()
-        cur = conn.cursor()
-        
-        # جدول المستخدمين
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                role TEXT NOT NULL CHECK(role IN ('user', 'owner')),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # جدول المدن
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS cities (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE,
-                lat REAL,
-                lon REAL
-            )
-        ''')
-        
-        # جدول العقارات
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS properties (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                owner_id INTEGER NOT NULL,
-                city_id INTEGER NOT NULL,
-                area TEXT NOT NULL,
-                title TEXT NOT NULL,
-                description TEXT,
-                rent INTEGER,
-                lat REAL,
-                lon REAL,
-                services TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (owner_id) REFERENCES users (id),
-                FOREIGN KEY (city_id) REFERENCES cities (id)
-            )
-        ''')
-        
-        # إضافة المدن إذا لم تكن موجودة
-        cities = [
-            ("دمشق", 33.5138, 36.2765),
-            ("حلب", 36.2021, 37.1343),
-            ("حمص", 34.7324, 36.7137),
-            ("اللاذقية", 35.5177, 35.7831),
-            ("حماة", 35.1318, 36.7578)
-        ]
-        
-        for city in cities:
-            cur.execute("INSERT OR IGNORE INTO cities (name, lat, lon) VALUES (?, ?, ?)", city)
-        
-        # إضافة مستخدمين تجريبيين
-        users = [
-            ("user1", "123456", "user"),
-            ("owner1", "123456", "owner")
-        ]
-        
-        for user in users:
-            cur.execute("INSERT OR IGNORE INTO users (username, password, role) VALUES (?, ?, ?)", user)
-        
-        conn.commit()
-        conn.close()
-
-    def get_user_by_credentials(self, username: str, password: str):
-        conn = self.get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT id, username, role FROM users WHERE username = ? AND password = ?", 
-                   (username, password))
-        row = cur.fetchone()
-        conn.close()
-        if row:
-            return {"id": row[0], "username": row[1], "role": row[2]}
-        return None
-
-    def create_user(self, username: str, password: str, role: str):
-        conn = self.get_connection()
-        cur = conn.cursor()
-        cur.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", 
-                   (username, password, role))
-        user_id = cur.lastrowid
-        conn.commit()
-        conn.close()
-        return user_id
-
-    def get_cities(self):
-        conn = self.get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT id, name, lat, lon FROM cities")
-        cities = []
-        for row in cur.fetchall():
-            cities.append({"id": row[0], "name": row[1], "lat": row[2], "lon": row[3]})
-        conn.close()
-        return cities
-
-    def get_city_by_id(self, city_id: int):
-        conn = self.get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT id, name, lat, lon FROM cities WHERE id = ?", (city_id,))
-        row = cur.fetchone()
-        conn.close()
-        if row:
-            return {"id": row[0], "name": row[1], "lat": row[2], "lon": row[3]}
-        return None
-
-    def add_property(self, owner_id: int, city_id: int, area: str, title: str, 
-                    description: str = None, rent: int = None, lat: float = None, 
-                    lon: float = None, services: str = None):
-        conn = self.get_connection()
-        cur = conn.cursor()
-        cur.execute('''
-            INSERT INTO properties 
-            (owner_id, city_id, area, title, description, rent, lat, lon, services)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (owner_id, city_id, area, title, description, rent, lat, lon, services))
-        conn.commit()
-        conn.close()
-
-    def get_properties_by_owner(self, owner_id: int):
-        conn = self.get_connection()
-        cur = conn.cursor()
-        cur.execute('''
-            SELECT id, city_id, area, title, description, rent, lat, lon, services
-            FROM properties WHERE owner_id = ?
-        ''', (owner_id,))
-        properties = []
-        for row in cur.fetchall():
-            properties.append({
-                "id": row[0], "city_id": row[1], "area": row[2], "title": row[3],
-                "description": row[4], "rent": row[5], "lat": row[6], "lon": row[7],
-                "services": row[8]
-            })
-        conn.close()
-        return properties
-
 # تهيئة قاعدة البيانات
 db = DatabaseManager()
+# قياس الاستعلامات وسجل البطيئة منها: CITYMOVER_SLOW_MS=50 python main.py
+if os.environ.get("CITYMOVER_SLOW_MS"):
+    db.enable_profiling(slow_ms=float(os.environ["CITYMOVER_SLOW_MS"]))
+# نفس الدوال كـ coroutines تُنفذ في خيوط قاعدة البيانات، لمعالجات الأحداث في الواجهة
+db_async = AsyncDB(db)
+# خادم المزامنة بين الأجهزة (sync.py)؛ بدونه يعمل التطبيق محلياً فقط
+SYNC_URL = os.environ.get("CITYMOVER_SYNC_URL")
+# رمز هذا الجهاز عند الخادم (python sync.py register <username>)
+SYNC_TOKEN = os.environ.get("CITYMOVER_SYNC_TOKEN")
 
 def main(page: ft.Page):
     # إعدادات خاصة بالموبايل والأندرويد
@@ -235,6 +170,11 @@ def main(page: ft.Page):
         use_material3=True
     )
     
+    # قياس زمن بناء الشاشات واستدعاءات page.update وحجمها: CITYMOVER_UI_METRICS=1 python main.py
+    ui_metrics = UIMetrics(page).install() if os.environ.get("CITYMOVER_UI_METRICS") else None
+    # الشاشات المبنية لهذه الجلسة؛ الرجوع إليها لا يعيد بناءها
+    view_cache = ViewCache(db.data_generation)
+
     # تحسينات للموبايل
     page.horizontal_alignment = ft.CrossAxisAlignment.CENTER
     page.vertical_alignment = ft.MainAxisAlignment.START
@@ -254,19 +194,16 @@ def main(page: ft.Page):
     if not page.session.contains_key("user"):
         page.session.set("user", None)
 
-    # ---------- مناطق دمشق المفعلة ----------
-    DAMASCUS_ACTIVE_AREAS = ["المزة", "كفرسوسة", "الميدان"]
-    
-    # ---------- جميع مناطق دمشق ----------
-    DAMASCUS_ALL_AREAS = [
-        "المزة", "كفرسوسة", "الميدان", "القدم", "القصاع", "المالكي", "أبو رمانة",
-        "البرامكة", "ركن الدين", "الصالحية", "الشعلان", "المهاجرين", "العدوي",
-        "القنوات", "باب توما", "باب شرقي", "ساروجة", "العفيف", "الجسر الأبيض",
-        "الزاهرة", "الرحمانية", "دمر", "السبينة", "جوبر", "حرستا", "دوما",
-        "داريا", "معضمية الشام", "صحنايا", "الكسوة", "التضامن", "الهامة",
-        "قدسيا", "يملك", "القدم", "القابون", "برزة", "القطيفة", "الخضيري",
-        "الزبداني", "بلد", "جرمانا", "سقبا", "معربا", "عربين", "حزة", "ببيلا"
-    ]
+    # عدد المنازل في كل صفحة من نتائج البحث
+    PROPERTIES_PAGE_SIZE = 20
+    # عدد المنازل الأقرب المعروضة عند الضغط على الخريطة
+    NEAREST_LIMIT = 10
+    # مهلة توقف تحريك الخريطة قبل جلب علاماتها (بالثواني)
+    MARKERS_REFRESH_DELAY = 0.4
+    # بلاطات الخريطة من الملف المحلي بجانب قاعدة البيانات (تُجلب من الإنترنت أول مرة فقط)
+    MAP_TILE_URL = tile_cache.local_tile_url(
+        os.path.join(os.path.dirname(os.path.abspath(db.db_path)), "map_tiles.mbtiles")
+    )
 
     # ---------- عناصر مشتركة ----------
 
@@ -306,6 +243,11 @@ def main(page: ft.Page):
                             ], spacing=8)
                         ),
                         ft.PopupMenuItem(),
+                        *([ft.PopupMenuItem(
+                            text="مزامنة",
+                            icon=ft.Icons.SYNC,
+                            on_click=lambda e: page.run_task(sync_now),
+                        )] if SYNC_URL else []),
                         ft.PopupMenuItem(
                             text="تسجيل الخروج",
                             icon=ft.Icons.LOGOUT,
@@ -324,7 +266,27 @@ def main(page: ft.Page):
             actions=right_controls,
         )
 
+    async def sync_now():
+        # الإرسال والاستقبال في خيط قاعدة البيانات؛ الشاشات المحفوظة تُحدّث عند عرضها (data_generation)
+        try:
+            # العميل يُنشأ في خيط العمل أيضاً (يقرأ sync_state)
+            result = await db_async.run("sync", lambda: sync.SyncClient(db, SYNC_URL, SYNC_TOKEN).sync())
+            page.snack_bar = ft.SnackBar(
+                ft.Text(f"تمت المزامنة: أُرسل {result['pushed']} تغيير ووصل {result['pulled']}"),
+                bgcolor=SUCCESS_COLOR,
+            )
+        except OSError as ex:
+            page.snack_bar = ft.SnackBar(ft.Text(f"تعذر الاتصال بخادم المزامنة: {ex}"), bgcolor=ERROR_COLOR)
+        except (ValueError, KeyError, sqlite3.Error) as ex:
+            # رد غير صالح من الخادم (ليس JSON أو دفعة ناقصة) أو خطأ في تطبيق الدفعة محلياً
+            page.snack_bar = ft.SnackBar(ft.Text(f"فشلت المزامنة: {ex}"), bgcolor=ERROR_COLOR)
+        page.snack_bar.open = True
+        page.update()
+
     def logout(e=None):
+        user = page.session.get("user")
+        if user:
+            view_cache.invalidate(user_id=user["id"])
         page.session.set("user", None)
         page.go("/login")
 
@@ -422,11 +384,11 @@ def main(page: ft.Page):
 
         msg = ft.Text(color=ERROR_COLOR, size=14)
 
-        def submit(e):
+        async def submit(e):
             nonlocal username, password
             if mode_tabs.selected_index == 0:
                 # تسجيل الدخول
-                user = db.get_user_by_credentials(username.value.strip(), password.value.strip())
+                user = await db_async.get_user_by_credentials(username.value.strip(), password.value.strip())
                 if not user:
                     msg.value = "بيانات الدخول غير صحيحة"
                     msg.color = ERROR_COLOR
@@ -448,7 +410,7 @@ def main(page: ft.Page):
                     page.update()
                     return
                 try:
-                    user_id = db.create_user(uname, pwd, role)
+                    user_id = await db_async.create_user(uname, pwd, role)
                     new_user = {"id": user_id, "username": uname, "role": role}
                     page.session.set("user", new_user)
                     msg.value = "تم إنشاء الحساب بنجاح!"
@@ -575,19 +537,142 @@ def main(page: ft.Page):
             content_padding=12,
         )
 
+        sort_dropdown = ft.Dropdown(
+            label="الترتيب",
+            expand=True,
+            value="newest",
+            options=[ft.dropdown.Option("newest", "الأحدث"), ft.dropdown.Option("cheapest", "الأرخص")],
+            border_color=PRIMARY_COLOR,
+            filled=True,
+            bgcolor="white",
+            content_padding=12,
+        )
+
+        # الخدمات المطلوبة: كل شريحة خدمة من القائمة الثابتة (service_tags)
+        services = db.get_services()
+        service_chips = ft.Row(
+            [ft.Chip(label=ft.Text(s["name"], size=12), data=s["name"], show_checkmark=True)
+             for s in services],
+            wrap=True,
+            spacing=5,
+            run_spacing=5,
+        )
+
         selected_city_name = ft.Text("", size=16, weight=ft.FontWeight.BOLD, color=PRIMARY_COLOR)
         selected_area_name = ft.Text("", size=14, color=TEXT_COLOR)
+        results_count = ft.Text("", size=12, color=ft.Colors.GREY_700)
         
         properties_container = ft.ListView(
             expand=True,
             spacing=10,
             padding=10,
+            on_scroll_interval=100,
         )
         
         tips_container = ft.Column(spacing=8)
 
+        loading = LoadingState(page)
+        # طلب واحد فعال لقائمة المنازل: تغيير المدينة أو المنطقة أو البحث يلغي الطلب السابق
+        latest = LatestOnly()
+
         user_marker_layer_ref = ft.Ref[map.MarkerLayer]()
 
+        # موقع الخريطة الحالي؛ يُحدَّث مع كل تحريك أو تكبير
+        map_viewport = {"lat": 33.5138, "lon": 36.2765, "zoom": 11}
+
+        def cluster_marker(item):
+            if item["count"] == 1 and "title" in item:
+                return map.Marker(
+                    content=ft.Icon(
+                        ft.Icons.HOME, color=PRIMARY_COLOR, size=18,
+                        tooltip=f"{item['title']} - {item['rent']} ل.س",
+                    ),
+                    coordinates=map.MapLatitudeLongitude(item["lat"], item["lon"]),
+                )
+            size = 24 if item["count"] < 10 else 30 if item["count"] < 100 else 38
+            return map.Marker(
+                content=ft.Container(
+                    content=ft.Text(str(item["count"]), size=11, color="white", weight=ft.FontWeight.BOLD),
+                    alignment=ft.alignment.center,
+                    bgcolor=PRIMARY_COLOR,
+                    border_radius=size / 2,
+                ),
+                coordinates=map.MapLatitudeLongitude(item["lat"], item["lon"]),
+                width=size,
+                height=size,
+            )
+
+        @latest("markers")
+        async def refresh_viewport_markers():
+            # لا نستعلم مع كل حدث سحب؛ فقط بعد توقف الحركة. كل حدث جديد يلغي المهمة السابقة
+            # (أثناء الانتظار أو الاستعلام)، فلا تُرسم علامات منطقة عرض قديمة فوق الأحدث
+            await asyncio.sleep(MARKERS_REFRESH_DELAY)
+            layer = user_marker_layer_ref.current
+            if not layer:
+                return
+            # تجمعات العقارات الظاهرة في الخريطة؛ عددها محدود بعدد خلايا الشاشة
+            bbox = geo.viewport_bbox(
+                map_viewport["lat"], map_viewport["lon"], map_viewport["zoom"],
+                page.width or 400, 250,
+            )
+            items = await db_async.clusters_in_bbox(*bbox, zoom=map_viewport["zoom"])
+            layer.markers = [cluster_marker(item) for item in items]
+            page.update()
+
+        def schedule_markers_refresh():
+            page.run_task(refresh_viewport_markers)
+
+        def on_user_map_event(e):
+            if e.center is None or e.zoom is None or e.center.latitude is None:
+                return
+            map_viewport.update(lat=e.center.latitude, lon=e.center.longitude, zoom=e.zoom)
+            # الخريطة تُنشأ من جديد عند الرجوع للشاشة المحفوظة؛ تبدأ من آخر موقع
+            user_map.initial_center = map.MapLatitudeLongitude(e.center.latitude, e.center.longitude)
+            user_map.initial_zoom = e.zoom
+            schedule_markers_refresh()
+
+        @latest("listing")
+        async def on_user_map_tap(e):
+            # أقرب المنازل للنقطة التي ضغط عليها المستخدم (مع تصفية المنطقة إن اختيرت)
+            if e.name != "tap":
+                return
+            coords = e.coordinates
+            with loading:
+                nearby = await db_async.nearest_properties(
+                    coords.latitude, coords.longitude, k=NEAREST_LIMIT, area=area_dropdown.value,
+                )
+
+            clear_listing()
+            properties_container.controls.append(
+                ft.Text(f"أقرب {len(nearby)} منزل للنقطة المحددة", size=12, color=TEXT_COLOR)
+            )
+            properties_container.controls.extend(build_property_card(p) for p in nearby)
+
+            if user_marker_layer_ref.current:
+                user_marker_layer_ref.current.markers = [
+                    map.Marker(
+                        content=ft.Icon(ft.Icons.MY_LOCATION, color=ERROR_COLOR),
+                        coordinates=coords,
+                    )
+                ] + [
+                    map.Marker(
+                        content=ft.Icon(ft.Icons.HOME, color=PRIMARY_COLOR, size=18,
+                                        tooltip=f"{p['title']} - {p['distance_km']:.1f} كم"),
+                        coordinates=map.MapLatitudeLongitude(p["lat"], p["lon"]),
+                    )
+                    for p in nearby
+                ]
+
+            if nearby:
+                page.snack_bar = ft.SnackBar(
+                    ft.Text(f"أقرب منزل على بعد {nearby[0]['distance_km']:.1f} كم — القائمة في تبويب البحث"),
+                    bgcolor=SUCCESS_COLOR,
+                )
+            else:
+                page.snack_bar = ft.SnackBar(ft.Text("لا توجد منازل قريبة"), bgcolor=WARNING_COLOR)
+            page.snack_bar.open = True
+            page.update()
+
         user_map = map.Map(
             expand=True,
             height=250,
@@ -596,76 +681,63 @@ def main(page: ft.Page):
             interaction_configuration=map.MapInteractionConfiguration(
                 flags=map.MapInteractiveFlag.ALL
             ),
+            on_init=lambda e: schedule_markers_refresh(),
+            on_event=on_user_map_event,
+            on_tap=on_user_map_tap,
             layers=[
-                map.TileLayer(
-                    url_template="https://tile.openstreetmap.org/{z}/{x}/{y}.png",
-                ),
+                map.TileLayer(url_template=MAP_TILE_URL),
                 map.MarkerLayer(ref=user_marker_layer_ref, markers=[]),
             ],
         )
 
-        def get_all_areas_by_city(city_id: int):
-            conn = db.get_connection()
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT DISTINCT area FROM properties 
-                WHERE city_id = ? AND area IS NOT NULL AND area != ''
-            """, (city_id,))
-            areas = [row[0] for row in cur.fetchall()]
-            conn.close()
-            return areas
-
-        def get_properties_by_city_and_area(city_id: int, area: str):
-            conn = db.get_connection()
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT p.id, p.title, p.area, p.description, p.rent, p.lat, p.lon, p.services,
-                       u.username as owner_username
-                FROM properties p
-                JOIN users u ON p.owner_id = u.id
-                WHERE p.city_id = ? AND p.area = ?
-            """, (city_id, area))
-            properties = []
-            for row in cur.fetchall():
-                properties.append({
-                    "id": row[0],
-                    "title": row[1],
-                    "area": row[2],
-                    "description": row[3],
-                    "rent": row[4],
-                    "lat": row[5],
-                    "lon": row[6],
-                    "services": row[7],
-                    "owner_username": row[8]
-                })
-            conn.close()
-            return properties
-
-        def load_areas_for_city(city_id: int):
+        # ملخص مناطق المدينة المختارة (العدد والإيجارات) حسب الاسم الموحد
+        area_facets = {}
+
+        def describe_area(area):
+            facet = area_facets.get(normalize_arabic(area or ""))
+            if not facet:
+                return "لا توجد منازل في هذه المنطقة"
+            text = f"{area}: {facet['listings']} منزل"
+            if facet["rent_min"] is not None:
+                text += (f"، الإيجار من {facet['rent_min']:,} إلى {facet['rent_max']:,} ل.س"
+                         f" (الوسيط حوالي {facet['rent_median']:,})")
+            return text
+
+        async def load_areas_for_city(city_id: int):
             area_dropdown.options.clear()
             area_dropdown.disabled = True
             
-            city = db.get_city_by_id(city_id)
+            city = await db_async.get_city_by_id(city_id)
             if not city:
                 return
                 
             city_name = city["name"]
-            
+            with loading:
+                city_facets = await db_async.get_area_facets(city_id)
+            area_facets.clear()
+            area_facets.update((f["area_key"], f) for f in city_facets)
+
+            def count(area):
+                facet = area_facets.get(normalize_arabic(area))
+                return facet["listings"] if facet else 0
+
             if city_name == "دمشق":
                 for area in DAMASCUS_ALL_AREAS:
                     is_active = area in DAMASCUS_ACTIVE_AREAS
-                    area_text = f"{area} {'✓' if is_active else ''}"
+                    area_text = f"{area} ({count(area)}) {'✓' if is_active else ''}"
                     area_dropdown.options.append(ft.dropdown.Option(area, area_text))
                 
                 area_dropdown.disabled = False
                 selected_area_name.value = f"المناطق المفعلة: {', '.join(DAMASCUS_ACTIVE_AREAS)}"
                 selected_area_name.color = SUCCESS_COLOR
             else:
-                all_areas = get_all_areas_by_city(city_id)
-                for area in all_areas:
-                    area_dropdown.options.append(ft.dropdown.Option(area, area))
+                for facet in city_facets:
+                    area_dropdown.options.append(
+                        ft.dropdown.Option(facet["area"], f"{facet['area']} ({facet['listings']})")
+                    )
                 area_dropdown.disabled = False
-                selected_area_name.value = f"المناطق المتاحة: {len(all_areas)} منطقة"
+                total = sum(f["listings"] for f in city_facets)
+                selected_area_name.value = f"المناطق المتاحة: {len(city_facets)} منطقة، {total} منزل"
                 selected_area_name.color = TEXT_COLOR
             
             area_dropdown.value = None
@@ -733,8 +805,129 @@ def main(page: ft.Page):
             
             page.open(dlg)
 
-        def show_properties(e=None):
+        def build_property_card(p):
+            def make_show_on_map(lat=p["lat"], lon=p["lon"], title=p["title"]):
+                def _inner(ev):
+                    if lat is None or lon is None:
+                        page.snack_bar = ft.SnackBar(
+                            ft.Text("لا توجد إحداثيات لهذا المنزل"),
+                            bgcolor=WARNING_COLOR,
+                        )
+                        page.snack_bar.open = True
+                        page.update()
+                        return
+
+                    if user_marker_layer_ref.current:
+                        user_marker_layer_ref.current.markers.clear()
+                        user_marker_layer_ref.current.markers.append(
+                            map.Marker(
+                                content=ft.Icon(ft.Icons.HOME, color=ft.Colors.RED),
+                                coordinates=map.MapLatitudeLongitude(lat, lon),
+                            )
+                        )
+                    page.update()
+                return _inner
+
+            def make_contact_owner(username=p["owner_username"], title=p["title"]):
+                return lambda e: contact_owner(username, title)
+
+            return create_card(
+                ft.Column([
+                    ft.Row([
+                        ft.Icon(ft.Icons.HOME, color=PRIMARY_COLOR, size=20),
+                        ft.Text(p["title"], size=14, weight=ft.FontWeight.BOLD, color=PRIMARY_COLOR, expand=True),
+                    ]),
+                    ft.Divider(height=8),
+                    ft.Column([
+                        ft.Row([ft.Icon(ft.Icons.LOCATION_ON, size=14), ft.Text(f"المنطقة: {p['area']}", size=12)]),
+                        ft.Row([ft.Icon(ft.Icons.ATTACH_MONEY, size=14), ft.Text(f"الإيجار: {p['rent']} ل.س", size=12)]),
+                        ft.Row([ft.Icon(ft.Icons.PERSON, size=14), ft.Text(f"المالك: {p['owner_username']}", size=12)]),
+                    ], spacing=5),
+                    ft.Divider(height=8),
+                    ft.Text(p["description"] or "", size=11, color=ft.Colors.GREY_700),
+                    ft.Text(f"الخدمات: {p['services'] or 'غير مذكورة'}", size=10, color=ft.Colors.GREY_600),
+                    ft.Text(f"… {p.get('snippet')}", size=10, italic=True, color=SECONDARY_COLOR,
+                            visible=bool(p.get("snippet"))),
+                    ft.Text(f"المسافة: {p.get('distance_km', 0):.1f} كم", size=11, color=SUCCESS_COLOR,
+                            visible="distance_km" in p),
+                    ft.Divider(height=10),
+                    ft.Row([
+                        create_mobile_button("الموقع", ft.Icons.MAP, make_show_on_map(), color=SECONDARY_COLOR),
+                        create_mobile_button("خرائط", ft.Icons.OPEN_IN_NEW, 
+                                           lambda ev, lat=p["lat"], lon=p["lon"]: page.launch_url(f"https://maps.google.com?q={lat},{lon}") 
+                                           if lat and lon else None, color=PRIMARY_COLOR),
+                        create_mobile_button("تواصل", ft.Icons.CHAT, make_contact_owner(), color=SUCCESS_COLOR),
+                    ], spacing=5),
+                ])
+            )
+
+        # حالة الترقيم للبحث الحالي (cursor من search_listings حسب الترتيب)؛
+        # request يزيد مع كل بحث جديد حتى تُهمل صفحات بحث سابق وصلت متأخرة
+        listing = {"city_id": None, "area": None, "sort": "newest", "services": [], "cursor": None,
+                   "done": True, "request": 0, "loading": None, "scroll": 0}
+
+        def selected_services():
+            return [c.data for c in service_chips.controls if c.selected]
+
+        def clear_listing():
             properties_container.controls.clear()
+            results_count.value = ""
+            listing["scroll"] = 0
+            listing["done"] = True
+            listing["request"] += 1
+
+        async def load_next_page():
+            request = listing["request"]
+            if listing["done"] or listing["loading"] == request:
+                return []
+            listing["loading"] = request
+            try:
+                with loading:
+                    result = await db_async.search_listings(
+                        listing["city_id"], [listing["area"]], services=listing["services"],
+                        sort=listing["sort"],
+                        limit=PROPERTIES_PAGE_SIZE, after=listing["cursor"],
+                    )
+            finally:
+                if listing["loading"] == request:
+                    listing["loading"] = None
+            if request != listing["request"]:
+                return []
+            props = result["results"]
+            if result["total"] is not None:
+                results_count.value = f"{result['total']} منزل"
+            listing["cursor"] = result["cursor"]
+            listing["done"] = listing["cursor"] is None
+
+            controls = properties_container.controls
+            if controls and controls[-1] is load_more_btn:
+                controls.pop()
+            controls.extend(build_property_card(p) for p in props)
+            if not listing["done"]:
+                controls.append(load_more_btn)
+            return props
+
+        async def on_load_more(e):
+            if await load_next_page():
+                page.update()
+
+        async def on_properties_scroll(e: ft.OnScrollEvent):
+            listing["scroll"] = e.pixels
+            # تحميل الصفحة التالية عند الاقتراب من نهاية القائمة
+            if listing["done"] or not e.max_scroll_extent:
+                return
+            if e.pixels >= e.max_scroll_extent - 300:
+                await on_load_more(e)
+
+        load_more_btn = ft.Container(
+            content=ft.TextButton("عرض المزيد", icon=ft.Icons.EXPAND_MORE, on_click=on_load_more),
+            alignment=ft.alignment.center,
+        )
+        properties_container.on_scroll = on_properties_scroll
+
+        @latest("listing")
+        async def show_properties(e=None):
+            clear_listing()
             if user_marker_layer_ref.current:
                 user_marker_layer_ref.current.markers.clear()
 
@@ -750,7 +943,7 @@ def main(page: ft.Page):
                 return
 
             city_id = int(city_dropdown.value)
-            city = db.get_city_by_id(city_id)
+            city = await db_async.get_city_by_id(city_id)
             city_name = city["name"] if city else ""
             selected_city_name.value = f"المدينة: {city_name}"
 
@@ -765,7 +958,7 @@ def main(page: ft.Page):
                 page.update()
                 return
 
-            if city_name == "دمشق" and area_dropdown.value not in DAMASCUS_ACTIVE_AREAS:
+            if not is_area_allowed(city_name, area_dropdown.value):
                 properties_container.controls.append(
                     ft.Container(
                         content=ft.Text("لا توجد منازل متاحة في هذه المنطقة", color=ERROR_COLOR),
@@ -776,7 +969,11 @@ def main(page: ft.Page):
                 page.update()
                 return
 
-            props = get_properties_by_city_and_area(city_id, area_dropdown.value)
+            # الصفحة الأولى فقط؛ الباقي يُحمّل عند التمرير أو الضغط على "عرض المزيد"
+            listing.update(city_id=city_id, area=area_dropdown.value, sort=sort_dropdown.value or "newest",
+                           services=selected_services(),
+                           cursor=None, done=False)
+            props = await load_next_page()
 
             if not props:
                 properties_container.controls.append(
@@ -786,73 +983,148 @@ def main(page: ft.Page):
                         alignment=ft.alignment.center,
                     )
                 )
-            else:
-                for p in props:
-                    def make_show_on_map(lat=p["lat"], lon=p["lon"], title=p["title"]):
-                        def _inner(ev):
-                            if lat is None or lon is None:
-                                page.snack_bar = ft.SnackBar(
-                                    ft.Text("لا توجد إحداثيات لهذا المنزل"),
-                                    bgcolor=WARNING_COLOR,
-                                )
-                                page.snack_bar.open = True
-                                page.update()
-                                return
-
-                            if user_marker_layer_ref.current:
-                                user_marker_layer_ref.current.markers.clear()
-                                user_marker_layer_ref.current.markers.append(
-                                    map.Marker(
-                                        content=ft.Icon(ft.Icons.HOME, color=ft.Colors.RED),
-                                        coordinates=map.MapLatitudeLongitude(lat, lon),
-                                    )
-                                )
-                            page.update()
-                        return _inner
-
-                    def make_contact_owner(username=p["owner_username"], title=p["title"]):
-                        return lambda e: contact_owner(username, title)
-
-                    card = create_card(
-                        ft.Column([
-                            ft.Row([
-                                ft.Icon(ft.Icons.HOME, color=PRIMARY_COLOR, size=20),
-                                ft.Text(p["title"], size=14, weight=ft.FontWeight.BOLD, color=PRIMARY_COLOR, expand=True),
-                            ]),
-                            ft.Divider(height=8),
-                            ft.Column([
-                                ft.Row([ft.Icon(ft.Icons.LOCATION_ON, size=14), ft.Text(f"المنطقة: {p['area']}", size=12)]),
-                                ft.Row([ft.Icon(ft.Icons.ATTACH_MONEY, size=14), ft.Text(f"الإيجار: {p['rent']} ل.س", size=12)]),
-                                ft.Row([ft.Icon(ft.Icons.PERSON, size=14), ft.Text(f"المالك: {p['owner_username']}", size=12)]),
-                            ], spacing=5),
-                            ft.Divider(height=8),
-                            ft.Text(p["description"] or "", size=11, color=ft.Colors.GREY_700),
-                            ft.Text(f"الخدمات: {p['services'] or 'غير مذكورة'}", size=10, color=ft.Colors.GREY_600),
-                            ft.Divider(height=10),
-                            ft.Row([
-                                create_mobile_button("الموقع", ft.Icons.MAP, make_show_on_map(), color=SECONDARY_COLOR),
-                                create_mobile_button("خرائط", ft.Icons.OPEN_IN_NEW, 
-                                                   lambda ev, lat=p["lat"], lon=p["lon"]: page.launch_url(f"https://maps.google.com?q={lat},{lon}") 
-                                                   if lat and lon else None, color=PRIMARY_COLOR),
-                                create_mobile_button("تواصل", ft.Icons.CHAT, make_contact_owner(), color=SUCCESS_COLOR),
-                            ], spacing=5),
-                        ])
-                    )
-                    properties_container.controls.append(card)
 
             load_tips_for_city(city_name)
             page.update()
 
-        def on_city_change(e):
+        @latest("listing")
+        async def run_text_search(e=None):
+            text = search_field.value.strip()
+            if not text:
+                await show_properties()
+                return
+
+            clear_listing()
+            city_id = int(city_dropdown.value) if city_dropdown.value else None
+            with loading:
+                results = await db_async.search_properties_text(text, city_id=city_id)
+
+            if not results:
+                properties_container.controls.append(
+                    ft.Container(
+                        content=ft.Text(f"لا توجد نتائج لـ \"{text}\""),
+                        padding=10,
+                        alignment=ft.alignment.center,
+                    )
+                )
+            else:
+                properties_container.controls.append(
+                    ft.Text(f"{len(results)} نتيجة لـ \"{text}\"", size=12, color=TEXT_COLOR)
+                )
+                properties_container.controls.extend(build_property_card(p) for p in results)
+            page.update()
+
+        search_field = ft.TextField(
+            label="ابحث بالكلمات (مثال: مولدة مدرسة)",
+            expand=True,
+            border_color=PRIMARY_COLOR,
+            filled=True,
+            bgcolor="white",
+            content_padding=12,
+            prefix_icon=ft.Icons.SEARCH,
+            on_submit=run_text_search,
+        )
+
+        @latest("listing")
+        async def on_city_change(e):
             if city_dropdown.value:
-                load_areas_for_city(int(city_dropdown.value))
-                show_properties()
+                await load_areas_for_city(int(city_dropdown.value))
+                await show_properties()
 
-        def on_area_change(e):
-            show_properties()
+        async def on_area_change(e):
+            selected_area_name.value = describe_area(area_dropdown.value)
+            selected_area_name.color = TEXT_COLOR
+            await show_properties()
 
         city_dropdown.on_change = on_city_change
         area_dropdown.on_change = on_area_change
+        sort_dropdown.on_change = run_text_search
+        for chip in service_chips.controls:
+            chip.on_select = run_text_search
+
+        async def on_show(stale):
+            # الرجوع للشاشة المحفوظة: المدينة والمنطقة والنتائج كما تُركت
+            if stale:
+                # تغيرت البيانات أثناء غياب الشاشة: أعداد المناطق ونفس البحث من جديد بنفس الاختيارات
+                if city_dropdown.value:
+                    area = area_dropdown.value
+                    await load_areas_for_city(int(city_dropdown.value))
+                    area_dropdown.value = area
+                    await run_text_search()
+                schedule_markers_refresh()
+                await load_alerts()
+            elif listing["scroll"]:
+                properties_container.scroll_to(offset=listing["scroll"], duration=0)
+
+        # ---------- البحث المحفوظ والتنبيهات ----------
+
+        notifications_list = ft.Column(spacing=5)
+        saved_searches_list = ft.Column(spacing=5)
+        alerts = {"newest": None}
+
+        async def load_alerts():
+            notifications = await db_async.get_notifications(user["id"])
+            searches = await db_async.get_saved_searches(user["id"])
+            unread = await db_async.count_unread_notifications(user["id"])
+            alerts["newest"] = notifications[0]["id"] if notifications else None
+            alerts_tab.text = f"التنبيهات ({unread})" if unread else "التنبيهات"
+
+            notifications_list.controls = [
+                ft.Container(
+                    content=ft.Column([
+                        ft.Text(f"{n['title']} — {n['area']}، {n['rent'] or 'إيجار غير محدد'} ل.س", size=13,
+                                weight=ft.FontWeight.NORMAL if n["is_read"] else ft.FontWeight.BOLD),
+                        ft.Text(f"يطابق: {n['search_name']}", size=11, color=ft.Colors.GREY_700),
+                    ], spacing=2),
+                    padding=8,
+                    border_radius=8,
+                    bgcolor=SURFACE_COLOR if n["is_read"] else ft.Colors.BLUE_50,
+                )
+                for n in notifications
+            ] or [ft.Text("لا توجد تنبيهات بعد", size=12, color=ft.Colors.GREY_700)]
+
+            saved_searches_list.controls = [
+                ft.Row([
+                    ft.TextButton(s["name"], icon=ft.Icons.MANAGE_SEARCH, expand=True,
+                                  on_click=lambda e, s=s: page.run_task(apply_saved_search, s)),
+                    ft.IconButton(ft.Icons.DELETE, icon_color=ERROR_COLOR, tooltip="حذف",
+                                  on_click=lambda e, s=s: page.run_task(delete_saved_search, s)),
+                ])
+                for s in searches
+            ] or [ft.Text("احفظ بحثاً من تبويب البحث لتصلك المنازل الجديدة المطابقة", size=12,
+                          color=ft.Colors.GREY_700)]
+            page.update()
+
+        async def save_current_search(e):
+            if not city_dropdown.value:
+                page.snack_bar = ft.SnackBar(ft.Text("الرجاء اختيار مدينة أولاً"), bgcolor=WARNING_COLOR)
+            else:
+                await db_async.save_search(user["id"], int(city_dropdown.value), area_dropdown.value,
+                                           services=selected_services())
+                page.snack_bar = ft.SnackBar(ft.Text("تم حفظ البحث، ستصلك تنبيهات بالمنازل الجديدة المطابقة"),
+                                             bgcolor=SUCCESS_COLOR)
+                await load_alerts()
+            page.snack_bar.open = True
+            page.update()
+
+        async def apply_saved_search(saved):
+            city_dropdown.value = str(saved["city_id"])
+            await load_areas_for_city(saved["city_id"])
+            area_dropdown.value = saved["area"]
+            for chip, service in zip(service_chips.controls, services):
+                chip.selected = bool(saved["services_mask"] >> service["bit"] & 1)
+            tabs.selected_index = 0
+            await show_properties()
+
+        async def delete_saved_search(saved):
+            await db_async.delete_saved_search(saved["id"], user["id"])
+            await load_alerts()
+
+        async def on_tab_change(e):
+            # فتح تبويب التنبيهات يعلّم المعروض منها مقروءاً (وليس ما يصل بعد العرض)
+            if tabs.selected_index == 3 and alerts["newest"] is not None:
+                if await db_async.mark_notifications_read(user["id"], up_to_id=alerts["newest"]):
+                    await load_alerts()
 
         # واجهة المستخدم للموبايل
         search_section = ft.Container(
@@ -863,8 +1135,15 @@ def main(page: ft.Page):
                     ft.Row([city_dropdown]),
                     ft.Text("اختر المنطقة:", size=14),
                     ft.Row([area_dropdown]),
+                    ft.Row([sort_dropdown]),
+                    ft.Text("الخدمات المطلوبة:", size=14),
+                    service_chips,
+                    ft.Row([search_field]),
+                    ft.Row([create_mobile_button("حفظ البحث", ft.Icons.NOTIFICATIONS_ACTIVE, save_current_search,
+                                                 color=SECONDARY_COLOR)]),
                     selected_city_name,
                     selected_area_name,
+                    results_count,
                 ], spacing=8))
             ], spacing=5),
             padding=5,
@@ -873,6 +1152,7 @@ def main(page: ft.Page):
         properties_section = ft.Container(
             content=ft.Column([
                 create_section_header("المنازل المتاحة", ft.Icons.HOME),
+                loading.bar,
                 properties_container
             ], spacing=5),
             expand=True,
@@ -892,10 +1172,25 @@ def main(page: ft.Page):
             ], spacing=5),
         )
 
+        alerts_section = ft.Container(
+            content=ft.Column([
+                create_section_header("تنبيهات البحث المحفوظ", ft.Icons.NOTIFICATIONS),
+                create_card(notifications_list),
+                create_section_header("عمليات البحث المحفوظة", ft.Icons.BOOKMARK),
+                create_card(saved_searches_list),
+            ], spacing=5),
+        )
+        alerts_tab = ft.Tab(
+            text="التنبيهات",
+            icon=ft.Icons.NOTIFICATIONS,
+            content=ft.Column([alerts_section], scroll=ft.ScrollMode.ADAPTIVE)
+        )
+
         # استخدام Tabs للتنقل بين الأقسام في الموبايل
         tabs = ft.Tabs(
             selected_index=0,
             animation_duration=300,
+            on_change=on_tab_change,
             tabs=[
                 ft.Tab(
                     text="البحث",
@@ -912,11 +1207,12 @@ def main(page: ft.Page):
                     icon=ft.Icons.LIGHTBULB,
                     content=ft.Column([tips_section], scroll=ft.ScrollMode.ADAPTIVE)
                 ),
+                alerts_tab,
             ],
             expand=True,
         )
 
-        return ft.View(
+        view = ft.View(
             route="/user",
             appbar=app_bar("لوحة المستخدم"),
             controls=[
@@ -927,6 +1223,9 @@ def main(page: ft.Page):
                 )
             ],
         )
+        view.data = {"on_show": on_show}
+        page.run_task(load_alerts)
+        return view
 
     # ---------- شاشة المالك (Owner) ----------
 
@@ -1016,6 +1315,9 @@ def main(page: ft.Page):
 
         msg = ft.Text(color=ERROR_COLOR, size=14)
 
+        loading = LoadingState(page)
+        latest = LatestOnly()
+
         owner_marker_layer_ref = ft.Ref[map.MarkerLayer]()
 
         def handle_owner_map_tap(e: map.MapTapEvent):
@@ -1049,27 +1351,16 @@ def main(page: ft.Page):
             ),
             on_tap=handle_owner_map_tap,
             layers=[
-                map.TileLayer(url_template="https://tile.openstreetmap.org/{z}/{x}/{y}.png"),
+                map.TileLayer(url_template=MAP_TILE_URL),
                 map.MarkerLayer(ref=owner_marker_layer_ref, markers=[]),
             ],
         )
 
-        def get_all_areas_by_city_owner(city_id: int):
-            conn = db.get_connection()
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT DISTINCT area FROM properties 
-                WHERE city_id = ? AND area IS NOT NULL AND area != ''
-            """, (city_id,))
-            areas = [row[0] for row in cur.fetchall()]
-            conn.close()
-            return areas
-
-        def load_areas_for_owner_city(city_id: int):
+        async def load_areas_for_owner_city(city_id: int):
             area_dropdown.options.clear()
             area_dropdown.disabled = True
             
-            city = db.get_city_by_id(city_id)
+            city = await db_async.get_city_by_id(city_id)
             if not city:
                 return
                 
@@ -1085,7 +1376,8 @@ def main(page: ft.Page):
                 msg.value = f"المناطق المفعلة: {', '.join(DAMASCUS_ACTIVE_AREAS)}"
                 msg.color = SUCCESS_COLOR
             else:
-                all_areas = get_all_areas_by_city_owner(city_id)
+                with loading:
+                    all_areas = await db_async.get_all_areas_by_city(city_id)
                 for area in all_areas:
                     area_dropdown.options.append(ft.dropdown.Option(area, area))
                 area_dropdown.disabled = False
@@ -1095,13 +1387,14 @@ def main(page: ft.Page):
             area_dropdown.value = None
             page.update()
 
-        def on_city_change_owner(e):
+        @latest("areas")
+        async def on_city_change_owner(e):
             if city_dropdown.value:
-                load_areas_for_owner_city(int(city_dropdown.value))
+                await load_areas_for_owner_city(int(city_dropdown.value))
 
         city_dropdown.on_change = on_city_change_owner
 
-        def open_google_maps(e=None):
+        async def open_google_maps(e=None):
             try:
                 lat = float(lat_field.value)
                 lon = float(lon_field.value)
@@ -1111,70 +1404,49 @@ def main(page: ft.Page):
                 pass
 
             if city_dropdown.value:
-                city = db.get_city_by_id(int(city_dropdown.value))
+                city = await db_async.get_city_by_id(int(city_dropdown.value))
                 if city:
                     page.launch_url(f"https://maps.google.com/search/{city['name']}")
                     return
 
             page.launch_url("https://maps.google.com")
 
-        def save_property(e):
+        async def save_property(e):
             if not city_dropdown.value:
                 msg.value = "الرجاء اختيار مدينة"
                 msg.color = ERROR_COLOR
                 page.update()
                 return
 
-            selected_area = None
-            if area_dropdown.value:
-                selected_area = area_dropdown.value
-            elif area_field.value.strip():
-                selected_area = area_field.value.strip()
-            
-            if not selected_area:
-                msg.value = "الرجاء اختيار أو كتابة منطقة"
-                msg.color = ERROR_COLOR
-                page.update()
-                return
-
             city_id = int(city_dropdown.value)
-            city = db.get_city_by_id(city_id)
+            city = await db_async.get_city_by_id(city_id)
             city_name = city["name"] if city else ""
 
-            if city_name == "دمشق" and selected_area not in DAMASCUS_ACTIVE_AREAS:
-                msg.value = f"لدمشق: يمكنك فقط إضافة عقارات في المناطق التالية: {', '.join(DAMASCUS_ACTIVE_AREAS)}"
-                msg.color = ERROR_COLOR
-                page.update()
-                return
-
+            # نفس قواعد الاستيراد الكبير (listing_rules)
             try:
-                rent = int(rent_field.value) if rent_field.value else None
-            except ValueError:
-                msg.value = "الإيجار يجب أن يكون رقماً"
-                msg.color = ERROR_COLOR
-                page.update()
-                return
-            try:
-                lat = float(lat_field.value) if lat_field.value else None
-                lon = float(lon_field.value) if lon_field.value else None
-            except ValueError:
-                msg.value = "إحداثيات غير صحيحة"
+                selected_area, rent, lat, lon = validate_listing(
+                    city_name, area_dropdown.value or area_field.value,
+                    rent_field.value, lat_field.value, lon_field.value,
+                )
+            except ListingError as err:
+                msg.value = str(err)
                 msg.color = ERROR_COLOR
                 page.update()
                 return
 
             try:
-                db.add_property(
-                    owner_id=user["id"],
-                    city_id=city_id,
-                    area=selected_area,
-                    title=title_field.value.strip(),
-                    description=desc_field.value.strip(),
-                    rent=rent,
-                    lat=lat,
-                    lon=lon,
-                    services=services_field.value.strip(),
-                )
+                with loading:
+                    await db_async.add_property(
+                        owner_id=user["id"],
+                        city_id=city_id,
+                        area=selected_area,
+                        title=title_field.value.strip(),
+                        description=desc_field.value.strip(),
+                        rent=rent,
+                        lat=lat,
+                        lon=lon,
+                        services=services_field.value.strip(),
+                    )
                 msg.value = "تم حفظ العقار بنجاح ✅"
                 msg.color = SUCCESS_COLOR
 
@@ -1188,63 +1460,49 @@ def main(page: ft.Page):
                 if owner_marker_layer_ref.current:
                     owner_marker_layer_ref.current.markers.clear()
                 page.update()
-                load_owner_properties()
+                await load_owner_properties()
             except Exception as ex:
                 msg.value = f"حدث خطأ: {ex}"
                 msg.color = ERROR_COLOR
                 page.update()
 
-        def edit_property(property_id: int):
-            conn = db.get_connection()
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT title, area, description, rent, lat, lon, services
-                FROM properties WHERE id = ?
-            """, (property_id,))
-            prop = cur.fetchone()
-            conn.close()
+        async def edit_property(property_id: int):
+            prop = await db_async.get_property_by_id(property_id)
             
             if not prop:
                 return
             
-            edit_title = ft.TextField(label="العنوان", value=prop[0], expand=True, border_color=PRIMARY_COLOR, filled=True)
-            edit_area = ft.TextField(label="المنطقة", value=prop[1], expand=True, border_color=PRIMARY_COLOR, filled=True)
-            edit_desc = ft.TextField(label="الوصف", value=prop[2], multiline=True, min_lines=2, expand=True, border_color=PRIMARY_COLOR, filled=True)
-            edit_rent = ft.TextField(label="الإيجار", value=str(prop[3]) if prop[3] else "", expand=True, border_color=PRIMARY_COLOR, filled=True)
-            edit_lat = ft.TextField(label="خط العرض", value=str(prop[4]) if prop[4] else "", expand=1, border_color=PRIMARY_COLOR, filled=True)
-            edit_lon = ft.TextField(label="خط الطول", value=str(prop[5]) if prop[5] else "", expand=1, border_color=PRIMARY_COLOR, filled=True)
-            edit_services = ft.TextField(label="الخدمات", value=prop[6] or "", multiline=True, min_lines=2, expand=True, border_color=PRIMARY_COLOR, filled=True)
+            edit_title = ft.TextField(label="العنوان", value=prop["title"], expand=True, border_color=PRIMARY_COLOR, filled=True)
+            edit_area = ft.TextField(label="المنطقة", value=prop["area"], expand=True, border_color=PRIMARY_COLOR, filled=True)
+            edit_desc = ft.TextField(label="الوصف", value=prop["description"], multiline=True, min_lines=2, expand=True, border_color=PRIMARY_COLOR, filled=True)
+            edit_rent = ft.TextField(label="الإيجار", value=str(prop["rent"]) if prop["rent"] else "", expand=True, border_color=PRIMARY_COLOR, filled=True)
+            edit_lat = ft.TextField(label="خط العرض", value=str(prop["lat"]) if prop["lat"] else "", expand=1, border_color=PRIMARY_COLOR, filled=True)
+            edit_lon = ft.TextField(label="خط الطول", value=str(prop["lon"]) if prop["lon"] else "", expand=1, border_color=PRIMARY_COLOR, filled=True)
+            edit_services = ft.TextField(label="الخدمات", value=prop["services"] or "", multiline=True, min_lines=2, expand=True, border_color=PRIMARY_COLOR, filled=True)
             
-            def update_property(e):
+            async def update_property(e):
                 try:
                     rent_val = int(edit_rent.value) if edit_rent.value.strip() else None
                     lat_val = float(edit_lat.value) if edit_lat.value.strip() else None
                     lon_val = float(edit_lon.value) if edit_lon.value.strip() else None
-                    
-                    conn = db.get_connection()
-                    cur = conn.cursor()
-                    cur.execute("""
-                        UPDATE properties 
-                        SET title=?, area=?, description=?, rent=?, lat=?, lon=?, services=?
-                        WHERE id=?
-                    """, (
-                        edit_title.value.strip(),
-                        edit_area.value.strip(),
-                        edit_desc.value.strip(),
-                        rent_val,
-                        lat_val,
-                        lon_val,
-                        edit_services.value.strip(),
-                        property_id
-                    ))
-                    conn.commit()
-                    conn.close()
+
+                    with loading:
+                        await db_async.update_property(
+                            property_id,
+                            title=edit_title.value.strip(),
+                            area=edit_area.value.strip(),
+                            description=edit_desc.value.strip(),
+                            rent=rent_val,
+                            lat=lat_val,
+                            lon=lon_val,
+                            services=edit_services.value.strip(),
+                        )
                     
                     page.snack_bar = ft.SnackBar(ft.Text("تم التحديث بنجاح"), bgcolor=SUCCESS_COLOR)
                     page.snack_bar.open = True
                     page.update()
                     page.close(dlg)
-                    load_owner_properties()
+                    await load_owner_properties()
                 except Exception as ex:
                     page.snack_bar = ft.SnackBar(ft.Text(f"خطأ: {ex}"), bgcolor=ERROR_COLOR)
                     page.snack_bar.open = True
@@ -1275,11 +1533,21 @@ def main(page: ft.Page):
         add_btn = create_mobile_button("حفظ العقار", ft.Icons.SAVE, save_property, color=SUCCESS_COLOR)
         open_maps_btn = create_mobile_button("فتح خرائط جوجل", ft.Icons.OPEN_IN_NEW, open_google_maps, color=PRIMARY_COLOR)
 
-        properties_list = ft.ListView(expand=True, spacing=10, padding=10)
+        # موضع التمرير في قائمة عقاراتي، لإعادته عند الرجوع للشاشة المحفوظة
+        properties_scroll = {"offset": 0}
 
-        def load_owner_properties():
+        def on_owner_properties_scroll(e: ft.OnScrollEvent):
+            properties_scroll["offset"] = e.pixels
+
+        properties_list = ft.ListView(expand=True, spacing=10, padding=10, on_scroll_interval=100,
+                                      on_scroll=on_owner_properties_scroll)
+
+        @latest("owner_properties")
+        async def load_owner_properties():
+            with loading:
+                props = await db_async.get_properties_by_owner(user["id"])
             properties_list.controls.clear()
-            props = db.get_properties_by_owner(user["id"])
+            properties_scroll["offset"] = 0
             if not props:
                 properties_list.controls.append(
                     create_card(
@@ -1293,12 +1561,13 @@ def main(page: ft.Page):
                 )
             else:
                 for p in props:
-                    city = db.get_city_by_id(p.get("city_id", 0))
-                    city_name = city["name"] if city else ""
-                    is_active_area = city_name == "دمشق" and p["area"] in DAMASCUS_ACTIVE_AREAS
+                    city_name = p["city_name"]
+                    is_active_area = city_name == DAMASCUS and is_area_allowed(city_name, p["area"])
                     
                     def make_edit_function(prop_id=p["id"]):
-                        return lambda e: edit_property(prop_id)
+                        async def _edit(e):
+                            await edit_property(prop_id)
+                        return _edit
                     
                     properties_list.controls.append(
                         create_card(
@@ -1330,8 +1599,16 @@ def main(page: ft.Page):
                             ])
                         )
                     )
+            page.update()
 
-        load_owner_properties()
+        page.run_task(load_owner_properties)
+
+        async def on_show(stale):
+            if stale:
+                # عقارات المالك تغيرت من مكان آخر (جهاز آخر أو استيراد)
+                await load_owner_properties()
+            elif properties_scroll["offset"]:
+                properties_list.scroll_to(offset=properties_scroll["offset"], duration=0)
 
         # واجهة المالك للموبايل باستخدام Tabs
         add_property_tab = ft.Column([
@@ -1380,10 +1657,11 @@ def main(page: ft.Page):
             expand=True,
         )
 
-        return ft.View(
+        view = ft.View(
             route="/owner",
             appbar=app_bar("لوحة المالك"),
             controls=[
+                loading.bar,
                 ft.Container(
                     content=tabs,
                     expand=True,
@@ -1391,20 +1669,45 @@ def main(page: ft.Page):
                 )
             ],
         )
+        view.data = {"on_show": on_show}
+        return view
 
     # ---------- إدارة الـ Routes ----------
 
+    def build_view(view_func):
+        if ui_metrics is None:
+            return view_func()
+        return ui_metrics.build_view(view_func)
+
+    # شاشات المستخدم والمالك تُبنى مرة لكل مستخدم؛ تسجيل الدخول تُبنى في كل مرة لتبدأ فارغة
+    cached_views = {"/user": user_view, "/owner": owner_view}
+
     def route_change(e: ft.RouteChangeEvent):
+        for view in page.views:
+            view_cache.hide(view)
         page.views.clear()
+        user = page.session.get("user")
+        key = (page.route, user["id"] if user else None)
+        view, stale = view_cache.get(key)
+        if view is not None:
+            page.views.append(view if ui_metrics is None else ui_metrics.reuse_view(view))
+            page.update()
+            on_show = (view.data or {}).get("on_show")
+            if on_show:
+                page.run_task(on_show, stale)
+            return
+
         if page.route == "/login":
-            page.views.append(login_view())
-        elif page.route == "/user":
-            page.views.append(user_view())
-        elif page.route == "/owner":
-            page.views.append(owner_view())
+            page.views.append(build_view(login_view))
+        elif page.route in cached_views:
+            view = build_view(cached_views[page.route])
+            # الشاشة تُرجع شاشة تسجيل الدخول إذا لم يكن المستخدم مناسباً لها
+            if view.route == page.route:
+                view_cache.put(key, view)
+            page.views.append(view)
         else:
             page.go("/login")
-            page.views.append(login_view())
+            page.views.append(build_view(login_view))
         page.update()
 
     def view_pop(e: ft.ViewPopEvent):
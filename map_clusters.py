@@ -0,0 +1,161 @@
+import geo
+from records import record_type
+
+# مستويات التكبير المحسوبة مسبقاً؛ فوق MAX_CLUSTER_ZOOM تُرسم العقارات منفردة
+MIN_CLUSTER_ZOOM = 3
+MAX_CLUSTER_ZOOM = 16
+# حجم خلية التجميع على الشاشة بالبكسل (من بلاطة 256 بكسل)
+CLUSTER_CELL_PX = 64
+# حد أعلى لعدد العناصر المرسلة للخريطة مهما كان حجم البيانات
+MAX_MAP_ITEMS = 400
+
+INSERT_TRIGGER = "map_clusters_ai"
+
+Cluster = record_type("Cluster", ("count", "lat", "lon"))
+# عقار منفرد عند التكبير العالي: حقول geo.Marker مع count = 1
+SingleMarker = record_type("SingleMarker", geo.MARKER_FIELDS + ("count",))
+
+
+def cell_degrees(zoom: int):
+    """عرض الخلية بالدرجات عند مستوى تكبير معين (شبكة متساوية في خط الطول والعرض)."""
+    return 360.0 * CLUSTER_CELL_PX / (256 * 2 ** zoom)
+
+
+# كل عقار بإحداثيات يُضاف إلى خلية واحدة في كل مستوى. الخلية تحفظ العدد ومجموع
+# الإحداثيات، فمركزها = المجموع / العدد، وتحديثها عند الإضافة أو الحذف خطوة واحدة
+_CELL_X = "CAST((({lon}) + 180.0) / l.cell_deg AS INTEGER)"
+_CELL_Y = "CAST((({lat}) + 90.0) / l.cell_deg AS INTEGER)"
+
+
+def _add_point_sql(lat, lon):
+    return f"""
+        INSERT INTO map_clusters (zoom, cell_x, cell_y, count, sum_lat, sum_lon)
+        SELECT l.zoom, {_CELL_X.format(lon=lon)}, {_CELL_Y.format(lat=lat)}, 1, {lat}, {lon}
+        FROM cluster_levels l
+        WHERE {lat} IS NOT NULL AND {lon} IS NOT NULL
+        ON CONFLICT (zoom, cell_x, cell_y) DO UPDATE SET
+            count = count + 1,
+            sum_lat = sum_lat + excluded.sum_lat,
+            sum_lon = sum_lon + excluded.sum_lon;
+    """
+
+
+def _remove_point_sql(lat, lon):
+    cells = f"""
+        SELECT l.zoom, {_CELL_X.format(lon=lon)}, {_CELL_Y.format(lat=lat)}
+        FROM cluster_levels l
+        WHERE {lat} IS NOT NULL AND {lon} IS NOT NULL
+    """
+    return f"""
+        UPDATE map_clusters SET
+            count = count - 1,
+            sum_lat = sum_lat - {lat},
+            sum_lon = sum_lon - {lon}
+        WHERE (zoom, cell_x, cell_y) IN ({cells});
+        DELETE FROM map_clusters WHERE count <= 0 AND (zoom, cell_x, cell_y) IN ({cells});
+    """
+
+
+def create_cluster_tables(conn):
+    """إنشاء جداول التجميع ومشغلاتها، وتعبئتها من العقارات الموجودة."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cluster_levels (
+            zoom INTEGER PRIMARY KEY,
+            cell_deg REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS map_clusters (
+            zoom INTEGER NOT NULL,
+            cell_x INTEGER NOT NULL,
+            cell_y INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            sum_lat REAL NOT NULL,
+            sum_lon REAL NOT NULL,
+            PRIMARY KEY (zoom, cell_x, cell_y)
+        ) WITHOUT ROWID
+    """)
+    conn.executemany(
+        "INSERT OR REPLACE INTO cluster_levels (zoom, cell_deg) VALUES (?, ?)",
+        [(z, cell_degrees(z)) for z in range(MIN_CLUSTER_ZOOM, MAX_CLUSTER_ZOOM + 1)],
+    )
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS map_clusters_ai AFTER INSERT ON properties
+        WHEN new.lat IS NOT NULL AND new.lon IS NOT NULL BEGIN
+            {_add_point_sql("new.lat", "new.lon")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS map_clusters_ad AFTER DELETE ON properties
+        WHEN old.lat IS NOT NULL AND old.lon IS NOT NULL BEGIN
+            {_remove_point_sql("old.lat", "old.lon")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS map_clusters_au AFTER UPDATE OF lat, lon ON properties BEGIN
+            {_remove_point_sql("old.lat", "old.lon")}
+            {_add_point_sql("new.lat", "new.lon")}
+        END
+    """)
+    rebuild_clusters(conn)
+
+
+def rebuild_clusters(conn):
+    """إعادة حساب كل الخلايا من جدول properties."""
+    conn.execute("DELETE FROM map_clusters")
+    add_rows_after(conn, 0)
+
+
+def add_rows_after(conn, after_id: int):
+    """إضافة العقارات ذات id > after_id إلى الخلايا، مجمّعة حسب الخلية (استعلام واحد لكل دفعة).
+
+    التجميع على العقارات مرة واحدة في أدق مستوى، ثم كل مستوى أعلى من خلايا الأدق: عرض الخلية
+    يتضاعف تماماً بين مستويين (cell_degrees)، فخلية المستوى zoom = خلية الأدق مقسومة على
+    2^(MAX_CLUSTER_ZOOM - zoom)، بنفس قيمة _CELL_X و_CELL_Y لكل عقار.
+    """
+    conn.execute(f"""
+        INSERT INTO map_clusters (zoom, cell_x, cell_y, count, sum_lat, sum_lon)
+        SELECT l.zoom, f.cell_x >> ({MAX_CLUSTER_ZOOM} - l.zoom), f.cell_y >> ({MAX_CLUSTER_ZOOM} - l.zoom),
+               SUM(f.count), SUM(f.sum_lat), SUM(f.sum_lon)
+        FROM (
+            SELECT {_CELL_X.format(lon="p.lon")} AS cell_x, {_CELL_Y.format(lat="p.lat")} AS cell_y,
+                   COUNT(*) AS count, SUM(p.lat) AS sum_lat, SUM(p.lon) AS sum_lon
+            FROM properties p, cluster_levels l
+            WHERE l.zoom = {MAX_CLUSTER_ZOOM} AND p.id > ? AND p.lat IS NOT NULL AND p.lon IS NOT NULL
+            GROUP BY 1, 2
+        ) f, cluster_levels l
+        WHERE true
+        GROUP BY 1, 2, 3
+        ON CONFLICT (zoom, cell_x, cell_y) DO UPDATE SET
+            count = count + excluded.count,
+            sum_lat = sum_lat + excluded.sum_lat,
+            sum_lon = sum_lon + excluded.sum_lon
+    """, (after_id,))
+
+
+def clusters_in_bbox(conn, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                     zoom: float):
+    """عناصر الخريطة لمنطقة العرض: مراكز تجمعات مع عددها، أو عقارات منفردة عند التكبير العالي.
+
+    كل عنصر {"lat", "lon", "count"} وللعقار المنفرد أيضاً "id" و"title" و"rent".
+    عدد العناصر محدود بعدد الخلايا الظاهرة على الشاشة، وليس بعدد العقارات.
+    """
+    level = int(zoom)
+    if level > MAX_CLUSTER_ZOOM:
+        markers = geo.properties_in_bbox(conn, min_lat, min_lon, max_lat, max_lon, limit=MAX_MAP_ITEMS)
+        return [SingleMarker(m + (1,)) for m in markers]
+
+    level = max(level, MIN_CLUSTER_ZOOM)
+    size = cell_degrees(level)
+    rows = conn.execute(
+        """
+        SELECT count, sum_lat / count, sum_lon / count
+        FROM map_clusters
+        WHERE zoom = ? AND cell_x BETWEEN ? AND ? AND cell_y BETWEEN ? AND ?
+        LIMIT ?
+        """,
+        (level, int((min_lon + 180.0) / size), int((max_lon + 180.0) / size),
+         int((min_lat + 90.0) / size), int((max_lat + 90.0) / size), MAX_MAP_ITEMS),
+    ).fetchall()
+    return list(map(Cluster, rows))
@@ -0,0 +1,73 @@
+from arabic import normalize_arabic
+
+# الفهارس التي تحتاجها استعلامات العقارات في كلا الملفين:
+# التصفية على city_id أو (city_id, area) أو owner_id مع الترتيب على created_at
+PROPERTY_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_properties_city_area_created ON properties(city_id, area, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_properties_city_created ON properties(city_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_properties_owner_created ON properties(owner_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_properties_created ON properties(created_at)",
+]
+
+
+def create_property_indexes(conn):
+    for sql in PROPERTY_INDEXES:
+        conn.execute(sql)
+
+
+def add_area_key_column(conn):
+    """إضافة العمود area_key (اسم المنطقة الموحد، انظر arabic.normalize_arabic) وفهرسه.
+
+    تُملأ الصفوف الموجودة هنا، والصفوف الجديدة تُملأ من دوال الكتابة في طبقة
+    قاعدة البيانات. البحث بالمنطقة يتم على area_key بدلاً من area.
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(properties)")]
+    if "area_key" not in columns:
+        conn.execute("ALTER TABLE properties ADD COLUMN area_key TEXT NOT NULL DEFAULT ''")
+
+    rows = conn.execute("SELECT id, area FROM properties").fetchall()
+    conn.executemany(
+        "UPDATE properties SET area_key = ? WHERE id = ?",
+        [(normalize_arabic(area), prop_id) for prop_id, area in rows],
+    )
+
+    # الفهرس على area الخام لم يعد مستخدماً
+    conn.execute("DROP INDEX IF EXISTS idx_properties_city_area_created")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_properties_city_area_key_created "
+        "ON properties(city_id, area_key, created_at)"
+    )
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(conn, migrations):
+    """تنفيذ خطوات الترحيل الناقصة فقط، اعتماداً على PRAGMA user_version.
+
+    migrations قائمة مرتبة من الدوال (conn) -> None؛ الخطوة رقم i (بدءاً من 1)
+    تُنفذ فقط إذا كان user_version أقل من i. كل خطوة تُنفذ في معاملة مستقلة،
+    لذلك لا يُسجَّل رقم الإصدار إلا إذا نجحت الخطوة بالكامل.
+    يُرجع عدد الخطوات التي نُفذت (صفر عند التشغيل الدافئ).
+    """
+    current = get_schema_version(conn)
+    if current >= len(migrations):
+        return 0
+
+    applied = 0
+    for version in range(current + 1, len(migrations) + 1):
+        step = migrations[version - 1]
+        conn.execute("BEGIN")
+        try:
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.execute("COMMIT")
+        except BaseException:
+            # أي خطأ (وأيضاً KeyboardInterrupt) يلغي الخطوة كاملة ولا يترك معاملة مفتوحة
+            conn.execute("ROLLBACK")
+            raise
+        applied += 1
+
+    conn.execute("PRAGMA optimize")
+    return applied
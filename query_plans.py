@@ -0,0 +1,97 @@
+import re
+import threading
+
+# "SCAN p" بدون USING INDEX يعني مسحاً كاملاً للجدول
+_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+# جداول صغيرة تُقرأ كاملة عن قصد (قوائم المدن والخدمات، فحص المخطط)
+ALLOWED_FULL_SCANS = {"cities", "service_vocabulary", "service_terms", "sqlite_master", "sqlite_schema"}
+
+_AUDITED_STATEMENTS = ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")
+
+
+def explain(conn, sql, params=()):
+    """إرجاع أسطر EXPLAIN QUERY PLAN لاستعلام كنص."""
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def full_scans(conn, sql, params=(), allowed=ALLOWED_FULL_SCANS):
+    """أسطر الخطة التي تمسح جدولاً كاملاً بدون فهرس."""
+    found = []
+    for detail in explain(conn, sql, params):
+        match = _FULL_SCAN.match(detail)
+        if match and match.group(1) not in allowed:
+            found.append(detail)
+    return found
+
+
+# دوال التتبع لكل اتصال: SQLite يقبل set_trace_callback واحدة ولا يعيد الحالية، فكل من
+# يتتبع (StatementRecorder وquery_profiler) يضيف دالته هنا وتُستدعى الدوال كلها بالترتيب
+_tracers = {}
+_tracers_lock = threading.Lock()
+
+
+def add_trace_callback(conn, callback):
+    with _tracers_lock:
+        callbacks = _tracers.setdefault(conn, [])
+        callbacks.append(callback)
+        _install_tracers(conn, callbacks)
+
+
+def remove_trace_callback(conn, callback):
+    with _tracers_lock:
+        callbacks = _tracers.get(conn, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if callbacks:
+            _install_tracers(conn, callbacks)
+        else:
+            _tracers.pop(conn, None)
+            conn.set_trace_callback(None)
+
+
+def _install_tracers(conn, callbacks):
+    if len(callbacks) == 1:
+        conn.set_trace_callback(callbacks[0])
+        return
+    current = tuple(callbacks)
+
+    def trace_all(statement):
+        for callback in current:
+            callback(statement)
+
+    conn.set_trace_callback(trace_all)
+
+
+class StatementRecorder:
+    """تسجيل كل استعلام ينفذه اتصال معين (مع قيم المعاملات) لتدقيق خططه لاحقاً."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.statements = []
+
+    def _trace(self, statement):
+        if statement.lstrip().upper().startswith(_AUDITED_STATEMENTS):
+            self.statements.append(statement)
+
+    def __enter__(self):
+        add_trace_callback(self.conn, self._trace)
+        return self
+
+    def __exit__(self, *exc):
+        remove_trace_callback(self.conn, self._trace)
+
+
+def audit(conn, statements, allowed=ALLOWED_FULL_SCANS):
+    """إرجاع قائمة (الاستعلام، أسطر المسح الكامل) لكل استعلام مخالف."""
+    problems = []
+    seen = set()
+    for sql in statements:
+        key = " ".join(sql.split())
+        if key in seen:
+            continue
+        seen.add(key)
+        scans = full_scans(conn, sql, allowed=allowed)
+        if scans:
+            problems.append((key, scans))
+    return problems
@@ -0,0 +1,191 @@
+"""قياس زمن استعلامات Repository وسجل الاستعلامات البطيئة.
+
+معطل افتراضياً ولا يضيف أي كلفة: عند التفعيل فقط تُستبدل دوال الـ Repository
+(على الكائن نفسه، لا على الصنف) بنسخ تقيس الزمن وعدد الصفوف واسم الدالة المستدعية،
+وتلتقط نصوص SQL المنفذة عبر set_trace_callback (query_plans.add_trace_callback، بجانب
+أي تتبع آخر). الاستدعاء الأبطأ من slow_ms يُسجل مع EXPLAIN QUERY PLAN لكل استعلام فيه:
+
+    repo.enable_profiling(slow_ms=50)
+    ...
+    repo.check_db_status()["profiling"]
+"""
+import functools
+import re
+import sys
+import threading
+import time
+from collections import deque
+
+from query_plans import add_trace_callback, explain, remove_trace_callback
+
+DEFAULT_SLOW_MS = 100.0
+# عدد الاستدعاءات البطيئة المحفوظة (الأحدث)
+SLOW_LOG_SIZE = 50
+# دوال لا تُقاس: ليست استعلامات أو تستدعى من داخل الدوال المقاسة
+_NOT_PROFILED = {"get_connection", "init_db", "next_page_cursor", "check_db_status",
+                 "data_generation", "enable_profiling", "disable_profiling"}
+_EXPLAINED = ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT")
+
+# القيم الحرفية في نص الاستعلام الموسع (set_trace_callback يعطي الاستعلام مع قيم معاملاته)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:e[-+]?\d+)?(?![\w.])", re.IGNORECASE)
+
+_local = threading.local()
+
+
+# وحدات وسيطة بين الواجهة والـ Repository؛ المستدعي الحقيقي هو أول دالة خارجها
+_PASS_THROUGH_MODULES = {"db_android", "async_db", "query_profiler", "repository"}
+
+
+def caller_name(depth: int = 1):
+    """اسم أول دالة خارج الوحدات الوسيطة في مكدس الاستدعاء الحالي."""
+    frame = sys._getframe(depth)
+    while frame is not None and frame.f_globals.get("__name__") in _PASS_THROUGH_MODULES:
+        frame = frame.f_back
+    return frame.f_code.co_name if frame is not None else "?"
+
+
+def set_caller(name: str = None):
+    """اسم الدالة التي طلبت الاستعلامات التالية في هذا الخيط؛ تستخدمه AsyncDB في خيوط العمل
+    حيث لا يظهر معالج الواجهة في المكدس."""
+    _local.caller = name
+
+
+def _caller_name():
+    return getattr(_local, "caller", None) or caller_name(3)
+
+
+def normalize_sql(sql: str):
+    """نص الاستعلام بدون القيم الحرفية، ليُجمع نفس الاستعلام بمعاملات مختلفة معاً."""
+    return _NUMBER.sub("?", _STRING.sub("?", " ".join(sql.split())))
+
+
+def _row_count(result):
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple):
+        return 1
+    return 0 if result is None else None
+
+
+class QueryProfiler:
+    def __init__(self, slow_ms: float = DEFAULT_SLOW_MS, log=None):
+        self.slow_ms = slow_ms
+        self.log = log or (lambda line: print(line, file=sys.stderr))
+        self._lock = threading.Lock()
+        self._functions = {}
+        self._statements = {}
+        self.slow = deque(maxlen=SLOW_LOG_SIZE)
+
+    # ---------- تركيب القياس على Repository ----------
+
+    def install(self, repo):
+        for name in dir(type(repo)):
+            if name.startswith("_") or name in _NOT_PROFILED:
+                continue
+            method = getattr(repo, name)
+            if callable(method) and hasattr(method, "__self__"):
+                setattr(repo, name, self._wrap(repo, name, method))
+
+    def uninstall(self, repo):
+        for name in list(vars(repo)):
+            if getattr(vars(repo)[name], "_profiled", False):
+                delattr(repo, name)
+
+    def _wrap(self, repo, name, method):
+        @functools.wraps(method)
+        def profiled(*args, **kwargs):
+            if getattr(_local, "active", False):
+                # استدعاء داخلي من دالة مقاسة: يُحسب ضمنها
+                return method(*args, **kwargs)
+            caller = _caller_name()
+            conn = repo.get_connection()
+            trace = []
+
+            def on_statement(sql):
+                trace.append((time.perf_counter(), sql))
+
+            _local.active = True
+            # بجانب أي تتبع آخر على الاتصال (StatementRecorder مثلاً)، لا بدلاً منه
+            add_trace_callback(conn, on_statement)
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                end = time.perf_counter()
+                remove_trace_callback(conn, on_statement)
+                _local.active = False
+            self._record(conn, name, caller, start, end, trace, _row_count(result))
+            return result
+
+        profiled._profiled = True
+        return profiled
+
+    # ---------- التسجيل ----------
+
+    def _record(self, conn, name, caller, start, end, trace, rows):
+        elapsed_ms = (end - start) * 1000
+        # زمن كل استعلام تقريبي: من بدايته حتى بداية الاستعلام التالي (أو نهاية الدالة)
+        statements = [
+            (sql, ((trace[i + 1][0] if i + 1 < len(trace) else end) - at) * 1000)
+            for i, (at, sql) in enumerate(trace)
+        ]
+        with self._lock:
+            entry = self._functions.setdefault(name, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                                     "rows": 0, "slow": 0, "callers": {}})
+            entry["calls"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            entry["rows"] += rows or 0
+            entry["callers"][caller] = entry["callers"].get(caller, 0) + 1
+            for sql, ms in statements:
+                key = normalize_sql(sql)
+                stat = self._statements.setdefault(key, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+                stat["count"] += 1
+                stat["total_ms"] += ms
+                stat["max_ms"] = max(stat["max_ms"], ms)
+            if elapsed_ms < self.slow_ms:
+                return
+            entry["slow"] += 1
+
+        slow = {"function": name, "caller": caller, "ms": round(elapsed_ms, 2), "rows": rows,
+                "statements": []}
+        for sql, ms in statements:
+            plan = []
+            if sql.lstrip().upper().startswith(_EXPLAINED):
+                try:
+                    plan = explain(conn, sql)
+                except Exception as e:
+                    plan = [f"EXPLAIN فشل: {e}"]
+            slow["statements"].append({"sql": " ".join(sql.split()), "ms": round(ms, 2), "plan": plan})
+        with self._lock:
+            self.slow.append(slow)
+        self.log(f"[slow query] {name} من {caller}: {elapsed_ms:.1f}ms، {rows} صف")
+        for statement in slow["statements"]:
+            self.log(f"    {statement['ms']:.1f}ms {statement['sql'][:300]}")
+            for line in statement["plan"]:
+                self.log(f"        {line}")
+
+    def report(self, top: int = 10):
+        """ملخص للعرض في check_db_status: لكل دالة، وأبطأ الاستعلامات، وآخر الاستدعاءات البطيئة."""
+        with self._lock:
+            functions = {
+                name: {
+                    "calls": e["calls"],
+                    "avg_ms": round(e["total_ms"] / e["calls"], 3),
+                    "max_ms": round(e["max_ms"], 3),
+                    "total_ms": round(e["total_ms"], 1),
+                    "rows": e["rows"],
+                    "slow": e["slow"],
+                    "callers": dict(e["callers"]),
+                }
+                for name, e in sorted(self._functions.items(), key=lambda item: -item[1]["total_ms"])
+            }
+            statements = [
+                {"sql": sql, "count": s["count"], "avg_ms": round(s["total_ms"] / s["count"], 3),
+                 "max_ms": round(s["max_ms"], 3)}
+                for sql, s in sorted(self._statements.items(), key=lambda item: -item[1]["total_ms"])[:top]
+            ]
+            slow = list(self.slow)[-top:]
+        return {"enabled": True, "slow_ms": self.slow_ms, "functions": functions,
+                "top_statements": statements, "slow_calls": slow}
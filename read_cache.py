@@ -0,0 +1,89 @@
+import threading
+import os
+import weakref
+
+
+class ReadCache:
+    """ذاكرة مؤقتة للبيانات المرجعية (المدن وقوائم المناطق).
+
+    تُفرَّغ تلقائياً في حالتين:
+    - عند الكتابة عبر طبقة قاعدة البيانات (invalidate من دوال الإضافة والتعديل).
+    - عند تغيّر PRAGMA data_version، أي عند كتابة اتصال آخر على نفس الملف.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        # آخر data_version لكل اتصال؛ بمفتاح الاتصال نفسه (لا id الذي يُعاد استخدامه بعد إغلاقه)
+        self._versions = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _check_version(self, conn):
+        # data_version خاص بكل اتصال، لذلك نحفظ آخر قيمة لكل اتصال على حدة؛
+        # أول مرة يُرى فيها الاتصال تُحفظ قيمته فقط (لا تعني كتابة من اتصال آخر)
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        last = self._versions.get(conn)
+        self._versions[conn] = version
+        if last is not None and last != version:
+            self._clear()
+
+    def _clear(self):
+        self._generation += 1
+        if self._entries:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def get(self, conn, key, loader):
+        """إرجاع القيمة المخزنة للمفتاح، أو تحميلها عبر loader() عند عدم وجودها."""
+        with self._lock:
+            self._check_version(conn)
+            if key in self._entries:
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            generation = self._generation
+
+        value = loader()
+        with self._lock:
+            # لا نخزن نتيجة حُمّلت قبل تفريغ حدث أثناء التحميل
+            if generation == self._generation:
+                self._entries[key] = value
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+
+    def generation(self, conn):
+        """رقم يزيد مع كل تفريغ، أي مع كل كتابة على القاعدة (من هذا الاتصال أو غيره)."""
+        with self._lock:
+            self._check_version(conn)
+            return self._generation
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+        }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_read_cache(db_path: str):
+    """الذاكرة المؤقتة المشتركة لملف قاعدة بيانات معين."""
+    key = os.path.abspath(db_path)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = ReadCache()
+            _caches[key] = cache
+        return cache
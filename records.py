@@ -0,0 +1,56 @@
+"""سجلات مضغوطة لنتائج الاستعلامات.
+
+كل سجل tuple عادي (بدون __dict__ لكل صف) مع أسماء حقول على مستوى النوع،
+ويُقرأ مثل القاموس تماماً كما كانت النتائج سابقاً:
+
+    p["title"], p.get("snippet"), "distance_km" in p, dict(p)
+
+السجلات للقراءة فقط؛ الحقول الإضافية (مثل distance_km) جزء من نوع السجل نفسه.
+"""
+
+
+class Record(tuple):
+    __slots__ = ()
+    _fields = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if key.__class__ is str:
+            try:
+                key = self._index[key]
+            except KeyError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        i = self._index.get(key)
+        return default if i is None else tuple.__getitem__(self, i)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return zip(self._fields, self)
+
+    def _asdict(self):
+        return dict(zip(self._fields, self))
+
+    def __repr__(self):
+        fields = ", ".join(f"{k}={v!r}" for k, v in zip(self._fields, self))
+        return f"{type(self).__name__}({fields})"
+
+
+def record_type(name: str, fields):
+    """نوع سجل جديد بالحقول fields (بنفس ترتيب أعمدة SELECT)؛ يُنشأ من صف: Listing(row)."""
+    fields = tuple(fields)
+    return type(name, (Record,), {
+        "__slots__": (),
+        "_fields": fields,
+        "_index": {f: i for i, f in enumerate(fields)},
+    })
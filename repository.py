@@ -0,0 +1,830 @@
+"""طبقة الوصول لقاعدة البيانات المشتركة بين main.py و db_android.py.
+
+كل استعلامات التطبيق هنا: مخطط واحد وخطوات ترحيل واحدة، اتصال واحد لكل خيط
+من المجمع، ونصوص SQL ثابتة حتى يعيد sqlite3 استخدام الاستعلامات المحضرة
+(prepared statements) من ذاكرة كل اتصال بدلاً من تحليلها في كل استدعاء.
+كل استعلام يُرجع سجلات مضغوطة (records.Record) تُقرأ مثل القواميس.
+"""
+import sqlite3
+import threading
+import os
+
+from db_pool import get_pool
+from read_cache import get_read_cache
+from migrations import run_migrations, create_property_indexes, get_schema_version, add_area_key_column
+from arabic import normalize_arabic
+from records import record_type
+from query_profiler import QueryProfiler, DEFAULT_SLOW_MS
+import text_search
+import geo
+import map_clusters
+import facets
+import listing_search
+import service_tags
+import saved_searches
+import change_log
+
+# المدن الافتراضية مع إحداثيات مراكزها
+DEFAULT_CITIES = [
+    ("دمشق", 33.5138, 36.2765),
+    ("حلب", 36.2021, 37.1343),
+    ("حمص", 34.7324, 36.7137),
+    ("حماة", 35.1318, 36.7578),
+    ("اللاذقية", 35.5177, 35.7831),
+    ("طرطوس", 34.8890, 35.8866),
+    ("دير الزور", 35.3359, 40.1408),
+    ("الرقة", 35.9594, 39.0079),
+    ("الحسكة", 36.5024, 40.7477),
+    ("ريف دمشق", 33.5720, 36.4020),
+    ("درعا", 32.6189, 36.1021),
+    ("القنيطرة", 33.1260, 35.8240),
+    ("سويدا", 32.7090, 36.5660),
+    ("إدلب", 35.9306, 36.6339),
+]
+
+DEMO_USERS = [
+    ("user1", "123456", "user"),
+    ("owner1", "123456", "owner"),
+]
+
+_USERS_DDL = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        role TEXT NOT NULL CHECK(role IN ('user', 'owner', 'admin')),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+_PROPERTY_IMAGES_DDL = """
+    CREATE TABLE IF NOT EXISTS property_images (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        property_id INTEGER NOT NULL,
+        image_path TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(property_id) REFERENCES properties(id) ON DELETE CASCADE
+    )
+"""
+
+
+def _create_tables(conn):
+    conn.execute(_USERS_DDL.format(name="users"))
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS cities (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS properties (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            owner_id INTEGER NOT NULL,
+            city_id INTEGER NOT NULL,
+            area TEXT,
+            title TEXT NOT NULL,
+            description TEXT,
+            rent INTEGER,
+            lat REAL,
+            lon REAL,
+            services TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(owner_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY(city_id) REFERENCES cities(id) ON DELETE CASCADE
+        )
+        """
+    )
+    conn.execute(_PROPERTY_IMAGES_DDL)
+
+
+def _seed_defaults(conn):
+    if conn.execute("SELECT COUNT(*) FROM cities").fetchone()[0] == 0:
+        conn.executemany("INSERT INTO cities (name) VALUES (?)", [(c[0],) for c in DEFAULT_CITIES])
+    if conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0:
+        conn.executemany("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", DEMO_USERS)
+
+
+def _add_indexes(conn):
+    create_property_indexes(conn)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_property_images_property ON property_images(property_id)"
+    )
+
+
+def _add_fulltext_search(conn):
+    text_search.create_fulltext_index(conn)
+
+
+def _add_area_key(conn):
+    add_area_key_column(conn)
+
+
+def _add_spatial_index(conn):
+    geo.create_spatial_index(conn)
+
+
+def _add_map_clusters(conn):
+    map_clusters.create_cluster_tables(conn)
+
+
+def _add_area_facets(conn):
+    facets.create_facet_tables(conn)
+
+
+def _add_rent_indexes(conn):
+    listing_search.create_rent_indexes(conn)
+
+
+def _add_service_tags(conn):
+    service_tags.create_service_tables(conn)
+
+
+def _add_saved_searches(conn):
+    saved_searches.create_saved_search_tables(conn)
+
+
+def _add_change_log(conn):
+    change_log.create_change_log(conn)
+
+
+def _add_sync_devices(conn):
+    change_log.create_device_table(conn)
+
+
+def _narrow_update_triggers(conn):
+    """مشغلا التعديل في change_log وsaved_searches على أعمدة محددة، فلا تُسجل إعادة حساب
+    services_mask (retag_properties) تغييراً ولا تُنشئ تنبيهات."""
+    for name in (*change_log.UPDATE_TRIGGERS.values(), saved_searches.UPDATE_TRIGGER):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    change_log.create_update_triggers(conn)
+    saved_searches.create_update_trigger(conn)
+
+
+def _unify_schema(conn):
+    """توحيد قواعد البيانات التي أنشأتها الطبقتان السابقتان (main.py و db_android).
+
+    ملفات main.py القديمة: بدون property_images، والأدوار user/owner فقط.
+    ملفات db_android القديمة: المدن بدون إحداثيات. بعد هذه الخطوة للجميع نفس المخطط.
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(cities)")]
+    if "lat" not in columns:
+        conn.execute("ALTER TABLE cities ADD COLUMN lat REAL")
+        conn.execute("ALTER TABLE cities ADD COLUMN lon REAL")
+    conn.executemany("INSERT OR IGNORE INTO cities (name) VALUES (?)", [(c[0],) for c in DEFAULT_CITIES])
+    conn.executemany(
+        "UPDATE cities SET lat = ?, lon = ? WHERE name = ? AND lat IS NULL",
+        [(lat, lon, name) for name, lat, lon in DEFAULT_CITIES],
+    )
+
+    conn.execute(_PROPERTY_IMAGES_DDL)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_property_images_property ON property_images(property_id)"
+    )
+
+    # SQLite لا يعدّل CHECK؛ نعيد بناء جدول المستخدمين (صغير) إذا لم يسمح بالدور admin
+    users_sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'users'").fetchone()[0]
+    if "'admin'" not in users_sql:
+        conn.execute(_USERS_DDL.format(name="users_new"))
+        conn.execute(
+            "INSERT INTO users_new (id, username, password, role, created_at) "
+            "SELECT id, username, password, role, created_at FROM users"
+        )
+        conn.execute("DROP TABLE users")
+        conn.execute("ALTER TABLE users_new RENAME TO users")
+
+
+# خطوات الترحيل بالترتيب؛ رقم الخطوة = قيمة PRAGMA user_version بعد تنفيذها.
+# أضف الخطوات الجديدة في النهاية فقط ولا تعدّل الخطوات السابقة.
+MIGRATIONS = [
+    _create_tables,
+    _seed_defaults,
+    _add_indexes,
+    _add_fulltext_search,
+    _add_area_key,
+    _add_spatial_index,
+    _add_map_clusters,
+    _unify_schema,
+    _add_area_facets,
+    _add_rent_indexes,
+    _add_service_tags,
+    _add_saved_searches,
+    _add_change_log,
+    _add_sync_devices,
+    _narrow_update_triggers,
+]
+
+# نوع سجل لكل شكل من أشكال النتائج، بنفس ترتيب أعمدة SELECT
+User = record_type("User", ("id", "username", "role"))
+City = record_type("City", ("id", "name", "lat", "lon"))
+Listing = record_type("Listing", ("id", "title", "area", "description", "rent", "lat", "lon",
+                                  "services", "owner_username", "owner_id", "created_at"))
+OwnerListing = record_type("OwnerListing", ("id", "title", "area", "description", "rent", "lat",
+                                            "lon", "services", "city_id", "city_name"))
+Property = record_type("Property", ("id", "title", "area", "description", "rent", "lat", "lon",
+                                    "services", "owner_id", "city_id", "owner_username"))
+SearchResult = record_type("SearchResult", ("id", "title", "area", "description", "rent", "lat",
+                                            "lon", "services", "owner_username", "city_name"))
+
+# مشغلات الإدخال التي يستبدلها add_properties_bulk بتحديث واحد لكل دفعة
+_DEFERRED_INSERT_INDEXES = (
+    (text_search.INSERT_TRIGGER, text_search.index_rows_after),
+    (geo.INSERT_TRIGGER, geo.index_rows_after),
+    (map_clusters.INSERT_TRIGGER, map_clusters.add_rows_after),
+    (facets.INSERT_TRIGGER, facets.add_rows_after),
+    (saved_searches.INSERT_TRIGGER, saved_searches.match_rows_after),
+    # المعرّف قبل السجل: السجل يُكتب بالمعرّف
+    (change_log.PROPERTIES_UID_TRIGGER, change_log.fill_uids_after),
+    (change_log.PROPERTIES_INSERT_TRIGGER, change_log.log_properties_after),
+)
+
+# ذاكرة الصفحات أثناء الإدخال الكبير (بالكيلوبايت، حوالي 128MB) حتى تبقى فهارس
+# properties وR*Tree وجدول التجمعات في الذاكرة طوال الدفعة
+_BULK_CACHE_SIZE = -131072
+
+_UPDATABLE_FIELDS = ("title", "area", "description", "rent", "lat", "lon", "services")
+
+
+# أقل عدد من العقارات في دفعة مزامنة واحدة لتطبيقها بدون مشغلات الإدخال (مثل add_properties_bulk)
+_BULK_APPLY_MIN = 100
+
+
+def _defer_insert_triggers(conn):
+    """حذف مشغلات _DEFERRED_INSERT_INDEXES داخل المعاملة الحالية؛ يُرجع ما يلزم لـ _restore_insert_triggers."""
+    names = [name for name, _ in _DEFERRED_INSERT_INDEXES]
+    triggers = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'properties' "
+        f"AND name IN ({', '.join('?' * len(names))})",
+        names,
+    ).fetchall()
+    for name, _ in triggers:
+        conn.execute(f"DROP TRIGGER {name}")
+    # AUTOINCREMENT: كل الصفوف الجديدة أكبر من أكبر id حالي
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM properties").fetchone()[0]
+    return triggers, last_id
+
+
+def _restore_insert_triggers(conn, deferred):
+    """تحديث فهارس الصفوف المضافة منذ _defer_insert_triggers باستعلام واحد لكل فهرس، وإعادة المشغلات."""
+    triggers, last_id = deferred
+    dropped = {name for name, _ in triggers}
+    for name, index_rows in _DEFERRED_INSERT_INDEXES:
+        if name in dropped:
+            index_rows(conn, last_id)
+    for _, sql in triggers:
+        conn.execute(sql)
+
+
+def _one(row, record):
+    return record(row) if row else None
+
+
+def _all(rows, record):
+    return list(map(record, rows))
+
+
+def _iter(cursor, record, batch_size: int):
+    """سجلات المؤشر دفعةً دفعة (fetchmany) دون تحميل النتيجة كاملة في الذاكرة."""
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from map(record, rows)
+    finally:
+        cursor.close()
+
+
+# عدد الصفوف المقروءة من المؤشر في كل مرة عند التصدير
+STREAM_BATCH_SIZE = 1000
+
+_OWNER_LISTINGS_SQL = """
+    SELECT p.id, p.title, p.area, p.description, p.rent, p.lat, p.lon, p.services,
+           p.city_id, COALESCE(c.name, '')
+    FROM properties p
+    LEFT JOIN cities c ON c.id = p.city_id
+    WHERE p.owner_id = ?
+    ORDER BY p.created_at DESC
+"""
+
+
+class Repository:
+    """كل القراءات والكتابات على ملف قاعدة بيانات واحد."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.pool = get_pool(db_path)
+        # ذاكرة مؤقتة للمدن وقوائم المناطق، تُفرَّغ عند الكتابة أو تغيّر data_version
+        self.cache = get_read_cache(db_path)
+        # QueryProfiler عند تفعيل القياس (enable_profiling)، وإلا None بلا أي كلفة
+        self.profiler = None
+
+    def get_connection(self):
+        return self.pool.get_connection()
+
+    def init_db(self):
+        """تطبيق خطوات الترحيل الناقصة فقط؛ يُرجع عدد الخطوات المنفذة."""
+        applied = run_migrations(self.get_connection(), MIGRATIONS)
+        if applied:
+            self.cache.invalidate()
+        return applied
+
+    # ---------- المستخدمون ----------
+
+    def create_user(self, username: str, password: str, role: str):
+        conn = self.get_connection()
+        try:
+            with conn:
+                cur = conn.execute(
+                    "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+                    (username, password, role),
+                )
+        except sqlite3.IntegrityError:
+            raise Exception("اسم المستخدم موجود مسبقاً")
+        return cur.lastrowid
+
+    def get_user_by_credentials(self, username: str, password: str):
+        row = self.get_connection().execute(
+            "SELECT id, username, role FROM users WHERE username = ? AND password = ?",
+            (username, password),
+        ).fetchone()
+        return _one(row, User)
+
+    def get_user_by_username(self, username: str):
+        row = self.get_connection().execute(
+            "SELECT id, username, role FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        return _one(row, User)
+
+    def get_user_by_id(self, user_id: int):
+        row = self.get_connection().execute(
+            "SELECT id, username, role FROM users WHERE id = ?", (user_id,)
+        ).fetchone()
+        return _one(row, User)
+
+    # ---------- المدن والمناطق ----------
+
+    def get_cities(self):
+        conn = self.get_connection()
+
+        def load():
+            rows = conn.execute("SELECT id, name, lat, lon FROM cities ORDER BY name")
+            return _all(rows, City)
+
+        return list(self.cache.get(conn, ("cities",), load))
+
+    def get_city_by_id(self, city_id: int):
+        conn = self.get_connection()
+        cities_by_id = self.cache.get(
+            conn, ("cities_by_id",), lambda: {c["id"]: c for c in self.get_cities()}
+        )
+        return cities_by_id.get(city_id)
+
+    def data_generation(self):
+        """رقم نسخة البيانات: يتغير بعد أي كتابة، فيُعرف منه أن ما عُرض سابقاً قد تغير."""
+        return self.cache.generation(self.get_connection())
+
+    def add_city(self, name: str, lat: float = None, lon: float = None):
+        """إضافة مدينة (أو تحديث إحداثياتها إن وُجدت)؛ يُرجع رقمها."""
+        conn = self.get_connection()
+        with conn:
+            conn.execute(
+                "INSERT INTO cities (name, lat, lon) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET lat = excluded.lat, lon = excluded.lon",
+                (name, lat, lon),
+            )
+            city_id = conn.execute("SELECT id FROM cities WHERE name = ?", (name,)).fetchone()[0]
+        self.cache.invalidate()
+        return city_id
+
+    def get_all_areas_by_city(self, city_id: int):
+        """المناطق الموجودة في مدينة؛ الأشكال المختلفة لنفس الاسم (أبو رمانة / ابو رمانه) تظهر مرة واحدة."""
+        conn = self.get_connection()
+
+        def load():
+            # من جدول الملخص (سطر لكل منطقة) بدلاً من GROUP BY على عقارات المدينة
+            rows = conn.execute(
+                "SELECT area FROM area_facets WHERE city_id = ? AND area_key != '' ORDER BY area_key",
+                (city_id,),
+            )
+            return [row[0] for row in rows]
+
+        return list(self.cache.get(conn, ("areas", city_id), load))
+
+    def get_area_facets(self, city_id: int):
+        """لكل منطقة في المدينة: عدد العقارات وأقل وأعلى إيجار والوسيط وتوزيع الإيجارات
+        (facets.AreaFacet، الفئات في facets.RENT_BUCKETS)."""
+        conn = self.get_connection()
+        return list(self.cache.get(conn, ("facets", city_id), lambda: facets.city_facets(conn, city_id)))
+
+    # ---------- الخدمات ----------
+
+    def get_services(self):
+        """قائمة الخدمات المعروفة (service_tags.Service) بترتيب البت، لخيارات البحث."""
+        conn = self.get_connection()
+        return list(self.cache.get(conn, ("services",), lambda: service_tags.get_services(conn)))
+
+    def add_service(self, name: str, synonyms=()):
+        """إضافة خدمة جديدة (أو مرادفات لخدمة موجودة) وإعادة حساب قناع العقارات الموجودة."""
+        conn = self.get_connection()
+        with conn:
+            bit = service_tags.add_service(conn, name, synonyms)
+            service_tags.retag_properties(conn)
+        self.cache.invalidate()
+        return bit
+
+    def _service_tagger(self, conn):
+        return self.cache.get(conn, ("service_tagger",), lambda: service_tags.ServiceTagger.load(conn))
+
+    # ---------- البحث المحفوظ والتنبيهات ----------
+
+    def save_search(self, user_id: int, city_id: int, area: str = None, min_rent: int = None,
+                    max_rent: int = None, services=None, has_location: bool = False, name: str = None):
+        """حفظ بحث للمستخدم؛ كل عقار يُضاف أو يُعدّل بعدها ويطابقه يُسجَّل تنبيهاً (get_notifications)."""
+        conn = self.get_connection()
+        services_mask = service_tags.required_mask(conn, services or ())
+        if not name:
+            city = self.get_city_by_id(city_id)
+            name = " - ".join(filter(None, [city["name"] if city else None, area or "كل المناطق"]))
+        with conn:
+            search_id = saved_searches.save_search(conn, user_id, city_id, name, area, min_rent, max_rent,
+                                                   services_mask, has_location)
+        return search_id
+
+    def get_saved_searches(self, user_id: int):
+        return saved_searches.user_searches(self.get_connection(), user_id)
+
+    def delete_saved_search(self, search_id: int, user_id: int):
+        """حذف بحث محفوظ مع تنبيهاته (المستخدم يمكنه حذف بحثه فقط)."""
+        conn = self.get_connection()
+        with conn:
+            cur = conn.execute("DELETE FROM saved_searches WHERE id = ? AND user_id = ?", (search_id, user_id))
+        return cur.rowcount > 0
+
+    def get_notifications(self, user_id: int, unread_only: bool = False,
+                          limit: int = saved_searches.DEFAULT_NOTIFICATIONS_LIMIT):
+        """أحدث التنبيهات (saved_searches.Notification): العقار الذي طابق بحثاً محفوظاً واسم البحث."""
+        return saved_searches.user_notifications(self.get_connection(), user_id, unread_only, limit)
+
+    def count_unread_notifications(self, user_id: int):
+        return self.get_connection().execute(
+            "SELECT COUNT(*) FROM notifications WHERE user_id = ? AND is_read = 0", (user_id,)
+        ).fetchone()[0]
+
+    def mark_notifications_read(self, user_id: int, up_to_id: int = None):
+        """تعليم تنبيهات المستخدم مقروءة (كلها، أو حتى up_to_id حتى لا يُعلَّم ما وصل بعد عرضها)."""
+        query = "UPDATE notifications SET is_read = 1 WHERE user_id = ? AND is_read = 0"
+        params = [user_id]
+        if up_to_id is not None:
+            query += " AND id <= ?"
+            params.append(up_to_id)
+        conn = self.get_connection()
+        with conn:
+            cur = conn.execute(query, params)
+        return cur.rowcount
+
+    # ---------- المزامنة (change_log و sync.py) ----------
+
+    def register_sync_device(self, username: str):
+        """تسجيل جهاز عند هذا الخادم لحساب username؛ يُرجع رمز الجهاز لإعطائه لـ SyncClient."""
+        conn = self.get_connection()
+        with conn:
+            user = conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+            if user is None:
+                raise Exception("المستخدم غير موجود")
+            return change_log.register_device(conn, user[0])
+
+    def sync_device_for_token(self, token: str):
+        """(device_id, user_id) للجهاز صاحب الرمز، أو None."""
+        return change_log.device_for_token(self.get_connection(), token)
+
+    def get_sync_state(self, name: str, default=None):
+        return change_log.get_state(self.get_connection(), name, default)
+
+    def set_sync_state(self, name: str, value):
+        conn = self.get_connection()
+        with conn:
+            change_log.set_state(conn, name, value)
+
+    def changes_since(self, since: int, limit: int = change_log.DEFAULT_BATCH_SIZE, exclude_origin: str = None,
+                      local_only: bool = False):
+        """دفعة التغييرات بعد المؤشر since (انظر change_log.changes_since)."""
+        return change_log.changes_since(self.get_connection(), since, limit, exclude_origin, local_only)
+
+    def apply_changes(self, changes, origin: str, pull_cursor: int = None, owner_id: int = None):
+        """تطبيق تغييرات جهاز آخر في معاملة واحدة، مع حفظ مؤشر الاستقبال فيها إن أُعطي.
+
+        owner_id: حساب الجهاز المرسل (عند الخادم)؛ انظر change_log.apply_changes.
+        """
+        conn = self.get_connection()
+        tagger = self._service_tagger(conn)
+        keys = [(change["table"], change["key"]) for change in changes]
+        # صف يتكرر في الدفعة (تعديل أو حذف بعد إدخاله فيها) يحتاج مشغلات الإدخال قد نُفذت له:
+        # الدفعة المُرسلة لا يُوثق بها، فتُطبق عندها صفاً صفاً
+        bulk = (sum(table == "properties" for table, _ in keys) >= _BULK_APPLY_MIN
+                and len(set(keys)) == len(keys))
+        # IMMEDIATE: لا كتابة أخرى بين قراءة آخر seq وتعليم التغييرات المطبقة بـ origin
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = change_log.last_seq(conn)
+            deferred = _defer_insert_triggers(conn) if bulk else None
+            result = change_log.apply_changes(conn, changes, tagger.mask, owner_id)
+            if deferred:
+                _restore_insert_triggers(conn, deferred)
+            # بعد الفهارس المؤجلة: سجل العقارات الجديدة منها أيضاً
+            change_log.mark_origin(conn, before, origin)
+            if pull_cursor is not None:
+                change_log.set_state(conn, "pull_cursor", pull_cursor)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.cache.invalidate()
+        return result
+
+    # ---------- كتابة العقارات ----------
+
+    def add_property(self, owner_id: int, city_id: int, area: str, title: str,
+                     description: str = None, rent: int = None, lat: float = None,
+                     lon: float = None, services: str = None):
+        conn = self.get_connection()
+        services_mask = self._service_tagger(conn).mask(services)
+        with conn:
+            cur = conn.execute(
+                """
+                INSERT INTO properties
+                (owner_id, city_id, area, area_key, title, description, rent, lat, lon, services, services_mask,
+                 sync_uid)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (owner_id, city_id, area, normalize_arabic(area), title, description, rent, lat, lon,
+                 services, services_mask, change_log.new_uid()),
+            )
+        self.cache.invalidate()
+        return cur.lastrowid
+
+    def add_properties_bulk(self, rows):
+        """إدخال دفعة كبيرة من العقارات في معاملة واحدة؛ يُرجع عدد الصفوف المضافة.
+
+        rows: صفوف (owner_id, city_id, area, title, description, rent, lat, lon, services)
+        بعد التحقق منها. مشغلات الإدخال (البحث النصي و R*Tree والتجمعات والملخص وسجل التغييرات) تُحذف داخل
+        المعاملة وتُحدَّث فهارسها باستعلام واحد لكل فهرس، ثم تُعاد قبل COMMIT؛
+        فإن فشلت الدفعة عادت المشغلات والبيانات كما كانت.
+        """
+        conn = self.get_connection()
+        services_mask = self._service_tagger(conn).mask
+        cache_size = conn.execute("PRAGMA cache_size").fetchone()[0]
+        conn.execute(f"PRAGMA cache_size = {_BULK_CACHE_SIZE}")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            deferred = _defer_insert_triggers(conn)
+            area_keys = {}
+
+            def area_key(area):
+                key = area_keys.get(area)
+                if key is None:
+                    key = area_keys[area] = normalize_arabic(area)
+                return key
+
+            cur = conn.executemany(
+                """
+                INSERT INTO properties
+                (owner_id, city_id, area, area_key, title, description, rent, lat, lon, services, services_mask,
+                 sync_uid)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                ((o, c, a, area_key(a), t, d, r, la, lo, sv, services_mask(sv), change_log.new_uid())
+                 for o, c, a, t, d, r, la, lo, sv in rows),
+            )
+            inserted = cur.rowcount
+            _restore_insert_triggers(conn, deferred)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.execute(f"PRAGMA cache_size = {cache_size}")
+        self.cache.invalidate()
+        return inserted
+
+    def update_property(self, property_id: int, **fields):
+        """تحديث الحقول المعطاة فقط (None يمسح القيمة).
+
+        الأعمدة غير المعطاة لا تظهر في SET، حتى لا تعمل مشغلات الإحداثيات
+        (R*Tree والتجمعات) إلا عند تغيير lat أو lon فعلاً.
+        """
+        updates = {k: v for k, v in fields.items() if k in _UPDATABLE_FIELDS}
+        if not updates:
+            return False
+        conn = self.get_connection()
+        if "area" in updates:
+            updates["area_key"] = normalize_arabic(updates["area"])
+        if "services" in updates:
+            updates["services_mask"] = self._service_tagger(conn).mask(updates["services"])
+
+        set_clause = ", ".join(f"{k} = ?" for k in updates)
+        with conn:
+            cur = conn.execute(
+                f"UPDATE properties SET {set_clause} WHERE id = ?",
+                (*updates.values(), property_id),
+            )
+        self.cache.invalidate()
+        return cur.rowcount > 0
+
+    def delete_property(self, property_id: int, owner_id: int):
+        """حذف عقار (المالك يمكنه حذف عقاره فقط)."""
+        conn = self.get_connection()
+        with conn:
+            cur = conn.execute(
+                "DELETE FROM properties WHERE id = ? AND owner_id = ?", (property_id, owner_id)
+            )
+        self.cache.invalidate()
+        return cur.rowcount > 0
+
+    # ---------- قراءة العقارات ----------
+
+    def get_property_by_id(self, property_id: int):
+        row = self.get_connection().execute(
+            """
+            SELECT p.id, p.title, p.area, p.description, p.rent, p.lat, p.lon, p.services,
+                   p.owner_id, p.city_id, u.username
+            FROM properties p
+            JOIN users u ON p.owner_id = u.id
+            WHERE p.id = ?
+            """,
+            (property_id,),
+        ).fetchone()
+        return _one(row, Property)
+
+    def get_properties_by_city(self, city_id: int):
+        rows = self.get_connection().execute(
+            """
+            SELECT p.id, p.title, p.area, p.description, p.rent, p.lat, p.lon, p.services,
+                   u.username, u.id, p.created_at
+            FROM properties p
+            JOIN users u ON p.owner_id = u.id
+            WHERE p.city_id = ?
+            ORDER BY p.created_at DESC
+            """,
+            (city_id,),
+        )
+        return _all(rows, Listing)
+
+    def get_properties_by_owner(self, owner_id: int):
+        # اسم المدينة يأتي مع العقار عبر JOIN بدلاً من get_city_by_id لكل عقار
+        rows = self.get_connection().execute(_OWNER_LISTINGS_SQL, (owner_id,))
+        return _all(rows, OwnerListing)
+
+    def iter_properties_by_owner(self, owner_id: int, batch_size: int = STREAM_BATCH_SIZE):
+        """مثل get_properties_by_owner لكن مولّد يقرأ من المؤشر تدريجياً (للتصدير)."""
+        cursor = self.get_connection().execute(_OWNER_LISTINGS_SQL, (owner_id,))
+        return _iter(cursor, OwnerListing, batch_size)
+
+    def get_properties_by_city_and_area(self, city_id: int, area: str, limit: int = None,
+                                        after: tuple = None):
+        """عقارات مدينة ومنطقة، من الأحدث على (created_at, id).
+
+        مع limit تُرجع صفحة واحدة فقط، و after هو مؤشر آخر صف من الصفحة السابقة
+        (انظر next_page_cursor) — ترقيم keyset يبقى سريعاً مهما تقدمت الصفحات
+        لأنه يبدأ من موقع في الفهرس وليس OFFSET.
+        """
+        query = """
+            SELECT p.id, p.title, p.area, p.description, p.rent, p.lat, p.lon, p.services,
+                   u.username, u.id, p.created_at
+            FROM properties p
+            JOIN users u ON p.owner_id = u.id
+            WHERE p.city_id = ? AND p.area_key = ?
+        """
+        params = [city_id, normalize_arabic(area)]
+        if after:
+            query += " AND (p.created_at, p.id) < (?, ?)"
+            params.extend(after)
+        query += " ORDER BY p.created_at DESC, p.id DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        return _all(self.get_connection().execute(query, params), Listing)
+
+    @staticmethod
+    def next_page_cursor(page: list, limit: int):
+        """مؤشر الصفحة التالية، أو None إذا كانت هذه الصفحة الأخيرة."""
+        if not page or len(page) < limit:
+            return None
+        last = page[-1]
+        return (last["created_at"], last["id"])
+
+    def search_properties(self, city_id: int = None, area: str = None, max_rent: int = None,
+                          min_rent: int = None):
+        query, params = self._search_query(city_id, area, max_rent, min_rent)
+        return _all(self.get_connection().execute(query, params), SearchResult)
+
+    def iter_search_properties(self, city_id: int = None, area: str = None, max_rent: int = None,
+                               min_rent: int = None, batch_size: int = STREAM_BATCH_SIZE):
+        """مثل search_properties لكن مولّد يقرأ من المؤشر تدريجياً (للتصدير)."""
+        query, params = self._search_query(city_id, area, max_rent, min_rent)
+        return _iter(self.get_connection().execute(query, params), SearchResult, batch_size)
+
+    @staticmethod
+    def _search_query(city_id, area, max_rent, min_rent):
+        query = """
+            SELECT p.id, p.title, p.area, p.description, p.rent, p.lat, p.lon, p.services,
+                   u.username, c.name
+            FROM properties p
+            JOIN users u ON p.owner_id = u.id
+            JOIN cities c ON p.city_id = c.id
+            WHERE 1=1
+        """
+        params = []
+        if city_id:
+            query += " AND p.city_id = ?"
+            params.append(city_id)
+        if area:
+            query += " AND p.area_key LIKE ?"
+            params.append(f"%{normalize_arabic(area)}%")
+        if max_rent:
+            query += " AND p.rent <= ?"
+            params.append(max_rent)
+        if min_rent:
+            query += " AND p.rent >= ?"
+            params.append(min_rent)
+        query += " ORDER BY p.created_at DESC"
+        return query, params
+
+    def search_listings(self, city_id: int = None, areas=None, min_rent: int = None,
+                        max_rent: int = None, services=None, has_location: bool = False,
+                        sort: str = "newest", near: tuple = None,
+                        limit: int = listing_search.DEFAULT_PAGE_SIZE, after: tuple = None):
+        """بحث مركب بكل الفلاتر معاً وترتيب newest أو cheapest أو nearest؛ يُرجع
+        SearchPage (total، results، cursor)، انظر listing_search.search."""
+        return listing_search.search(self.get_connection(), city_id, areas, min_rent, max_rent,
+                                     services, has_location, sort, near, limit, after)
+
+    def search_properties_text(self, text: str, city_id: int = None, limit: int = 50):
+        """بحث نصي (FTS5) مرتب حسب الصلة (bm25) مع مقتطف من النص المطابق."""
+        return text_search.search(self.get_connection(), text, city_id=city_id, limit=limit)
+
+    def properties_in_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                           limit: int = 200):
+        return geo.properties_in_bbox(self.get_connection(), min_lat, min_lon, max_lat, max_lon,
+                                      limit=limit)
+
+    def clusters_in_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                         zoom: float):
+        return map_clusters.clusters_in_bbox(self.get_connection(), min_lat, min_lon, max_lat,
+                                             max_lon, zoom)
+
+    def nearest_properties(self, lat: float, lon: float, k: int = 10, min_rent: int = None,
+                           max_rent: int = None, area: str = None):
+        return geo.nearest_properties(self.get_connection(), lat, lon, k=k, min_rent=min_rent,
+                                      max_rent=max_rent,
+                                      area_key=normalize_arabic(area) if area else None)
+
+    # ---------- القياس ----------
+
+    def enable_profiling(self, slow_ms: float = DEFAULT_SLOW_MS, log=None):
+        """قياس زمن كل دالة واستعلاماتها، وتسجيل ما يتجاوز slow_ms مع خطة تنفيذه."""
+        self.disable_profiling()
+        self.profiler = QueryProfiler(slow_ms, log)
+        self.profiler.install(self)
+        return self.profiler
+
+    def disable_profiling(self):
+        if self.profiler is not None:
+            self.profiler.uninstall(self)
+            self.profiler = None
+
+    def check_db_status(self):
+        try:
+            conn = self.get_connection()
+            tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+            return {
+                "db_file": self.db_path,
+                "tables": tables,
+                "user_count": conn.execute("SELECT COUNT(*) FROM users").fetchone()[0],
+                "property_count": conn.execute("SELECT COUNT(*) FROM properties").fetchone()[0],
+                "schema_version": get_schema_version(conn),
+                "connections": self.pool.stats(),
+                "read_cache": self.cache.stats(),
+                "profiling": self.profiler.report() if self.profiler else {"enabled": False},
+                "status": "healthy",
+            }
+        except Exception as e:
+            return {"db_file": self.db_path, "error": str(e), "status": "error"}
+
+
+_repositories = {}
+_repositories_lock = threading.Lock()
+
+
+def get_repository(db_path: str):
+    """الـ Repository المشترك لملف قاعدة بيانات معين (يُنشأ مرة واحدة)."""
+    key = os.path.abspath(db_path)
+    with _repositories_lock:
+        repo = _repositories.get(key)
+        if repo is None:
+            repo = Repository(db_path)
+            _repositories[key] = repo
+        return repo
@@ -0,0 +1,174 @@
+"""عمليات البحث المحفوظة لكل مستخدم، وتنبيه عند إضافة أو تعديل عقار يطابق إحداها.
+
+المطابقة تتم في SQLite مع كل كتابة (مشغلات مثل facets وgeo)، من جهة العقار: للعقار
+الجديد تُقرأ فقط عمليات البحث في مدينته ومنطقته (أو "كل المناطق") من الفهرس
+(city_id, area_key, min_rent)، ثم يُفحص أعلى الإيجار والخدمات والموقع لكل منها:
+
+    saved_searches  بحث محفوظ: مدينة، منطقة ('' = كل المناطق)، مجال إيجار، قناع خدمات
+    notifications   (search_id, property_id) مرة واحدة لكل عقار مطابق
+
+الإيجار غير المحدد يُخزن حدوداً مفتوحة (0 و UNBOUNDED_RENT) حتى يبقى الشرط مقارنة
+على الفهرس؛ العقار بدون إيجار يطابق فقط البحث بدون حدود للإيجار.
+"""
+from arabic import normalize_arabic
+from records import record_type
+
+# أعلى إيجار للبحث بدون حد أعلى (أكبر من أي إيجار حقيقي)
+UNBOUNDED_RENT = 1 << 62
+INSERT_TRIGGER = "saved_searches_match_ai"
+UPDATE_TRIGGER = "saved_searches_match_au"
+# عدد التنبيهات المعروضة افتراضياً
+DEFAULT_NOTIFICATIONS_LIMIT = 50
+
+SavedSearch = record_type("SavedSearch", ("id", "name", "city_id", "area", "min_rent", "max_rent",
+                                          "services_mask", "has_location", "created_at"))
+Notification = record_type("Notification", ("id", "search_id", "search_name", "property_id", "title",
+                                            "area", "rent", "is_read", "created_at"))
+
+
+def _match_conditions(row):
+    return f"""
+        s.city_id = {row}.city_id
+          AND s.area_key IN ({row}.area_key, '')
+          AND s.min_rent <= COALESCE({row}.rent, 0)
+          AND s.max_rent >= COALESCE({row}.rent, {UNBOUNDED_RENT})
+          AND {row}.services_mask & s.services_mask = s.services_mask
+          AND (s.has_location = 0 OR ({row}.lat IS NOT NULL AND {row}.lon IS NOT NULL))
+    """
+
+
+def _notify_sql(row):
+    return f"""
+        INSERT OR IGNORE INTO notifications (user_id, search_id, property_id)
+        SELECT s.user_id, s.id, {row}.id FROM saved_searches s WHERE {_match_conditions(row)}
+    """
+
+
+def create_saved_search_tables(conn):
+    """جداول البحث المحفوظ والتنبيهات ومشغلات المطابقة."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS saved_searches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            city_id INTEGER NOT NULL,
+            area TEXT NOT NULL DEFAULT '',
+            area_key TEXT NOT NULL DEFAULT '',
+            min_rent INTEGER NOT NULL DEFAULT 0,
+            max_rent INTEGER NOT NULL,
+            services_mask INTEGER NOT NULL DEFAULT 0,
+            has_location INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY(city_id) REFERENCES cities(id) ON DELETE CASCADE
+        )
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_saved_searches_match ON saved_searches(city_id, area_key, min_rent)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_saved_searches_user ON saved_searches(user_id)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            search_id INTEGER NOT NULL,
+            property_id INTEGER NOT NULL,
+            is_read INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (search_id, property_id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id, id)")
+    # التنبيهات غير المقروءة فقط: عدّها لشارة الواجهة من فهرس صغير
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_notifications_unread ON notifications(user_id, id) WHERE is_read = 0"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_notifications_property ON notifications(property_id)")
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS saved_searches_match_ai AFTER INSERT ON properties BEGIN
+            {_notify_sql("new")};
+        END
+    """)
+    create_update_trigger(conn)
+    # foreign_keys غير مفعلة في الاتصالات، فالحذف المتسلسل بالمشغلات
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS notifications_property_ad AFTER DELETE ON properties BEGIN
+            DELETE FROM notifications WHERE property_id = old.id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS notifications_search_ad AFTER DELETE ON saved_searches BEGIN
+            DELETE FROM notifications WHERE search_id = old.id;
+        END
+    """)
+
+
+def create_update_trigger(conn):
+    """عقار عُدّل فصار يطابق بحثاً لم يطابقه سابقاً؛ التنبيه السابق لنفس البحث لا يتكرر (UNIQUE).
+
+    على services (النص) لا services_mask: تعديل الخدمات يغيرهما معاً، أما إعادة حساب القناع
+    وحده بعد إضافة خدمة (service_tags.retag_properties) فليست تعديلاً للعقار ولا تُنبّه.
+    """
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {UPDATE_TRIGGER}
+        AFTER UPDATE OF city_id, area_key, rent, services, lat, lon ON properties BEGIN
+            {_notify_sql("new")};
+        END
+    """)
+
+
+def match_rows_after(conn, after_id: int):
+    """مطابقة العقارات ذات id > after_id مع كل عمليات البحث المحفوظة باستعلام واحد (للإدخال الكبير)."""
+    conn.execute(f"""
+        INSERT OR IGNORE INTO notifications (user_id, search_id, property_id)
+        SELECT s.user_id, s.id, p.id
+        FROM properties p JOIN saved_searches s ON {_match_conditions("p")}
+        WHERE p.id > ?
+    """, (after_id,))
+
+
+def save_search(conn, user_id: int, city_id: int, name: str, area: str = None, min_rent: int = None,
+                max_rent: int = None, services_mask: int = 0, has_location: bool = False):
+    if min_rent is not None and max_rent is not None and min_rent > max_rent:
+        raise ValueError("أقل إيجار أكبر من أعلى إيجار")
+    cur = conn.execute(
+        """
+        INSERT INTO saved_searches
+        (user_id, name, city_id, area, area_key, min_rent, max_rent, services_mask, has_location)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (user_id, name, city_id, area or "", normalize_arabic(area), min_rent or 0,
+         UNBOUNDED_RENT if max_rent is None else max_rent, services_mask, int(bool(has_location))),
+    )
+    return cur.lastrowid
+
+
+def user_searches(conn, user_id: int):
+    rows = conn.execute(
+        f"""
+        SELECT id, name, city_id, NULLIF(area, ''), NULLIF(min_rent, 0), NULLIF(max_rent, {UNBOUNDED_RENT}),
+               services_mask, has_location, created_at
+        FROM saved_searches
+        WHERE user_id = ?
+        ORDER BY id DESC
+        """,
+        (user_id,),
+    )
+    return list(map(SavedSearch, rows))
+
+
+def user_notifications(conn, user_id: int, unread_only: bool = False, limit: int = DEFAULT_NOTIFICATIONS_LIMIT):
+    rows = conn.execute(
+        f"""
+        SELECT n.id, n.search_id, s.name, n.property_id, p.title, p.area, p.rent, n.is_read, n.created_at
+        FROM notifications n
+        JOIN saved_searches s ON s.id = n.search_id
+        JOIN properties p ON p.id = n.property_id
+        WHERE n.user_id = ? {"AND n.is_read = 0" if unread_only else ""}
+        ORDER BY n.id DESC
+        LIMIT ?
+        """,
+        (user_id, limit),
+    )
+    return list(map(Notification, rows))
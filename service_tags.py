@@ -0,0 +1,192 @@
+"""الخدمات كقائمة ثابتة (مدرسة، مولدة، مواصلات...) بدلاً من نص حر فقط.
+
+لكل خدمة بت في العمود properties.services_mask، فالعقار الذي فيه "مدرسة + مولدة"
+قناعه (1 << 0) | (1 << 1)، والبحث عن عدة خدمات معاً شرط واحد على رقم صحيح:
+
+    services_mask & :required = :required
+
+النص الحر في services يبقى للعرض كما كتبه المالك، ويُستخرج منه القناع عند الكتابة
+(مثل area_key) بمطابقة كلماته مع أسماء الخدمات ومرادفاتها في service_terms:
+
+    service_vocabulary  bit -> key, name
+    service_terms       term (كلمات موحدة) -> bit
+"""
+import re
+
+from arabic import normalize_arabic
+from records import record_type
+
+# INTEGER في SQLite بإشارة (64 بت)؛ البت 63 يجعل القناع سالباً، فالحد 63 خدمة
+MAX_SERVICES = 63
+
+# الخدمات الأولى ومرادفاتها الشائعة في إعلانات الإيجار؛ ترتيبها هو رقم البت ولا يتغير
+DEFAULT_SERVICES = [
+    ("مدرسة", ("مدارس",)),
+    ("مولدة", ("امبيرات", "أمبير", "مولدة كهرباء")),
+    ("مواصلات", ("نقل", "سرفيس", "باص", "مواصلات عامة")),
+    ("مستشفى", ("مشفى", "مستوصف")),
+    ("صيدلية", ()),
+    ("فرن", ("مخبز",)),
+    ("جامع", ("مسجد",)),
+    ("حديقة", ("حدائق",)),
+    ("طاقة شمسية", ("ألواح شمسية", "طاقة بديلة")),
+    ("إنترنت", ("انترنت", "نت", "واي فاي", "wifi", "adsl")),
+    ("موقف سيارات", ("موقف", "كراج", "مرآب")),
+    ("مصعد", ("أسانسير",)),
+]
+
+# فهرس عدّ نتائج البحث بالخدمات (listing_search)
+COUNT_INDEX = "idx_properties_city_services_rent"
+
+Service = record_type("Service", ("bit", "key", "name"))
+
+# فواصل القوائم في النص الحر: علامات الترقيم العربية واللاتينية والرموز
+_SEPARATORS = re.compile(r"[^\w]+")
+# أدوات التعريف والجر الملتصقة بالكلمة ("والمدرسة" و"بالمواصلات" -> "مدرسه"، "مواصلات")
+_PREFIXES = ("وال", "بال", "فال", "كال", "لل", "ال")
+# أطول عبارة في المرادفات (بالكلمات)
+_MAX_TERM_WORDS = 3
+
+
+def _stem(word):
+    for prefix in _PREFIXES:
+        if word.startswith(prefix) and len(word) - len(prefix) >= 2:
+            return word[len(prefix):]
+    return word
+
+
+def tokenize(text):
+    """كلمات النص موحدة (arabic.normalize_arabic) وبدون "ال" وأدوات الجر الملتصقة."""
+    return [_stem(w) for w in _SEPARATORS.split(normalize_arabic(text)) if w]
+
+
+def term_key(name):
+    return " ".join(tokenize(name))
+
+
+def create_service_tables(conn):
+    """جداول الخدمات والعمود services_mask وفهرسه، وتعبئة القناع من النص الحر الموجود."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS service_vocabulary (
+            bit INTEGER PRIMARY KEY CHECK (bit >= 0 AND bit < 63),
+            key TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS service_terms (
+            term TEXT PRIMARY KEY,
+            bit INTEGER NOT NULL REFERENCES service_vocabulary(bit)
+        ) WITHOUT ROWID
+    """)
+    for name, synonyms in DEFAULT_SERVICES:
+        add_service(conn, name, synonyms)
+
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(properties)")]
+    if "services_mask" not in columns:
+        conn.execute("ALTER TABLE properties ADD COLUMN services_mask INTEGER NOT NULL DEFAULT 0")
+    retag_properties(conn)
+    # عدّ نتائج البحث بالخدمات (مع مجال الإيجار) من الفهرس وحده (covering)، في مدينة أو في كل المدن
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {COUNT_INDEX} ON properties(city_id, services_mask, rent)")
+
+
+def add_service(conn, name: str, synonyms=()):
+    """إضافة خدمة (أو مرادفات لخدمة موجودة بنفس الاسم)؛ يُرجع رقم البت.
+
+    العقارات الموجودة لا يتغير قناعها هنا؛ بعد إضافة خدمة جديدة استدعِ retag_properties.
+    """
+    key = term_key(name)
+    if not key:
+        raise ValueError("اسم الخدمة فارغ")
+    row = conn.execute("SELECT bit FROM service_vocabulary WHERE key = ?", (key,)).fetchone()
+    if row:
+        bit = row[0]
+    else:
+        bit = conn.execute("SELECT COALESCE(MAX(bit) + 1, 0) FROM service_vocabulary").fetchone()[0]
+        if bit >= MAX_SERVICES:
+            raise ValueError(f"لا يمكن إضافة أكثر من {MAX_SERVICES} خدمة")
+        conn.execute("INSERT INTO service_vocabulary (bit, key, name) VALUES (?, ?, ?)",
+                     (bit, key, name.strip()))
+    conn.executemany(
+        "INSERT OR IGNORE INTO service_terms (term, bit) VALUES (?, ?)",
+        [(term, bit) for term in {key, *map(term_key, synonyms)} if term],
+    )
+    return bit
+
+
+def get_services(conn):
+    """كل الخدمات (Service) بترتيب البت."""
+    return list(map(Service, conn.execute("SELECT bit, key, name FROM service_vocabulary ORDER BY bit")))
+
+
+def required_mask(conn, services):
+    """قناع الخدمات المطلوبة في البحث (أسماء أو مرادفات)؛ ValueError لخدمة غير معروفة."""
+    mask = 0
+    for name in services:
+        row = conn.execute("SELECT bit FROM service_terms WHERE term = ?", (term_key(name),)).fetchone()
+        if row is None:
+            raise ValueError(f"خدمة غير معروفة: {name}")
+        mask |= 1 << row[0]
+    return mask
+
+
+class ServiceTagger:
+    """يحوّل نص الخدمات الحر إلى قناع؛ يُنشأ مرة من service_terms ويُستخدم لكل الصفوف."""
+
+    def __init__(self, terms):
+        self.terms = terms
+        self._cache = {}
+
+    @classmethod
+    def load(cls, conn):
+        return cls({tuple(term.split()): bit for term, bit in conn.execute(
+            "SELECT term, bit FROM service_terms")})
+
+    def mask(self, text):
+        if not text:
+            return 0
+        mask = self._cache.get(text)
+        if mask is not None:
+            return mask
+        words = tokenize(text)
+        # "مدرسة ومولدة": الواو الملتصقة قد تكون عطفاً أو جزءاً من الكلمة، فنجرب الشكلين
+        variants = [words]
+        if any(w.startswith("و") and len(w) > 3 for w in words):
+            variants.append([_stem(w[1:]) if w.startswith("و") and len(w) > 3 else w for w in words])
+        mask = 0
+        for seq in variants:
+            for i in range(len(seq)):
+                for n in range(1, min(_MAX_TERM_WORDS, len(seq) - i) + 1):
+                    bit = self.terms.get(tuple(seq[i:i + n]))
+                    if bit is not None:
+                        mask |= 1 << bit
+        if len(self._cache) < 10000:
+            self._cache[text] = mask
+        return mask
+
+
+# عدد العقارات المقروءة في كل دفعة عند إعادة حساب القناع
+RETAG_BATCH_SIZE = 5000
+
+
+def retag_properties(conn, tagger: ServiceTagger = None):
+    """إعادة حساب services_mask لكل العقارات من نص الخدمات (بعد ترحيل أو إضافة خدمة)؛
+    دفعات على المفتاح الأساسي، ولا يُكتب إلا ما تغير قناعه. يُرجع عدد العقارات المحدثة."""
+    tagger = tagger or ServiceTagger.load(conn)
+    changed, last_id = 0, 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, services, services_mask FROM properties WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, RETAG_BATCH_SIZE),
+        ).fetchall()
+        if not rows:
+            return changed
+        last_id = rows[-1][0]
+        updates = [(mask, prop_id) for prop_id, text, old in rows if (mask := tagger.mask(text)) != old]
+        conn.executemany("UPDATE properties SET services_mask = ? WHERE id = ?", updates)
+        changed += len(updates)
+
+
+def service_names(services, mask: int):
+    """أسماء الخدمات (من get_services) الموجودة في القناع."""
+    return [s["name"] for s in services if mask >> s["bit"] & 1]
@@ -0,0 +1,286 @@
+"""مزامنة الأجهزة (offline-first) مع خادم عبر سجل التغييرات (change_log).
+
+كل جهاز يعمل على ملفه المحلي ويسجل تغييراته؛ عند الاتصال يرسل ما تغير منذ آخر
+مزامنة ثم يستقبل ما تغير في الخادم منذ آخر مؤشر، على دفعات بحجم ثابت وبجسم JSON
+مضغوط (gzip):
+
+    POST /push                 {"changes": [...]}  ->  {"applied", "skipped"}
+    GET  /pull?since=<seq>     ->  {"changes": [...], "cursor", "more"}
+
+كل طلب يحمل رمز الجهاز (Authorization: Bearer <token>) الذي يصدره الخادم لحساب واحد
+(register)؛ بدونه يُرفض الطلب (401)، والجهاز لا يكتب إلا عقارات حسابه (change_log.apply_changes).
+الرمز يُرسل مع كل طلب، فالخادم الحقيقي يجب أن يكون خلف https.
+
+عند التعارض تبقى آخر نسخة تصل إلى الخادم؛ الجهاز يرسل قبل أن يستقبل، فلا تُستبدل
+تغييراته غير المرسلة بنسخة الخادم. الخادم هنا (SyncServer) بديل محلي للاختبار بدون
+شبكة، فوق Repository عادي:
+
+    python sync.py serve --db server.db --port 8765
+    python sync.py register owner1 --db server.db
+    python sync.py sync http://127.0.0.1:8765 --db city_mover.db --token <token>
+"""
+import argparse
+import gzip
+import json
+import sqlite3
+import sys
+import threading
+import urllib.parse
+import urllib.request
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import change_log
+from repository import get_repository
+
+# اسم مصدر التغييرات التي يطبقها الجهاز من الخادم (origin في change_log)
+SERVER_ORIGIN = "server"
+SYNC_TIMEOUT = 30
+# أكبر جسم طلب يقبله الخادم (قبل فك الضغط وبعده)
+MAX_BODY_BYTES = 32 * 1024 * 1024
+# مستوى ضغط gzip: 6 يقارب حجم 9 (الافتراضي) لنص JSON بأقل من نصف الوقت
+COMPRESS_LEVEL = 6
+
+
+def encode_body(payload):
+    return gzip.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode(), COMPRESS_LEVEL)
+
+
+class _SyncRequestHandler(BaseHTTPRequestHandler):
+    def _device(self):
+        """(device_id, user_id) لرمز الطلب، أو None بعد رد 401."""
+        scheme, _, token = self.headers.get("Authorization", "").partition(" ")
+        device = self.server.repo.sync_device_for_token(token) if scheme == "Bearer" else None
+        if device is None:
+            self._send(401, {"error": "جهاز غير مسجل"})
+        return device
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != "/pull":
+            self._send(404, {"error": "not found"})
+            return
+        device = self._device()
+        if device is None:
+            return
+        query = urllib.parse.parse_qs(url.query)
+        try:
+            since = int(query.get("since", ["0"])[0])
+            limit = min(int(query.get("limit", [change_log.DEFAULT_BATCH_SIZE])[0]), self.server.max_batch)
+        except ValueError:
+            self._send(400, {"error": "since غير صالح"})
+            return
+        self._send(200, self.server.repo.changes_since(since, limit, exclude_origin=device[0]))
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != "/push":
+            self._send(404, {"error": "not found"})
+            return
+        device = self._device()
+        if device is None:
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if not 0 <= length <= MAX_BODY_BYTES:
+            self._send(413, {"error": "الطلب أكبر من المسموح"})
+            return
+        try:
+            body = self.rfile.read(length)
+            if self.headers.get("Content-Encoding") == "gzip":
+                # فك ضغط محدود: جسم مضغوط صغير قد ينفك إلى حجم كبير جداً
+                inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                body = inflater.decompress(body, MAX_BODY_BYTES + 1)
+                if len(body) > MAX_BODY_BYTES or inflater.unconsumed_tail:
+                    self._send(413, {"error": "الطلب أكبر من المسموح"})
+                    return
+            result = self.server.repo.apply_changes(json.loads(body)["changes"], origin=device[0],
+                                                    owner_id=device[1])
+        except sqlite3.IntegrityError as e:
+            self._send(409, {"error": str(e)})
+            return
+        except sqlite3.Error as e:
+            self._send(500, {"error": str(e)})
+            return
+        except (ValueError, KeyError, TypeError, OSError, zlib.error) as e:
+            self._send(400, {"error": str(e)})
+            return
+        self._send(200, result)
+
+    def _send(self, status: int, payload):
+        body = encode_body(payload)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SyncServer(HTTPServer):
+    """خادم مزامنة محلي فوق ملف قاعدة بيانات (بنفس نمط tile_cache.TileServer)."""
+
+    def __init__(self, db_path: str, host: str = "127.0.0.1", port: int = 0, workers: int = 4,
+                 max_batch: int = 5 * change_log.DEFAULT_BATCH_SIZE):
+        super().__init__((host, port), _SyncRequestHandler)
+        self.repo = get_repository(db_path)
+        self.repo.init_db()
+        self.max_batch = max_batch
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sync")
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="sync-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.executor.shutdown(wait=True)
+
+
+class SyncClient:
+    """مزامنة ملف محلي (Repository) مع خادم على url.
+
+    token: رمز الجهاز من الخادم (sync.py register)؛ بدونه يُستخدم المحفوظ في sync_state.
+    """
+
+    def __init__(self, repo, url: str, token: str = None, batch_size: int = change_log.DEFAULT_BATCH_SIZE,
+                 timeout: float = SYNC_TIMEOUT):
+        self.repo = repo
+        self.url = url.rstrip("/")
+        self.token = token or repo.get_sync_state("token", "")
+        self.batch_size = batch_size
+        self.timeout = timeout
+        # حجم الأجسام المرسلة والمستقبلة (مضغوطة وغير مضغوطة) لآخر مزامنة
+        self.bytes = {"sent": 0, "sent_raw": 0, "received": 0, "received_raw": 0}
+
+    def _request(self, path: str, payload=None):
+        headers = {"Accept-Encoding": "gzip", "Authorization": f"Bearer {self.token}"}
+        data = None
+        if payload is not None:
+            raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+            data = gzip.compress(raw, COMPRESS_LEVEL)
+            headers.update({"Content-Type": "application/json", "Content-Encoding": "gzip"})
+            self.bytes["sent"] += len(data)
+            self.bytes["sent_raw"] += len(raw)
+        request = urllib.request.Request(self.url + path, data=data, headers=headers)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            body = response.read()
+        self.bytes["received"] += len(body)
+        if response.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        self.bytes["received_raw"] += len(body)
+        return json.loads(body)
+
+    def push(self):
+        """إرسال التغييرات المحلية غير المرسلة على دفعات؛ يُرجع عدد التغييرات المرسلة."""
+        sent = 0
+        while True:
+            batch = self.repo.changes_since(int(self.repo.get_sync_state("push_cursor", 0)),
+                                            self.batch_size, local_only=True)
+            if batch["changes"]:
+                self._request("/push", {"changes": batch["changes"]})
+                sent += len(batch["changes"])
+            self.repo.set_sync_state("push_cursor", batch["cursor"])
+            if not batch["more"]:
+                return sent
+
+    def pull(self):
+        """استقبال تغييرات الخادم بعد آخر مؤشر على دفعات؛ يُرجع عدد التغييرات المطبقة."""
+        applied = 0
+        while True:
+            since = int(self.repo.get_sync_state("pull_cursor", 0))
+            batch = self._request(f"/pull?since={since}&limit={self.batch_size}")
+            # المؤشر يُحفظ في نفس معاملة الدفعة، فالمزامنة المنقطعة تُستأنف من آخر دفعة مطبقة
+            applied += self.repo.apply_changes(batch["changes"], origin=SERVER_ORIGIN,
+                                               pull_cursor=batch["cursor"])["applied"]
+            if not batch["more"]:
+                return applied
+
+    def sync(self):
+        """إرسال ثم استقبال؛ يُرجع {"pushed", "pulled", "bytes"}."""
+        self.bytes = dict.fromkeys(self.bytes, 0)
+        pushed = self.push()
+        pulled = self.pull()
+        return {"pushed": pushed, "pulled": pulled, "bytes": dict(self.bytes)}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="sync.py")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="تشغيل خادم مزامنة محلي")
+    serve.add_argument("--db", default="sync_server.db")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+
+    register = sub.add_parser("register", help="إصدار رمز جهاز لحساب عند الخادم")
+    register.add_argument("username")
+    register.add_argument("--db", default="sync_server.db")
+
+    run = sub.add_parser("sync", help="مزامنة ملف محلي مع خادم")
+    run.add_argument("url")
+    run.add_argument("--db", default="city_mover.db")
+    run.add_argument("--token", help="رمز الجهاز (يُحفظ للمزامنات التالية)")
+    run.add_argument("--batch", type=int, default=change_log.DEFAULT_BATCH_SIZE)
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        server = SyncServer(args.db, args.host, args.port)
+        print(f"خادم المزامنة على {server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            server.executor.shutdown(wait=True)
+        return 0
+
+    repo = get_repository(args.db)
+    repo.init_db()
+    if args.command == "register":
+        try:
+            print(repo.register_sync_device(args.username))
+        except Exception as e:
+            print(e)
+            return 1
+        return 0
+
+    if args.token:
+        repo.set_sync_state("token", args.token)
+    try:
+        result = SyncClient(repo, args.url, batch_size=args.batch).sync()
+    except OSError as e:
+        print(f"تعذر الاتصال بخادم المزامنة: {e}")
+        return 1
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
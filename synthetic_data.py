@@ -0,0 +1,128 @@
+"""بيانات تجريبية قابلة للتكرار: مستخدمون ومدن ومناطق عربية وعقارات بإحداثيات وخدمات.
+
+    python synthetic_data.py --db bench.db --listings 100000 --seed 42
+
+نفس seed ونفس الأعداد تعطي نفس البيانات تماماً (عدا created_at)، فتُقارن القياسات
+بين نسخ مختلفة من الكود على بيانات متطابقة.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from listing_rules import DAMASCUS, DAMASCUS_ACTIVE_AREAS, DAMASCUS_ALL_AREAS
+from repository import get_repository
+
+# مدن إضافية تُستخدم عند طلب مدن أكثر من المدن الافتراضية
+EXTRA_CITIES = [
+    ("جبلة", 35.3616, 35.9256), ("بانياس", 35.1823, 35.9497), ("تدمر", 34.5601, 38.2674),
+    ("منبج", 36.5281, 37.9549), ("القامشلي", 37.0517, 41.2280), ("السلمية", 35.0113, 37.0532),
+    ("النبك", 34.0240, 36.7286), ("يبرود", 33.9672, 36.6577), ("صافيتا", 34.8209, 36.1170),
+    ("معرة النعمان", 35.6486, 36.6718), ("البوكمال", 34.4536, 40.9182), ("الميادين", 35.0192, 40.4514),
+]
+# مناطق عامة لباقي المدن (دمشق تستخدم DAMASCUS_ALL_AREAS)
+AREA_NAMES = [
+    "المركز", "الحي الشرقي", "الحي الغربي", "الحي الشمالي", "الحي الجنوبي", "الجامعة",
+    "المحطة", "الشهداء", "الزهراء", "النزهة", "الفرقان", "الحمدانية", "السبيل", "العزيزية",
+    "الصناعة", "المشفى", "الكورنيش", "الضاحية", "الأوقاف", "البساتين",
+]
+TITLE_WORDS = ["شقة", "منزل", "بيت عربي", "استوديو", "فيلا", "غرفة", "طابق"]
+DESCRIPTION_WORDS = ["واسعة", "مفروشة", "مشمسة", "حديثة", "هادئة", "إطلالة", "طابق", "أول",
+                     "ثاني", "شرفة", "مطبخ", "حمامين", "تدفئة", "تكييف", "قريبة", "السوق",
+                     "كسوة", "ممتازة", "أرضي", "حديقة"]
+SERVICE_WORDS = ["مدرسة", "مولدة", "مواصلات", "مستشفى", "صيدلية", "فرن", "جامع", "حديقة",
+                 "طاقة شمسية", "إنترنت", "موقف سيارات", "مصعد"]
+# نسبة العقارات بدون إحداثيات (كما يحدث عندما لا يحدد المالك الموقع)
+NO_LOCATION_RATIO = 0.1
+# نسبة عقارات دمشق في المناطق المفعلة
+DAMASCUS_ACTIVE_RATIO = 0.85
+# دفعة الإدخال في add_properties_bulk
+INSERT_CHUNK = 50000
+DEMO_PASSWORD = "123456"
+
+
+def _area_for(rnd, city_name):
+    if city_name == DAMASCUS:
+        # معظمها في المناطق المفعلة (نموذج المالك يفرضها)، والباقي عقارات أقدم في باقي المناطق
+        if rnd.random() < DAMASCUS_ACTIVE_RATIO:
+            return rnd.choice(DAMASCUS_ACTIVE_AREAS)
+        return rnd.choice(DAMASCUS_ALL_AREAS)
+    return rnd.choice(AREA_NAMES)
+
+
+def listing_rows(rnd, count: int, owner_ids: list, cities: list):
+    """صفوف add_properties_bulk: إحداثيات موزعة حول مركز كل مدينة، وبعض العقارات بدون إيجار أو موقع."""
+    for _ in range(count):
+        city = cities[min(int(rnd.paretovariate(1.2)) - 1, len(cities) - 1)]
+        area = _area_for(rnd, city["name"])
+        if city["lat"] is not None and rnd.random() >= NO_LOCATION_RATIO:
+            lat, lon = rnd.gauss(city["lat"], 0.03), rnd.gauss(city["lon"], 0.03)
+        else:
+            lat = lon = None
+        title = f"{rnd.choice(TITLE_WORDS)} {rnd.choice(DESCRIPTION_WORDS)} في {area}"
+        description = " ".join(rnd.choices(DESCRIPTION_WORDS, k=rnd.randint(4, 16)))
+        rent = rnd.randrange(100000, 3000000, 25000) if rnd.random() > 0.05 else None
+        services = "، ".join(rnd.sample(SERVICE_WORDS, rnd.randint(1, 5)))
+        yield (rnd.choice(owner_ids), city["id"], area, title, description, rent, lat, lon, services)
+
+
+def generate(repo, listings: int, owners: int = 50, users: int = 200, extra_cities: int = 0,
+             seed: int = 42):
+    """تعبئة قاعدة بيانات Repository؛ يُرجع ملخصاً بالأعداد والزمن.
+
+    المدن الأكبر (الأولى في الترتيب) تأخذ حصة أكبر من العقارات، كما في البيانات الحقيقية.
+    """
+    rnd = random.Random(seed)
+    started = time.perf_counter()
+    repo.init_db()
+
+    for name, lat, lon in EXTRA_CITIES[:extra_cities]:
+        repo.add_city(name, lat, lon)
+    # ترتيب ثابت: المدن الافتراضية أولاً حسب رقمها
+    cities = sorted(repo.get_cities(), key=lambda c: c["id"])
+
+    owner_ids = []
+    for i in range(owners):
+        owner_ids.append(_ensure_user(repo, f"owner_{seed}_{i}", "owner"))
+    for i in range(users):
+        _ensure_user(repo, f"user_{seed}_{i}", "user")
+
+    rows = listing_rows(rnd, listings, owner_ids, cities)
+    inserted = 0
+    while inserted < listings:
+        inserted += repo.add_properties_bulk(
+            next(rows) for _ in range(min(INSERT_CHUNK, listings - inserted))
+        )
+    return {
+        "seed": seed, "listings": inserted, "owners": owners, "users": users,
+        "cities": len(cities), "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def _ensure_user(repo, username: str, role: str):
+    user = repo.get_user_by_username(username)
+    if user is not None:
+        return user["id"]
+    return repo.create_user(username, DEMO_PASSWORD, role)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="synthetic_data.py")
+    # بدون قيمة افتراضية: لا تُكتب البيانات التجريبية (وحسابات بكلمة مرور معروفة) في ملف التطبيق بالخطأ
+    parser.add_argument("--db", required=True, help="ملف قاعدة بيانات للتجربة (لا ملف التطبيق)")
+    parser.add_argument("--listings", type=int, default=10000)
+    parser.add_argument("--owners", type=int, default=50)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--extra-cities", type=int, default=0, help=f"حتى {len(EXTRA_CITIES)}")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    summary = generate(get_repository(args.db), args.listings, args.owners, args.users,
+                       args.extra_cities, args.seed)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,137 @@
+import sqlite3
+
+from records import record_type
+
+# الأعمدة المفهرسة نصياً وأوزانها في ترتيب bm25 (العنوان أهم من الوصف)
+FTS_COLUMNS = ("title", "description", "services", "area")
+BM25_WEIGHTS = (5.0, 1.0, 2.0, 3.0)
+# مشغل الإدخال؛ الاستيراد الكبير يعطله ويستدعي index_rows_after بدلاً منه
+INSERT_TRIGGER = "properties_fts_ai"
+
+_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS properties_fts USING fts5(
+        title, description, services, area,
+        content='properties', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS properties_fts_ai AFTER INSERT ON properties BEGIN
+        INSERT INTO properties_fts(rowid, title, description, services, area)
+        VALUES (new.id, new.title, new.description, new.services, new.area);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS properties_fts_ad AFTER DELETE ON properties BEGIN
+        INSERT INTO properties_fts(properties_fts, rowid, title, description, services, area)
+        VALUES ('delete', old.id, old.title, old.description, old.services, old.area);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS properties_fts_au
+    AFTER UPDATE OF title, description, services, area ON properties BEGIN
+        INSERT INTO properties_fts(properties_fts, rowid, title, description, services, area)
+        VALUES ('delete', old.id, old.title, old.description, old.services, old.area);
+        INSERT INTO properties_fts(rowid, title, description, services, area)
+        VALUES (new.id, new.title, new.description, new.services, new.area);
+    END
+    """,
+    # فهرسة العقارات الموجودة مسبقاً
+    "INSERT INTO properties_fts(properties_fts) VALUES ('rebuild')",
+]
+
+
+def create_fulltext_index(conn):
+    """إنشاء جدول FTS5 ومشغلات المزامنة مع properties.
+
+    بعض نسخ SQLite على Android مبنية بدون FTS5؛ في هذه الحالة لا يُنشأ شيء
+    ويعود البحث إلى LIKE (انظر search).
+    """
+    try:
+        for sql in _FTS_DDL:
+            conn.execute(sql)
+    except sqlite3.OperationalError as e:
+        if "fts5" not in str(e):
+            raise
+        return False
+    return True
+
+
+def index_rows_after(conn, after_id: int):
+    """فهرسة العقارات ذات id > after_id دفعة واحدة (بدلاً من المشغل صفاً صفاً)."""
+    conn.execute(
+        "INSERT INTO properties_fts(rowid, title, description, services, area) "
+        "SELECT id, title, description, services, area FROM properties WHERE id > ?",
+        (after_id,),
+    )
+
+
+def has_fulltext_index(conn):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='properties_fts'"
+    ).fetchone()
+    return row is not None
+
+
+def build_match_query(text: str):
+    """تحويل نص المستخدم إلى تعبير MATCH آمن: كل كلمة بين علامتي تنصيص مع بحث بالبادئة."""
+    tokens = [t.replace('"', "") for t in text.split()]
+    return " ".join(f'"{t}"*' for t in tokens if t)
+
+
+SearchHit = record_type("SearchHit", (
+    "id", "title", "area", "description", "rent", "lat", "lon", "services",
+    "owner_username", "owner_id", "city_id", "created_at", "snippet", "rank",
+))
+
+
+def search(conn, text: str, city_id: int = None, limit: int = 50):
+    """بحث نصي مرتب بـ bm25 في العنوان والوصف والخدمات والمنطقة، مع مقتطف مطابق."""
+    match = build_match_query(text)
+    if not match:
+        return []
+
+    if not has_fulltext_index(conn):
+        return _search_like(conn, text, city_id, limit)
+
+    weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+    query = f"""
+        SELECT p.id, p.title, p.area, p.description, p.rent, p.lat, p.lon, p.services,
+               u.username, u.id, p.city_id, p.created_at,
+               snippet(properties_fts, -1, '[', ']', '…', 10),
+               bm25(properties_fts, {weights}) AS rank
+        FROM properties_fts
+        JOIN properties p ON p.id = properties_fts.rowid
+        JOIN users u ON u.id = p.owner_id
+        WHERE properties_fts MATCH ?
+    """
+    params = [match]
+    if city_id:
+        query += " AND p.city_id = ?"
+        params.append(city_id)
+    query += " ORDER BY rank LIMIT ?"
+    params.append(limit)
+
+    return list(map(SearchHit, conn.execute(query, params)))
+
+
+def _search_like(conn, text: str, city_id: int, limit: int):
+    # بديل بطيء عند غياب FTS5: كل كلمة يجب أن تظهر في أحد الأعمدة
+    query = """
+        SELECT p.id, p.title, p.area, p.description, p.rent, p.lat, p.lon, p.services,
+               u.username, u.id, p.city_id, p.created_at, NULL, 0
+        FROM properties p
+        JOIN users u ON u.id = p.owner_id
+        WHERE 1=1
+    """
+    params = []
+    if city_id:
+        query += " AND p.city_id = ?"
+        params.append(city_id)
+    for token in text.split():
+        query += " AND (" + " OR ".join(f"p.{c} LIKE ?" for c in FTS_COLUMNS) + ")"
+        params.extend([f"%{token}%"] * len(FTS_COLUMNS))
+    query += " ORDER BY p.created_at DESC LIMIT ?"
+    params.append(limit)
+    return list(map(SearchHit, conn.execute(query, params)))
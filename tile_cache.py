@@ -0,0 +1,373 @@
+"""ذاكرة تخزين محلية لبلاطات الخريطة (offline tiles).
+
+البلاطات تُحفظ في ملف MBTiles واحد (SQLite) مع حد أعلى للحجم، وعند تجاوزه
+تُحذف البلاطات الأقدم استخداماً (LRU). خادم HTTP محلي صغير يقدمها للخريطة،
+فيكفي توجيه TileLayer.url_template إليه؛ البلاطة غير الموجودة تُجلب من
+المصدر مرة واحدة ثم تُقدم من الملف.
+
+التحميل المسبق لمدينة:
+    python tile_cache.py prefetch دمشق --zooms 10-14 --radius 10
+"""
+import argparse
+import json
+import math
+import re
+import sqlite3
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import geo
+from db_pool import get_pool
+
+UPSTREAM_URL = "https://tile.openstreetmap.org/{z}/{x}/{y}.png"
+# سياسة خوادم OpenStreetMap تطلب تعريف التطبيق في User-Agent
+USER_AGENT = "CityMover/1.0 (offline tile cache)"
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024  # 100MB
+# بعد تجاوز الحد نحذف حتى 90% منه حتى لا يتكرر الحذف مع كل بلاطة جديدة
+EVICT_TO_RATIO = 0.9
+# تحديث وقت الاستخدام عند القراءة مرة كل دقيقة على الأكثر لكل بلاطة
+TOUCH_INTERVAL = 60
+MAX_PREFETCH_TILES = 5000
+FETCH_TIMEOUT = 10
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)",
+    # جدول tiles بأعمدة MBTiles القياسية (tile_row بترقيم TMS)، مع عمودين إضافيين لـ LRU
+    """
+    CREATE TABLE IF NOT EXISTS tiles (
+        zoom_level INTEGER NOT NULL,
+        tile_column INTEGER NOT NULL,
+        tile_row INTEGER NOT NULL,
+        tile_data BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        last_used REAL NOT NULL,
+        PRIMARY KEY (zoom_level, tile_column, tile_row)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_tiles_last_used ON tiles(last_used)",
+]
+
+
+def _tms_row(z: int, y: int):
+    return (1 << z) - 1 - y
+
+
+def lat_lon_to_tile(lat: float, lon: float, zoom: int):
+    """رقم البلاطة (x, y) التي تحتوي النقطة عند مستوى تكبير معين (ترقيم XYZ)."""
+    n = 1 << zoom
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    x = int((lon + 180.0) / 360.0 * n)
+    s = math.sin(math.radians(lat))
+    y = int((0.5 - math.log((1 + s) / (1 - s)) / (4 * math.pi)) * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_in_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float, zooms):
+    """كل البلاطات (z, x, y) التي تغطي المستطيل في مستويات التكبير المعطاة."""
+    for z in zooms:
+        x0, y0 = lat_lon_to_tile(max_lat, min_lon, z)
+        x1, y1 = lat_lon_to_tile(min_lat, max_lon, z)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield z, x, y
+
+
+def fetch_upstream(url_template: str, z: int, x: int, y: int, timeout: float = FETCH_TIMEOUT):
+    request = urllib.request.Request(
+        url_template.format(z=z, x=x, y=y), headers={"User-Agent": USER_AGENT}
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+class TileCache:
+    """بلاطات مخزنة في ملف MBTiles بحجم أقصى max_bytes، مع جلب الناقص من upstream."""
+
+    def __init__(self, path: str, upstream: str = UPSTREAM_URL, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.upstream = upstream
+        self.max_bytes = max_bytes
+        self.pool = get_pool(path)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.evictions = 0
+
+        conn = self.pool.get_connection()
+        with conn:
+            for sql in _SCHEMA:
+                conn.execute(sql)
+            conn.executemany(
+                "INSERT OR IGNORE INTO metadata (name, value) VALUES (?, ?)",
+                [("name", "city_mover"), ("format", "png"), ("type", "baselayer")],
+            )
+        self._bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM tiles").fetchone()[0]
+
+    def _read(self, z: int, x: int, y: int):
+        conn = self.pool.get_connection()
+        row = conn.execute(
+            "SELECT tile_data, last_used FROM tiles "
+            "WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, _tms_row(z, y)),
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] > TOUCH_INTERVAL:
+            with conn:
+                conn.execute(
+                    "UPDATE tiles SET last_used = ? "
+                    "WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                    (now, z, x, _tms_row(z, y)),
+                )
+        return row[0]
+
+    def contains(self, z: int, x: int, y: int):
+        row = self.pool.get_connection().execute(
+            "SELECT 1 FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, _tms_row(z, y)),
+        ).fetchone()
+        return row is not None
+
+    def put(self, z: int, x: int, y: int, data: bytes):
+        conn = self.pool.get_connection()
+        with self._lock:
+            with conn:
+                old = conn.execute(
+                    "SELECT size FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                    (z, x, _tms_row(z, y)),
+                ).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO tiles "
+                    "(zoom_level, tile_column, tile_row, tile_data, size, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (z, x, _tms_row(z, y), data, len(data), time.time()),
+                )
+                self._bytes += len(data) - (old[0] if old else 0)
+                if self._bytes > self.max_bytes:
+                    self._evict(conn)
+
+    def _evict(self, conn):
+        # حذف الأقدم استخداماً على دفعات حتى ينزل الحجم إلى EVICT_TO_RATIO من الحد
+        target = int(self.max_bytes * EVICT_TO_RATIO)
+        while self._bytes > target:
+            batch = conn.execute(
+                "SELECT rowid, size FROM tiles ORDER BY last_used LIMIT 64"
+            ).fetchall()
+            if not batch:
+                break
+            victims = []
+            for rowid, size in batch:
+                victims.append((rowid,))
+                self._bytes -= size
+                if self._bytes <= target:
+                    break
+            conn.executemany("DELETE FROM tiles WHERE rowid = ?", victims)
+            self.evictions += len(victims)
+
+    def get_tile(self, z: int, x: int, y: int):
+        """بيانات البلاطة من الملف، أو من المصدر عند عدم وجودها. None إذا فشل الجلب."""
+        data = self._read(z, x, y)
+        # get_tile تُستدعى من عدة خيوط (TileServer)؛ += ليست ذرية
+        with self._lock:
+            if data is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if data is not None:
+            return data
+
+        try:
+            data = fetch_upstream(self.upstream, z, x, y)
+        except OSError:
+            with self._lock:
+                self.errors += 1
+            return None
+        self.put(z, x, y, data)
+        return data
+
+    def prefetch(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                 zooms, max_tiles: int = MAX_PREFETCH_TILES, progress=None):
+        """تحميل كل بلاطات المستطيل مسبقاً (البلاطات الموجودة لا تُجلب مرة أخرى).
+
+        يتوقف عند max_tiles حتى لا يُرسل عدد كبير من الطلبات للمصدر.
+        يُرجع {"fetched", "cached", "failed", "skipped"}.
+        """
+        result = {"fetched": 0, "cached": 0, "failed": 0, "skipped": 0}
+        requested = 0
+        for z, x, y in tiles_in_bbox(min_lat, min_lon, max_lat, max_lon, zooms):
+            if self.contains(z, x, y):
+                result["cached"] += 1
+                continue
+            if requested >= max_tiles:
+                result["skipped"] += 1
+                continue
+            requested += 1
+            try:
+                data = fetch_upstream(self.upstream, z, x, y)
+            except OSError:
+                result["failed"] += 1
+                continue
+            self.put(z, x, y, data)
+            result["fetched"] += 1
+            if progress:
+                progress(result)
+        return result
+
+    def stats(self):
+        count = self.pool.get_connection().execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+        with self._lock:
+            hits, misses, errors, evictions, size = self.hits, self.misses, self.errors, self.evictions, self._bytes
+        requests = hits + misses
+        return {
+            "tiles_file": self.path,
+            "tiles": count,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / requests, 3) if requests else 0.0,
+            "upstream_errors": errors,
+            "evictions": evictions,
+        }
+
+
+_TILE_PATH = re.compile(r"^/(\d+)/(\d+)/(\d+)\.png$")
+
+
+class _TileRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        cache = self.server.cache
+        if self.path == "/stats":
+            self._send(200, "application/json", json.dumps(cache.stats()).encode())
+            return
+        match = _TILE_PATH.match(self.path)
+        if not match:
+            self._send(404, "text/plain", b"not found")
+            return
+        data = cache.get_tile(*(int(v) for v in match.groups()))
+        if data is None:
+            self._send(502, "text/plain", b"upstream unavailable")
+            return
+        self._send(200, "image/png", data)
+
+    def _send(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TileServer(HTTPServer):
+    """خادم HTTP محلي للبلاطات.
+
+    الطلبات تُعالج في عدد ثابت من الخيوط (بدلاً من خيط جديد لكل طلب) حتى يبقى
+    لكل خيط اتصاله بملف البلاطات من المجمع.
+    """
+
+    def __init__(self, cache: TileCache, host: str = "127.0.0.1", port: int = 0, workers: int = 4):
+        super().__init__((host, port), _TileRequestHandler)
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tiles")
+        self._thread = None
+
+    @property
+    def url_template(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/{{z}}/{{x}}/{{y}}.png"
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="tile-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.executor.shutdown(wait=True)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def local_tile_url(path: str, upstream: str = UPSTREAM_URL, max_bytes: int = DEFAULT_MAX_BYTES):
+    """رابط القالب لـ TileLayer: الخادم المحلي (يُشغل مرة واحدة)، أو المصدر مباشرة إذا تعذر تشغيله."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = TileServer(TileCache(path, upstream, max_bytes)).start()
+            except (OSError, sqlite3.Error) as e:
+                print(f"تعذر تشغيل خادم البلاطات المحلي: {e}")
+                return upstream
+        return _server.url_template
+
+
+def tile_server_stats():
+    return _server.cache.stats() if _server else None
+
+
+def _parse_zooms(text: str):
+    first, _, last = text.partition("-")
+    return range(int(first), int(last or first) + 1)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="tile_cache.py")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    prefetch = sub.add_parser("prefetch", help="تحميل بلاطات مدينة مسبقاً")
+    prefetch.add_argument("city", help="اسم المدينة كما في جدول cities")
+    prefetch.add_argument("--zooms", default="10-14", help="مثلاً 10-14")
+    prefetch.add_argument("--radius", type=float, default=10.0, help="نصف القطر بالكيلومتر")
+    prefetch.add_argument("--db", default="city_mover.db")
+    prefetch.add_argument("--tiles", default="map_tiles.mbtiles")
+    prefetch.add_argument("--max-tiles", type=int, default=MAX_PREFETCH_TILES)
+    prefetch.add_argument("--max-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024))
+    prefetch.add_argument("--upstream", default=UPSTREAM_URL)
+
+    stats = sub.add_parser("stats", help="حجم ملف البلاطات")
+    stats.add_argument("--tiles", default="map_tiles.mbtiles")
+
+    args = parser.parse_args(argv)
+    if args.command == "stats":
+        print(json.dumps(TileCache(args.tiles).stats(), ensure_ascii=False, indent=2))
+        return 0
+
+    city = get_pool(args.db).get_connection().execute(
+        "SELECT lat, lon FROM cities WHERE name = ?", (args.city,)
+    ).fetchone()
+    if city is None or city[0] is None:
+        print(f"المدينة غير موجودة أو بدون إحداثيات: {args.city}")
+        return 1
+
+    cache = TileCache(args.tiles, args.upstream, args.max_mb * 1024 * 1024)
+    bbox = geo.bbox_around(city[0], city[1], args.radius)
+    result = cache.prefetch(*bbox, _parse_zooms(args.zooms), max_tiles=args.max_tiles)
+    print(json.dumps({**result, **cache.stats()}, ensure_ascii=False, indent=2))
+    return 1 if result["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,146 @@
+"""قياس كلفة الواجهة: زمن بناء كل شاشة وعدد عناصرها، واستدعاءات page.update وحجم ما تُرسله.
+
+معطل افتراضياً. عند التشغيل بـ CITYMOVER_UI_METRICS=1 تُطبع سطور [ui] (تظهر في logcat
+على أندرويد) لكل بناء شاشة، وملخص الشاشة السابقة عند كل انتقال:
+
+    [ui] بناء user_view: 41.2ms، 386 عنصر
+    [ui] /user: 7 page.update في 52.3ms، 184.6KB — show_properties ×3، on_city_change ×2 ...
+
+page.update وconnection.send_commands تُستبدل على الكائنات نفسها عند التفعيل فقط.
+"""
+import json
+import sys
+import threading
+import time
+
+from flet.core.protocol import CommandEncoder
+
+
+def count_controls(control):
+    """عدد العناصر في شجرة control (هو نفسه وكل ما تحته)."""
+    count = 0
+    stack = [control]
+    while stack:
+        current = stack.pop()
+        if current is None:
+            continue
+        count += 1
+        stack.extend(current._get_children())
+    return count
+
+
+def _caller_name(depth: int):
+    # معالج الحدث الذي طلب التحديث، وليس __enter__/__exit__ في LoadingState مثلاً
+    frame = sys._getframe(depth)
+    while frame is not None and frame.f_code.co_name.startswith("__"):
+        frame = frame.f_back
+    return frame.f_code.co_name if frame is not None else "?"
+
+
+class UIMetrics:
+    def __init__(self, page, log=None):
+        self.page = page
+        self.log = log or (lambda line: print(line, file=sys.stderr))
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.builds = {}
+        self.reused = {}
+        self.screens = {}
+        self._screen = None
+
+    def install(self):
+        update = self.page.update
+
+        def timed_update(*controls):
+            caller = _caller_name(2)
+            self._local.payload = [0, 0]
+            start = time.perf_counter()
+            try:
+                return update(*controls)
+            finally:
+                self._record_update(caller, time.perf_counter() - start, *self._local.payload)
+
+        self.page.update = timed_update
+
+        conn = self.page.connection
+        if conn is not None:
+            send_commands = conn.send_commands
+            session_id = self.page.session_id
+
+            def measured_send(sid, commands):
+                payload = getattr(self._local, "payload", None)
+                if sid == session_id and payload is not None:
+                    payload[0] += len(commands)
+                    payload[1] += len(json.dumps(commands, cls=CommandEncoder, separators=(",", ":")))
+                return send_commands(sid, commands)
+
+            conn.send_commands = measured_send
+        return self
+
+    def build_view(self, view_func):
+        """بناء شاشة مع قياس زمن البناء وعدد عناصرها، وبدء عدّاد تحديثات جديد لها."""
+        self._finish_screen()
+        start = time.perf_counter()
+        view = view_func()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        controls = count_controls(view)
+        name = view_func.__name__
+        with self._lock:
+            entry = self.builds.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "controls": 0})
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            entry["controls"] = controls
+            self._screen = getattr(view, "route", None) or name
+        self.log(f"[ui] بناء {name}: {elapsed_ms:.1f}ms، {controls} عنصر")
+        return view
+
+    def reuse_view(self, view):
+        """عرض شاشة محفوظة من ViewCache بدون بنائها؛ التحديثات التالية تُحسب لها."""
+        self._finish_screen()
+        with self._lock:
+            self._screen = view.route
+            self.reused[view.route] = self.reused.get(view.route, 0) + 1
+        self.log(f"[ui] عرض {view.route} المحفوظة بدون بناء")
+        return view
+
+    def _record_update(self, caller, elapsed, commands, size):
+        with self._lock:
+            screen = self.screens.setdefault(self._screen or "?", {
+                "updates": 0, "total_ms": 0.0, "max_ms": 0.0, "commands": 0, "bytes": 0, "callers": {},
+            })
+            screen["updates"] += 1
+            screen["total_ms"] += elapsed * 1000
+            screen["max_ms"] = max(screen["max_ms"], elapsed * 1000)
+            screen["commands"] += commands
+            screen["bytes"] += size
+            screen["callers"][caller] = screen["callers"].get(caller, 0) + 1
+
+    def _finish_screen(self):
+        with self._lock:
+            screen = self.screens.get(self._screen)
+            if not screen:
+                return
+            callers = sorted(screen["callers"].items(), key=lambda item: -item[1])[:5]
+            line = (f"[ui] {self._screen}: {screen['updates']} page.update في {screen['total_ms']:.1f}ms، "
+                    f"{screen['bytes'] / 1024:.1f}KB — "
+                    + "، ".join(f"{name} ×{n}" for name, n in callers))
+        self.log(line)
+
+    def report(self):
+        """لكل شاشة: عدد البناءات وزمنها وعدد العناصر، وعدد التحديثات وزمنها وحجمها ومن طلبها."""
+        with self._lock:
+            return {
+                "builds": {
+                    name: {"count": b["count"], "avg_ms": round(b["total_ms"] / b["count"], 2),
+                           "max_ms": round(b["max_ms"], 2), "controls": b["controls"]}
+                    for name, b in self.builds.items()
+                },
+                "reused": dict(self.reused),
+                "screens": {
+                    name: {"updates": s["updates"], "avg_ms": round(s["total_ms"] / s["updates"], 2),
+                           "max_ms": round(s["max_ms"], 2), "commands": s["commands"],
+                           "bytes": s["bytes"], "callers": dict(s["callers"])}
+                    for name, s in self.screens.items()
+                },
+            }